@@ -0,0 +1,174 @@
+"""Columnar attendance log for MEMORY_DB mode.
+
+Attendance is append-only and by far the highest-volume data the in-memory
+backend holds, so instead of one dict per check-in (several hundred bytes
+of string UUIDs, ISO timestamps and repeated method/status strings) it is
+kept as parallel ``array`` columns:
+
+* record IDs as 16 raw UUID bytes
+* user and class IDs interned to int32 codes
+* method and status as int8 codes into small lookup tables
+* timestamps as int64 epoch microseconds (``NO_TIME`` when unset)
+* location as float32 lat/lng (NaN when unset)
+
+That is roughly 60 bytes per record including the per-user row index. Rows
+are turned back into plain dicts only for the page a caller asks for, just
+before the route builds its ``AttendanceRecord`` responses.
+"""
+import math
+import threading
+import uuid
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+NO_TIME = -(2 ** 63)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+METHODS = ["qr_code", "facial_recognition", "manual", "geolocation"]
+STATUSES = ["present", "absent", "late"]
+
+
+def to_micros(value) -> int:
+    """Epoch microseconds for a datetime or ISO string (None -> NO_TIME)"""
+    if value is None:
+        return NO_TIME
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def from_micros(value: int) -> Optional[datetime]:
+    if value == NO_TIME:
+        return None
+    return EPOCH + timedelta(microseconds=value)
+
+
+class _Interner:
+    """Two-way mapping between strings and dense int codes"""
+
+    def __init__(self, seed: Optional[List[str]] = None, limit: Optional[int] = None):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+        self.limit = limit
+        for value in seed or []:
+            self.code(value)
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            if self.limit is not None and len(self.values) >= self.limit:
+                raise ValueError(f"Too many distinct values, cannot add {value!r}")
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: str) -> Optional[int]:
+        return self.codes.get(value)
+
+
+class AttendanceColumns:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users = _Interner()
+        self._classes = _Interner()
+        # Free-form strings in the API, so cap them to what an int8 code holds
+        self._methods = _Interner(METHODS, limit=127)
+        self._statuses = _Interner(STATUSES, limit=127)
+
+        self._ids = bytearray()
+        self._user = array('i')
+        self._class = array('i')
+        self._method = array('b')
+        self._status = array('b')
+        self._created_at = array('q')
+        self._check_in = array('q')
+        self._check_out = array('q')
+        self._lat = array('f')
+        self._lng = array('f')
+        # user code -> row numbers, in insertion order
+        self._rows_by_user: Dict[int, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._user)
+
+    def append(self, record: dict) -> None:
+        """Store one attendance record dict (datetimes or ISO strings)"""
+        location = record.get("location") or {}
+        lat, lng = location.get("lat"), location.get("lng")
+        # Convert everything first: a bad field must not leave the columns uneven
+        record_id = uuid.UUID(record["id"]).bytes
+        times = [to_micros(record.get(field)) for field in ("created_at", "check_in_time", "check_out_time")]
+        lat = math.nan if lat is None else float(lat)
+        lng = math.nan if lng is None else float(lng)
+        with self._lock:
+            method = self._methods.code(record["method"])
+            status = self._statuses.code(record.get("status") or "present")
+            row = len(self._user)
+            user = self._users.code(record["user_id"])
+            self._ids += record_id
+            self._user.append(user)
+            self._class.append(self._classes.code(record["class_id"]))
+            self._method.append(method)
+            self._status.append(status)
+            self._created_at.append(times[0])
+            self._check_in.append(times[1])
+            self._check_out.append(times[2])
+            self._lat.append(lat)
+            self._lng.append(lng)
+            self._rows_by_user.setdefault(user, array('I')).append(row)
+
+    def count_for_user(self, user_id: str) -> int:
+        with self._lock:
+            user = self._users.lookup(user_id)
+            return 0 if user is None else len(self._rows_by_user[user])
+
+    def exists_between(self, user_id: str, class_id: str, start, end) -> bool:
+        """Whether the user checked in to the class with created_at in [start, end]"""
+        start_us, end_us = to_micros(start), to_micros(end)
+        with self._lock:
+            user = self._users.lookup(user_id)
+            klass = self._classes.lookup(class_id)
+            if user is None or klass is None:
+                return False
+            created_at, classes = self._created_at, self._class
+            # Most recent first: a same-day duplicate sits at the tail
+            for row in reversed(self._rows_by_user[user]):
+                if classes[row] == klass and start_us <= created_at[row] <= end_us:
+                    return True
+            return False
+
+    def records_for_user(self, user_id: str, skip: int = 0, limit: Optional[int] = None) -> List[dict]:
+        """Materialise one page of a user's records as dicts"""
+        with self._lock:
+            user = self._users.lookup(user_id)
+            if user is None:
+                return []
+            rows = self._rows_by_user[user]
+            end = None if limit is None else skip + limit
+            return [self._row(row) for row in rows[skip:end]]
+
+    def _row(self, row: int) -> dict:
+        lat, lng = self._lat[row], self._lng[row]
+        return {
+            "id": str(uuid.UUID(bytes=bytes(self._ids[row * 16:row * 16 + 16]))),
+            "user_id": self._users.values[self._user[row]],
+            "class_id": self._classes.values[self._class[row]],
+            "method": self._methods.values[self._method[row]],
+            "status": self._statuses.values[self._status[row]],
+            "created_at": from_micros(self._created_at[row]),
+            "check_in_time": from_micros(self._check_in[row]),
+            "check_out_time": from_micros(self._check_out[row]),
+            # float32 keeps ~7 significant digits; drop the float noise beyond that
+            "location": None if math.isnan(lat) else {"lat": round(lat, 5), "lng": round(lng, 5)},
+        }
+
+    def nbytes(self) -> int:
+        """Approximate size of the column data"""
+        with self._lock:
+            columns = (self._user, self._class, self._method, self._status, self._created_at,
+                       self._check_in, self._check_out, self._lat, self._lng)
+            index = sum(len(rows) * rows.itemsize for rows in self._rows_by_user.values())
+            return len(self._ids) + sum(len(c) * c.itemsize for c in columns) + index
@@ -0,0 +1,83 @@
+"""Offline attendance: signed check-ins queued on the device, replayed in batches.
+
+While online, a device fetches a per-user sync key. That key is an HMAC of
+the user id under the server secret, so the server never has to store it.
+Each check-in made offline is signed with the key over ``canonical(item)``
+and queued locally with a client-generated idempotency key. When the device
+reconnects, it posts the whole queue in one request.
+
+The sync key is served to the user it belongs to, so an item's signature
+only shows the queue was not altered in transit. What shows the student was
+in class is the class session: the payload of the course QR code, which only
+the instructor can generate and which the server signs with its issue time
+(``session_signature``). A check-in is accepted only with a session for the
+same class and a check-in time inside that session's window.
+
+Replays are safe. An idempotency key already stored for the user resolves
+to the record it created, and a check-in for a class that already has one
+that day is reported rather than stored twice.
+"""
+import hashlib
+import hmac
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Optional, Tuple
+
+
+def sync_key(secret: str, user_id: str) -> str:
+    return hmac.new(secret.encode(), f"attendance-sync:{user_id}".encode(), hashlib.sha256).hexdigest()
+
+
+def session_signature(secret: str, course_id: str, issued_at: int) -> str:
+    """Server signature of a class session; issued_at is epoch milliseconds"""
+    message = f"attendance-session:{course_id}:{issued_at}".encode()
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def js_number(value: float) -> str:
+    """String(value) as the browser writes it when signing a coordinate"""
+    if value.is_integer() and abs(value) < 1e21:
+        return str(int(value))
+    text = repr(value)
+    if "e" not in text:
+        return text
+    mantissa, exponent = text.split("e")
+    if -7 < int(exponent) < 21:
+        # JS only switches to exponent notation outside [1e-7, 1e21)
+        return format(Decimal(text), "f")
+    return f"{mantissa}e{int(exponent):+d}"
+
+
+def canonical(idempotency_key: str, class_id: str, method: str, checked_in_at: datetime, location: Optional[dict]) -> bytes:
+    """Signed form of a check-in; the time is epoch milliseconds (JS Date.getTime())"""
+    location = location or {}
+    parts = [
+        idempotency_key,
+        class_id,
+        method,
+        str(round(checked_in_at.timestamp() * 1000)),
+        "" if location.get("lat") is None else js_number(float(location["lat"])),
+        "" if location.get("lng") is None else js_number(float(location["lng"])),
+    ]
+    return "\n".join(parts).encode()
+
+
+def verify(key: str, message: bytes, signature: str) -> bool:
+    expected = hmac.new(key.encode(), message, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, (signature or "").lower())
+
+
+def verify_session(secret: str, course_id: str, issued_at: int, signature: str) -> bool:
+    return hmac.compare_digest(session_signature(secret, course_id, issued_at), (signature or "").lower())
+
+
+def as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def day_bounds(value: datetime) -> Tuple[datetime, datetime]:
+    """UTC day containing value, as the same-day rule in record_attendance sees it"""
+    day = as_utc(value).date()
+    start = datetime.combine(day, datetime.min.time()).replace(tzinfo=timezone.utc)
+    end = datetime.combine(day, datetime.max.time()).replace(tzinfo=timezone.utc)
+    return start, end
@@ -0,0 +1,177 @@
+"""Chat history: recent turns per session in memory, batched persistence.
+
+``SessionBuffers`` keeps the last ``max_turns`` turns of each chat session
+in a bounded deque, and keeps the number of sessions bounded too (least
+recently used go first). Prompt context for the next turn is read from it
+without a database round-trip. A session this worker has not seen yet is
+loaded from storage once.
+
+``BatchWriter`` takes turns off the request path. ``submit`` only enqueues.
+A background task writes whatever has queued up as one ``insert_many``,
+after ``max_batch`` documents or ``interval`` seconds, whichever comes
+first. The queue is bounded: when storage falls behind, the newest turns
+are dropped and counted rather than held in memory without limit. ``stop``
+signals the task instead of cancelling it, so it never interrupts a write;
+the task finishes its batch and exits, and anything left is written before
+``stop`` returns.
+"""
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SessionBuffers:
+    """Ring buffer of recent turns per session, LRU-bounded in sessions"""
+
+    def __init__(self, max_turns: int = 10, max_sessions: int = 10000):
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        # session id -> (user id, recent turns, oldest first)
+        self._sessions: "OrderedDict[str, Tuple[str, Deque[dict]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str, user_id: str) -> Optional[List[dict]]:
+        """Recent turns, or None if this worker has not loaded the session"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[0] != user_id:
+                return None
+            self._sessions.move_to_end(session_id)
+            return list(entry[1])
+
+    def load(self, session_id: str, user_id: str, turns: List[dict]) -> None:
+        """Seed a session from storage (turns oldest first) unless already present"""
+        with self._lock:
+            if session_id not in self._sessions:
+                self._put(session_id, user_id, deque(turns[-self.max_turns:], maxlen=self.max_turns))
+
+    def append(self, session_id: str, user_id: str, turn: dict) -> None:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[0] != user_id:
+                entry = (user_id, deque(maxlen=self.max_turns))
+                self._put(session_id, user_id, entry[1])
+            else:
+                self._sessions.move_to_end(session_id)
+            entry[1].append(turn)
+
+    def for_user(self, user_id: str, limit: int) -> List[dict]:
+        """Buffered turns of every session of a user, newest first"""
+        with self._lock:
+            turns = [turn for owner, buffer in self._sessions.values() if owner == user_id for turn in buffer]
+        turns.sort(key=lambda turn: turn["timestamp"], reverse=True)
+        return turns[:limit]
+
+    def _put(self, session_id: str, user_id: str, buffer: Deque[dict]) -> None:
+        self._sessions[session_id] = (user_id, buffer)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+
+class BatchWriter:
+    """Background task persisting submitted documents in batches"""
+
+    def __init__(
+        self,
+        flush: Callable[[List[dict]], Awaitable[None]],
+        max_batch: int = 100,
+        interval: float = 1.0,
+        max_pending: int = 10000,
+        on_drop: Optional[Callable[[int], None]] = None,
+    ):
+        self._flush = flush
+        self.max_batch = max_batch
+        self.interval = interval
+        self._on_drop = on_drop
+        self._queue: Optional[asyncio.Queue] = None
+        self._max_pending = max_pending
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        # Documents taken off the queue but not yet handed to flush
+        self._batch: List[dict] = []
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self._max_pending)
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, doc: dict) -> bool:
+        """Queue a document; False (and counted) if the queue is full or stopped"""
+        if self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait(doc)
+        except asyncio.QueueFull:
+            if self._on_drop:
+                self._on_drop(1)
+            return False
+        return True
+
+    async def stop(self) -> None:
+        """Write whatever is still queued, then end the task"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+        batch, self._batch = self._drain(self._batch), []
+        while batch:
+            await self._write(batch)
+            batch = self._drain([])
+        self._queue = None
+
+    def _drain(self, batch: List[dict]) -> List[dict]:
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def _next(self, timeout: Optional[float]) -> Optional[dict]:
+        """Next queued document; None on timeout, or once stopping and the queue is empty"""
+        if not self._queue.empty():
+            return self._queue.get_nowait()
+        getter = asyncio.ensure_future(self._queue.get())
+        stopper = asyncio.ensure_future(self._stopping.wait())
+        await asyncio.wait({getter, stopper}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        stopper.cancel()
+        # Queue.get only removes an item once it returns, so cancelling it loses nothing
+        if not getter.done():
+            getter.cancel()
+            return None
+        return getter.result()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            doc = await self._next(None)
+            if doc is None:
+                return
+            self._batch.append(doc)
+            deadline = loop.time() + self.interval
+            while len(self._drain(self._batch)) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                doc = await self._next(remaining)
+                if doc is None:
+                    break
+                self._batch.append(doc)
+            batch, self._batch = self._batch, []
+            await self._write(batch)
+
+    async def _write(self, batch: List[dict]) -> None:
+        try:
+            await self._flush(batch)
+        except Exception as e:
+            logger.warning("Dropped %d chat turns, write failed: %s", len(batch), e)
+            if self._on_drop:
+                self._on_drop(len(batch))
@@ -0,0 +1,107 @@
+"""Face-recognition attendance: embedding extraction and roster matching.
+
+Extraction (detect the face, compute a 128-d embedding) is CPU-bound, so
+it runs in a process pool via ``extract_embedding``, which is a module-level
+function and therefore picklable. The model comes from the optional
+``face_recognition`` package (dlib, see requirements-face.txt); without it
+``engine_available()`` is False and the API answers 503 instead of failing
+inside a worker.
+
+Matching is plain NumPy. ``FaceIndex`` keeps one L2-normalised float32
+matrix per course, holding the templates of that course's enrolled
+students. A check-in is a single matrix-vector product over the roster, not
+over every enrolled face on campus, which stays well under a millisecond for
+thousands of students. Rosters are rebuilt from storage when they change
+locally or after ``ttl`` seconds, which covers changes made by other workers.
+"""
+import io
+import threading
+import time
+from importlib.util import find_spec
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EMBEDDING_DIM = 128
+# Detection cost grows with pixel count; faces stay recognisable at this size
+MAX_SIDE = 640
+
+
+class NoFaceFound(ValueError):
+    pass
+
+
+def engine_available() -> bool:
+    return find_spec("face_recognition") is not None
+
+
+def extract_embedding(image_bytes: bytes) -> List[float]:
+    """Embedding of the largest face in an image (runs in a worker process)"""
+    import face_recognition  # heavy (dlib); only ever loaded in pool workers
+    from PIL import Image, ImageOps
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    except Exception as e:
+        raise ValueError(f"Unreadable image: {e}")
+    image.thumbnail((MAX_SIDE, MAX_SIDE))
+    pixels = np.asarray(image)
+
+    locations = face_recognition.face_locations(pixels, model="hog")
+    if not locations:
+        raise NoFaceFound("No face found in the image")
+    # (top, right, bottom, left): keep the face closest to the camera
+    largest = max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+    encoding = face_recognition.face_encodings(pixels, [largest])[0]
+    return encoding.astype(np.float32).tolist()
+
+
+def normalise(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class FaceIndex:
+    """Per-course matrices of enrolled students' face templates"""
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # course id -> (built at, user ids, normalised templates)
+        self._rosters: Dict[str, Tuple[float, np.ndarray, np.ndarray]] = {}
+
+    def get(self, course_id: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        entry = self._rosters.get(course_id)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[1], entry[2]
+
+    def put(self, course_id: str, templates: Sequence[Tuple[str, Sequence[float]]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Cache a course's (user id, embedding) pairs as one matrix"""
+        user_ids = np.array([user_id for user_id, _ in templates], dtype=object)
+        if templates:
+            matrix = normalise([embedding for _, embedding in templates])
+        else:
+            matrix = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        with self._lock:
+            self._rosters[course_id] = (time.monotonic(), user_ids, matrix)
+        return user_ids, matrix
+
+    def invalidate(self, course_id: Optional[str] = None) -> None:
+        """Forget one course's roster, or all of them (a template changed)"""
+        with self._lock:
+            if course_id is None:
+                self._rosters.clear()
+            else:
+                self._rosters.pop(course_id, None)
+
+    @staticmethod
+    def best_match(user_ids: np.ndarray, matrix: np.ndarray, embedding: Sequence[float]) -> Tuple[Optional[str], float]:
+        """(user id, cosine similarity) of the closest template"""
+        if not len(user_ids):
+            return None, 0.0
+        scores = matrix @ normalise(embedding)
+        best = int(np.argmax(scores))
+        return user_ids[best], float(scores[best])
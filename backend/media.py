@@ -0,0 +1,163 @@
+"""Uploaded images: streamed to disk, resized in a worker pool, served by hash.
+
+An upload is copied to disk in fixed-size chunks while it is hashed, so a
+large photo never sits in memory whole. The SHA-256 of the original is the
+media ID: identical uploads share one directory, and every URL under it is
+immutable, so responses can be cached for a year.
+
+    <MEDIA_ROOT>/<id[:2]>/<id>/original
+                              /meta.json
+                              /thumb.webp, thumb.jpg, display.webp
+
+``render_variants`` does the Pillow work and runs in a process pool. The
+variants are re-encoded without EXIF data, so camera GPS tags from the
+original are never published; the original itself is not served.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from typing import Dict, Optional, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+MEDIA_ID = re.compile(r"^[0-9a-f]{64}$")
+# Pillow warns above this and refuses images over twice it (decompression bombs)
+MAX_PIXELS = 20_000_000
+
+# name -> (longest side, Pillow format, content type)
+VARIANTS: Dict[str, Tuple[int, str, str]] = {
+    "thumb.webp": (320, "WEBP", "image/webp"),
+    "thumb.jpg": (320, "JPEG", "image/jpeg"),
+    "display.webp": (1280, "WEBP", "image/webp"),
+}
+THUMBNAIL = "thumb.webp"
+DISPLAY = "display.webp"
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def media_dir(root: str, media_id: str) -> str:
+    return os.path.join(root, media_id[:2], media_id)
+
+
+def media_url(media_id: str, variant: str = THUMBNAIL) -> str:
+    return f"/api/media/{media_id}/{variant}"
+
+
+async def save_upload(upload, root: str, max_bytes: int) -> Tuple[str, str]:
+    """Stream an UploadFile to <root>/tmp; returns (temp path, sha256 hex)"""
+    tmp_dir = os.path.join(root, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=tmp_dir)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"{upload.filename or 'Upload'} is larger than {max_bytes} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def store_original(root: str, tmp_path: str, media_id: str) -> bool:
+    """Move a saved upload into place; False if that content already exists"""
+    directory = media_dir(root, media_id)
+    if os.path.exists(os.path.join(directory, "meta.json")):
+        os.unlink(tmp_path)
+        return False
+    os.makedirs(directory, exist_ok=True)
+    os.replace(tmp_path, os.path.join(directory, "original"))
+    return True
+
+
+def render_variants(root: str, media_id: str) -> dict:
+    """Write every variant of a stored original plus meta.json (runs in a worker)"""
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    directory = media_dir(root, media_id)
+    try:
+        with Image.open(os.path.join(directory, "original")) as source:
+            source_format = source.format
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise ValueError("Not a supported image")
+
+    meta = {"id": media_id, "format": source_format, "width": image.width, "height": image.height, "variants": {}}
+    for name, (side, image_format, content_type) in VARIANTS.items():
+        variant = image.copy()
+        variant.thumbnail((side, side))
+        if image_format == "JPEG":
+            variant = variant.convert("RGB")
+        elif variant.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in variant.mode or "transparency" in variant.info
+            variant = variant.convert("RGBA" if has_alpha else "RGB")
+        target = os.path.join(directory, name)
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "wb") as out:
+            variant.save(out, image_format, quality=82)
+        os.replace(tmp, target)
+        meta["variants"][name] = {
+            "width": variant.width,
+            "height": variant.height,
+            "bytes": os.path.getsize(target),
+            "content_type": content_type,
+        }
+
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, "w") as out:
+        json.dump(meta, out)
+    os.replace(tmp, os.path.join(directory, "meta.json"))
+    return meta
+
+
+def load_meta(root: str, media_id: str) -> Optional[dict]:
+    if not MEDIA_ID.match(media_id or ""):
+        return None
+    try:
+        with open(os.path.join(media_dir(root, media_id), "meta.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def parse_range(header: str, size: int) -> Tuple[int, int]:
+    """Inclusive (start, end) of a single "bytes=" range; ValueError if unsatisfiable"""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError("Only single byte ranges are supported")
+    start_text, _, end_text = spec.strip().partition("-")
+    if size <= 0:
+        raise ValueError("Range not satisfiable")
+    if not start_text:
+        # "bytes=-N": the last N bytes
+        length = int(end_text)
+        if length <= 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(start_text)
+    end = min(int(end_text), size - 1) if end_text else size - 1
+    if start > end or start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def read_range(path: str, start: int, end: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start + 1)
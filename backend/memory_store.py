@@ -0,0 +1,350 @@
+"""Document store behind MEMORY_DB mode.
+
+A ``MemoryStore`` keeps plain dict documents per collection with hash
+indexes on the fields the routes look up by. On its own it lives inside the
+API process, which is fine for a single worker. With ``MEMORY_STORE_ADDRESS``
+set, one store process owns the data and every uvicorn worker talks to it
+over a local socket through a ``multiprocessing`` manager proxy, so all
+workers see the same users, courses and attendance. Attendance itself is
+kept in the columnar ``AttendanceColumns`` log rather than as documents.
+
+Run the store explicitly with ``python memory_store.py``; otherwise the first
+worker that cannot reach it starts one in the background.
+
+This is a development mode, and it trades throughput for simplicity. Proxy
+calls are synchronous socket round trips that the API makes directly on the
+event loop, so each one stalls that worker's loop for the IPC time, and the
+store's lock serialises the calls of every worker. Only the stored data is
+shared: realtime events stay per worker unless ``REALTIME_BROKER`` names a
+shared ``realtime.Broker``, and other caches always do.
+Use MongoDB where that matters.
+
+The manager speaks pickle, so whoever holds its authkey can run code in the
+store process. Set ``MEMORY_STORE_AUTHKEY`` explicitly; without it, a random
+key is generated once into a 0600 file (``MEMORY_STORE_AUTHKEY_FILE``) that
+the workers and the store process of this host share, and only loopback or
+Unix socket addresses are accepted.
+"""
+import ipaddress
+import logging
+import os
+import secrets
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from multiprocessing.managers import BaseManager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from attendance_store import AttendanceColumns
+from ratelimit import TokenBuckets
+
+logger = logging.getLogger(__name__)
+
+# collection -> fields with a hash index; lookups on other fields scan
+INDEXED_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "users": ("id", "email"),
+    "courses": ("id",),
+    "course_enrollments": ("entity_id", "user_id"),
+    "event_registrations": ("entity_id", "user_id"),
+    "study_group_members": ("entity_id", "user_id"),
+    "revoked_tokens": ("jti",),
+    "face_templates": ("user_id",),
+    "attendance_sync_keys": ("key",),
+    "media_uploads": ("user_id",),
+}
+
+
+def _matches(doc: dict, query: Optional[dict]) -> bool:
+    return not query or all(doc.get(k) == v for k, v in query.items())
+
+
+class MemoryStore:
+    """Equality-query document store; every method is atomic.
+
+    Documents handed out are copies, so callers behave the same whether the
+    store is local or proxied from another process.
+    """
+
+    def __init__(self, indexed_fields: Optional[Dict[str, Tuple[str, ...]]] = None):
+        self._lock = threading.RLock()
+        self._indexed = indexed_fields if indexed_fields is not None else INDEXED_FIELDS
+        self._docs: Dict[str, List[dict]] = defaultdict(list)
+        # collection -> field -> value -> docs
+        self._indexes: Dict[str, Dict[str, Dict[Any, List[dict]]]] = defaultdict(
+            lambda: defaultdict(lambda: defaultdict(list))
+        )
+
+    def _candidates(self, collection: str, query: Optional[dict]) -> Iterable[dict]:
+        for field in self._indexed.get(collection, ()):
+            if query and field in query:
+                return self._indexes[collection][field].get(query[field], ())
+        return self._docs[collection]
+
+    def _find(self, collection: str, query: Optional[dict]) -> List[dict]:
+        return [d for d in self._candidates(collection, query) if _matches(d, query)]
+
+    def _insert(self, collection: str, doc: dict) -> None:
+        doc = dict(doc)
+        self._docs[collection].append(doc)
+        for field in self._indexed.get(collection, ()):
+            self._indexes[collection][field][doc.get(field)].append(doc)
+
+    def insert_one(self, collection: str, doc: dict, unique: Tuple[str, ...] = ()) -> bool:
+        """Insert doc; with unique fields, refuse (return False) on a duplicate"""
+        with self._lock:
+            if unique and self._find(collection, {f: doc.get(f) for f in unique}):
+                return False
+            self._insert(collection, doc)
+            return True
+
+    def seed(self, collection: str, docs: List[dict]) -> bool:
+        """Insert docs only if the collection is empty (first worker wins)"""
+        with self._lock:
+            if self._docs[collection]:
+                return False
+            for doc in docs:
+                self._insert(collection, doc)
+            return True
+
+    def find_one(self, collection: str, query: dict) -> Optional[dict]:
+        with self._lock:
+            found = next((d for d in self._candidates(collection, query) if _matches(d, query)), None)
+            return dict(found) if found is not None else None
+
+    def find(self, collection: str, query: Optional[dict] = None, skip: int = 0, limit: Optional[int] = None) -> List[dict]:
+        """Matching docs in insertion order"""
+        with self._lock:
+            docs = self._find(collection, query)
+            end = None if limit is None else skip + limit
+            return [dict(d) for d in docs[skip:end]]
+
+    def count(self, collection: str, query: Optional[dict] = None) -> int:
+        with self._lock:
+            if not query:
+                return len(self._docs[collection])
+            return len(self._find(collection, query))
+
+    def distinct(self, collection: str, field: str, query: Optional[dict] = None) -> List[Any]:
+        with self._lock:
+            return list(dict.fromkeys(d.get(field) for d in self._find(collection, query)))
+
+    def increment(self, collection: str, query: dict, field: str, amount: int = 1, below: Optional[int] = None) -> Optional[int]:
+        """Add amount to field of the first match; None if missing or already at `below`"""
+        with self._lock:
+            doc = next((d for d in self._candidates(collection, query) if _matches(d, query)), None)
+            if doc is None or (below is not None and doc.get(field, 0) >= below):
+                return None
+            doc[field] = doc.get(field, 0) + amount
+            return doc[field]
+
+    def update_one(self, collection: str, query: dict, fields: dict) -> bool:
+        """Set fields on the first match, keeping the indexes in step"""
+        with self._lock:
+            doc = next((d for d in self._candidates(collection, query) if _matches(d, query)), None)
+            if doc is None:
+                return False
+            for field in self._indexed.get(collection, ()):
+                if field in fields and fields[field] != doc.get(field):
+                    bucket = self._indexes[collection][field][doc.get(field)]
+                    bucket[:] = [d for d in bucket if d is not doc]
+                    self._indexes[collection][field][fields[field]].append(doc)
+            doc.update(fields)
+            return True
+
+    def delete_one(self, collection: str, query: dict) -> bool:
+        with self._lock:
+            doc = next((d for d in self._candidates(collection, query) if _matches(d, query)), None)
+            if doc is None:
+                return False
+            self._docs[collection] = [d for d in self._docs[collection] if d is not doc]
+            for field in self._indexed.get(collection, ()):
+                bucket = self._indexes[collection][field][doc.get(field)]
+                bucket[:] = [d for d in bucket if d is not doc]
+            return True
+
+    def find_since(self, collection: str, field: str, since: float) -> List[dict]:
+        """Docs with `field` >= since, oldest first.
+
+        Scans back from the newest insert and stops at the first older doc,
+        so it only suits fields that grow with insertion order, like write
+        timestamps; callers overlap `since` to allow for small skew.
+        """
+        with self._lock:
+            found = []
+            for doc in reversed(self._docs[collection]):
+                if doc.get(field, since) < since:
+                    break
+                found.append(dict(doc))
+            return found[::-1]
+
+    def delete_expired(self, collection: str, field: str, now: float) -> int:
+        """Drop docs whose `field` (epoch seconds) is at or before now, like a Mongo TTL index"""
+        with self._lock:
+            docs = self._docs[collection]
+            kept = [d for d in docs if not (d.get(field) is not None and d[field] <= now)]
+            if len(kept) == len(docs):
+                return 0
+            self._docs[collection] = kept
+            for field_name in self._indexed.get(collection, ()):
+                index = self._indexes[collection][field_name] = defaultdict(list)
+                for doc in kept:
+                    index[doc.get(field_name)].append(doc)
+            return len(docs) - len(kept)
+
+
+class _StoreManager(BaseManager):
+    pass
+
+
+_shared_store: Optional[MemoryStore] = None
+_shared_attendance: Optional[AttendanceColumns] = None
+_shared_rate_limits: Optional[TokenBuckets] = None
+
+
+def _get_shared_store() -> MemoryStore:
+    global _shared_store
+    if _shared_store is None:
+        _shared_store = MemoryStore()
+    return _shared_store
+
+
+def _get_shared_attendance() -> AttendanceColumns:
+    global _shared_attendance
+    if _shared_attendance is None:
+        _shared_attendance = AttendanceColumns()
+    return _shared_attendance
+
+
+def _get_shared_rate_limits() -> TokenBuckets:
+    global _shared_rate_limits
+    if _shared_rate_limits is None:
+        _shared_rate_limits = TokenBuckets()
+    return _shared_rate_limits
+
+
+_StoreManager.register("get_store", callable=_get_shared_store)
+_StoreManager.register("get_attendance", callable=_get_shared_attendance)
+_StoreManager.register("get_rate_limits", callable=_get_shared_rate_limits)
+
+
+def parse_address(address: str):
+    """"host:port" for TCP, anything else is a Unix socket path"""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def is_local(address: str) -> bool:
+    """Whether only this host can reach address (a Unix socket or loopback TCP)"""
+    parsed = parse_address(address)
+    if isinstance(parsed, str):
+        return True
+    host = parsed[0]
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _authkey_file(address: str) -> str:
+    path = os.environ.get("MEMORY_STORE_AUTHKEY_FILE")
+    if path:
+        return path
+    name = "".join(c if c.isalnum() else "-" for c in address)
+    return os.path.join(tempfile.gettempdir(), f"campus-memory-store-{name}.key")
+
+
+def _read_authkey_file(path: str) -> bytes:
+    info = os.stat(path)
+    if info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+        raise RuntimeError(f"Memory store key file {path} must be owned by this user with mode 0600")
+    with open(path, "rb") as f:
+        key = f.read().strip()
+    if not key:
+        raise RuntimeError(f"Memory store key file {path} is empty")
+    return key
+
+
+def _authkey(address: str) -> bytes:
+    key = os.environ.get("MEMORY_STORE_AUTHKEY")
+    if key:
+        return key.encode()
+    if not is_local(address):
+        raise RuntimeError(f"Set MEMORY_STORE_AUTHKEY to use the memory store at {address}")
+    path = _authkey_file(address)
+    if not os.path.exists(path):
+        # Written aside and linked into place, so a racing process either
+        # creates the file or reads the complete one the winner made
+        fd, pending = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+            os.link(pending, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(pending)
+    return _read_authkey_file(path)
+
+
+def serve(address: str) -> None:
+    """Run the store process in the foreground"""
+    manager = _StoreManager(address=parse_address(address), authkey=_authkey(address))
+    server = manager.get_server()
+    logger.info("Memory store listening on %s", address)
+    server.serve_forever()
+
+
+def _connect_manager(address: str, start_timeout: float) -> _StoreManager:
+    """Connect to the store process at address, spawning it if nobody listens"""
+    authkey = _authkey(address)
+    deadline = time.monotonic() + start_timeout
+    spawned = False
+    while True:
+        manager = _StoreManager(address=parse_address(address), authkey=authkey)
+        try:
+            manager.connect()
+            return manager
+        except (ConnectionRefusedError, FileNotFoundError):
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Memory store at {address} did not come up")
+            if not spawned:
+                # A racing worker may spawn one too; the loser fails to bind and exits
+                subprocess.Popen(
+                    [sys.executable, os.path.abspath(__file__), address],
+                    start_new_session=True,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL
+                )
+                spawned = True
+            time.sleep(0.05)
+
+
+def connect(address: Optional[str] = None, start_timeout: float = 5.0):
+    """Return the (document store, attendance log) pair for this process.
+
+    Without an address these are private in-process objects. With one, they
+    are proxies to the shared store process, which is spawned if nobody is
+    listening yet.
+    """
+    if not address:
+        return MemoryStore(), AttendanceColumns()
+    manager = _connect_manager(address, start_timeout)
+    return manager.get_store(), manager.get_attendance()
+
+
+def connect_rate_limits(address: str, start_timeout: float = 5.0) -> TokenBuckets:
+    """Token buckets held by the store process, shared by every worker"""
+    return _connect_manager(address, start_timeout).get_rate_limits()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    serve(sys.argv[1] if len(sys.argv) > 1 else os.environ.get("MEMORY_STORE_ADDRESS", "127.0.0.1:50055"))
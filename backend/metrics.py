@@ -0,0 +1,334 @@
+"""Prometheus-format metrics for the API.
+
+Covers per-route latency/count/in-flight, per-collection storage timings
+(Motor via a pymongo command listener, MEMORY_DB via a wrapping proxy),
+event-loop lag and an optional sampling profiler. Everything is rendered by
+``render()`` for the ``/metrics`` endpoint; there is no client library
+dependency.
+"""
+import asyncio
+import cProfile
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def header(self) -> str:
+        return f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> str:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + "".join(
+            f"{self.name}{_format_labels(self.labels, k)} {v}\n" for k, v in items
+        )
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+    def dec(self, *label_values: str, amount: float = 1.0) -> None:
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> str:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = [self.header()]
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}\n")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}\n")
+            lines.append(f"{self.name}_count{labels} {cumulative}\n")
+        return "".join(lines)
+
+
+REGISTRY: list = []
+
+http_requests = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+db_latency = Histogram("db_operation_duration_seconds", "Storage call latency", ("backend", "collection", "operation"), DB_BUCKETS)
+db_errors = Counter("db_operation_errors_total", "Failed storage calls", ("backend", "collection", "operation"))
+loop_lag = Histogram("event_loop_lag_seconds", "Extra delay of a scheduled event-loop wake-up")
+loop_lag_last = Gauge("event_loop_lag_last_seconds", "Most recent event-loop lag sample")
+pool_wait = Histogram("mongo_pool_wait_seconds", "Time spent waiting to check a connection out of the pool", buckets=DB_BUCKETS)
+pool_checkout_failures = Counter("mongo_pool_checkout_failures_total", "Failed pool checkouts", ("reason",))
+pool_connections = Gauge("mongo_pool_connections", "Pooled connections", ("state",))
+mongo_up = Gauge("mongo_up", "1 if the last MongoDB health check succeeded")
+admission_rejections = Counter("admission_rejections_total", "Requests refused by rate limits or load shedding", ("scope", "reason"))
+chat_turns_dropped = Counter("chat_turns_dropped_total", "Chat turns not persisted (writer queue full or write failed)")
+startup_seconds = Gauge("process_startup_seconds", "Time spent importing the app and running startup hooks", ("phase",))
+
+
+def render() -> str:
+    return "".join(metric.render() for metric in REGISTRY)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route HTTP metrics.
+
+    Routes are labelled by their path template (``/api/courses/{course_id}``)
+    so label cardinality stays bounded. With ``profile_sample_rate`` > 0 a
+    random share of requests runs under cProfile and is handed to
+    ``profile_hook(route, profile)``.
+    """
+
+    def __init__(self, app, profile_sample_rate: float = 0.0,
+                 profile_hook: Optional[Callable[[str, cProfile.Profile], None]] = None):
+        self.app = app
+        self.profile_sample_rate = profile_sample_rate
+        self.profile_hook = profile_hook
+        self._profiling = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        profile = None
+        if self.profile_sample_rate and random.random() < self.profile_sample_rate and not self._profiling:
+            # cProfile is process-global, so at most one sampled request at a time
+            self._profiling = True
+            profile = cProfile.Profile()
+            profile.enable()
+        http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec()
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            http_latency.observe(elapsed, scope["method"], route_label)
+            http_requests.inc(scope["method"], route_label, str(status_code))
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+                if self.profile_hook is not None:
+                    self.profile_hook(route_label, profile)
+
+
+def dump_profile_to(directory: str) -> Callable[[str, cProfile.Profile], None]:
+    """profile_hook writing one .prof file per sampled request"""
+    os.makedirs(directory, exist_ok=True)
+
+    def hook(route: str, profile: cProfile.Profile) -> None:
+        name = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+        profile.dump_stats(os.path.join(directory, f"{name}-{time.time_ns()}.prof"))
+
+    return hook
+
+
+class CommandTimings:
+    """Command listener callbacks feeding db_latency from Motor's driver events"""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[int, object], str] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event) -> None:
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = (
+                collection if isinstance(collection, str) else "-"
+            )
+
+    def _finish(self, event, failed: bool) -> None:
+        with self._lock:
+            collection = self._pending.pop((event.request_id, event.connection_id), "-")
+        db_latency.observe(event.duration_micros / 1_000_000, "mongo", collection, event.command_name)
+        if failed:
+            db_errors.inc("mongo", collection, event.command_name)
+
+    def succeeded(self, event) -> None:
+        self._finish(event, failed=False)
+
+    def failed(self, event) -> None:
+        self._finish(event, failed=True)
+
+
+def command_listener():
+    """CommandTimings registered as a pymongo CommandListener.
+
+    pymongo only accepts subclasses of its listener base, but importing it
+    here at module level would pull the driver into every cold start.
+    """
+    from pymongo.monitoring import CommandListener
+    return type("CommandTimer", (CommandTimings, CommandListener), {})()
+
+
+class PoolTimings:
+    """Connection pool listener callbacks feeding the mongo_pool_* metrics.
+
+    pymongo checks a connection out on the executor thread that runs the
+    operation, so the wait is measured with a thread-local start time.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event) -> None:
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event) -> None:
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            pool_wait.observe(time.perf_counter() - started)
+            self._local.started = None
+        pool_connections.inc("in_use")
+
+    def connection_check_out_failed(self, event) -> None:
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            pool_wait.observe(time.perf_counter() - started)
+            self._local.started = None
+        pool_checkout_failures.inc(str(event.reason))
+
+    def connection_checked_in(self, event) -> None:
+        pool_connections.dec("in_use")
+
+    def connection_created(self, event) -> None:
+        pool_connections.inc("open")
+
+    def connection_closed(self, event) -> None:
+        pool_connections.dec("open")
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+
+def pool_listener():
+    """PoolTimings registered as a pymongo ConnectionPoolListener"""
+    from pymongo.monitoring import ConnectionPoolListener
+    return type("PoolTimer", (PoolTimings, ConnectionPoolListener), {})()
+
+
+class TimedStore:
+    """Proxy timing every method call on a MEMORY_DB store.
+
+    The collection label is the first string argument (MemoryStore style) or
+    the fixed ``collection`` given here (single-collection stores).
+    """
+
+    def __init__(self, store, collection: Optional[str] = None):
+        self._store = store
+        self._collection = collection
+
+    def __getattr__(self, name):
+        method = getattr(self._store, name)
+        if not callable(method):
+            return method
+
+        def timed(*args, **kwargs):
+            collection = self._collection or (args[0] if args and isinstance(args[0], str) else "-")
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            except Exception:
+                db_errors.inc("memory", collection, name)
+                raise
+            finally:
+                db_latency.observe(time.perf_counter() - started, "memory", collection, name)
+
+        return timed
+
+
+async def probe_event_loop_lag(interval: float = 0.5) -> None:
+    """Sleep `interval` forever and record how late each wake-up is.
+
+    Blocking work on the loop (e.g. bcrypt in a handler) shows up here at once.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - started - interval, 0.0)
+        loop_lag.observe(lag)
+        loop_lag_last.set(lag)
@@ -0,0 +1,190 @@
+"""Rate limiting and admission control for the expensive endpoints.
+
+Three layers, cheapest first:
+
+* ``LoadShedMiddleware`` rejects any HTTP request with 503 once the worker
+  already has ``max_in_flight`` requests being handled, before routing or
+  parsing.
+* ``RateLimiter`` runs token buckets keyed by client IP, user ID or login
+  email and raises ``RateLimited`` (429) when a bucket is empty.
+* ``ConcurrencyGate`` caps how many bcrypt hashes or LLM calls run at once
+  and raises ``Overloaded`` (503) instead of queueing more.
+
+Rejections are immediate: under overload a client gets a fast error with
+``Retry-After`` rather than a request that sits in a queue and times out.
+
+Buckets live in a ``TokenBuckets`` backend. The default is private to the
+process; the MEMORY_DB store process can host one shared by every worker
+(see ``memory_store.connect_rate_limits``), and any object with the same
+``take`` method can be plugged in. If the backend fails the limiter lets
+the request through rather than turning an outage into errors.
+"""
+import json
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600}
+
+
+class RateLimited(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded for {scope}")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    def __init__(self, scope: str, retry_after: float = 1.0):
+        super().__init__(f"Too many concurrent {scope} requests")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def parse_rate(spec: str) -> Tuple[float, float]:
+    """"20/minute" -> (tokens per second, burst); the burst is the count"""
+    count, _, period = spec.partition("/")
+    if period not in PERIODS or not count.strip().isdigit():
+        raise ValueError(f"Invalid rate {spec!r}, expected e.g. '20/minute'")
+    return int(count) / PERIODS[period], float(count)
+
+
+class TokenBuckets:
+    """Thread-safe token buckets keyed by string.
+
+    Only the least recently used ``max_keys`` buckets are kept; a dropped
+    bucket would have refilled anyway unless its key is very active.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self._lock = threading.Lock()
+        self._max_keys = max_keys
+        # key -> (tokens, last refill time)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Spend `cost` tokens; 0 if admitted, else seconds until it would be"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / rate if rate > 0 else math.inf
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class RateLimiter:
+    """Named limits ("scope" -> rate spec) checked against a bucket backend"""
+
+    def __init__(self, limits: Dict[str, str], backend=None, enabled: bool = True):
+        self.limits = {scope: parse_rate(spec) for scope, spec in limits.items()}
+        self.backend = backend if backend is not None else TokenBuckets()
+        self.enabled = enabled
+
+    def check(self, scope: str, key: str) -> None:
+        """Raise RateLimited if `key` has used up its `scope` budget"""
+        if not self.enabled or not key:
+            return
+        rate, burst = self.limits[scope]
+        try:
+            wait = self.backend.take(f"{scope}:{key}", rate, burst)
+        except Exception as e:
+            logger.warning("Rate limit backend unavailable, admitting request: %s", e)
+            return
+        if wait > 0:
+            raise RateLimited(scope, wait)
+
+
+class ConcurrencyGate:
+    """Non-blocking cap on concurrent work of one kind in this process.
+
+    Use as ``with gate:``; entering when full raises Overloaded at once.
+    A limit of 0 or less disables the cap.
+    """
+
+    def __init__(self, scope: str, limit: int, retry_after: float = 1.0):
+        self.scope = scope
+        self.limit = limit
+        self.retry_after = retry_after
+        self.in_flight = 0
+
+    def __enter__(self):
+        if 0 < self.limit <= self.in_flight:
+            raise Overloaded(self.scope, self.retry_after)
+        self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.in_flight -= 1
+        return False
+
+
+class LoadShedMiddleware:
+    """ASGI middleware answering 503 once `max_in_flight` requests are open.
+
+    A request holds its slot until its response starts. What is being shed
+    is handler work; an SSE stream or a large download that has already
+    started costs little, and would otherwise pin a slot for as long as the
+    client stays connected. Paths in ``exempt`` (health checks, metrics) are
+    always served so the overload stays observable.
+    """
+
+    def __init__(self, app, max_in_flight: int, exempt: Tuple[str, ...] = (), on_shed=None):
+        self.app = app
+        self.max_in_flight = max_in_flight
+        self.exempt = exempt
+        self.on_shed = on_shed
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_in_flight <= 0 or scope["path"] in self.exempt:
+            await self.app(scope, receive, send)
+            return
+        if self.in_flight >= self.max_in_flight:
+            if self.on_shed is not None:
+                self.on_shed()
+            body = json.dumps({"detail": "Server is overloaded, retry shortly"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", b"1"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        self.in_flight += 1
+        held = True
+
+        def release():
+            nonlocal held
+            if held:
+                held = False
+                self.in_flight -= 1
+
+        async def send_and_release(message):
+            if message["type"] == "http.response.start":
+                release()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_release)
+        finally:
+            release()
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
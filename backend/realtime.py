@@ -0,0 +1,177 @@
+"""In-process pub/sub hub for live attendance, event and study group updates.
+
+Handlers publish small delta messages to topics such as ``course:<id>`` or
+``event:<id>``; every WebSocket/SSE connection owns one bounded queue fed by
+the hub. A consumer that lets its queue fill up is evicted instead of
+slowing down the publisher or growing memory without limit.
+
+Delivery across worker processes goes through a ``Broker``. The default
+``InMemoryBroker`` only reaches subscribers of the current process, which is
+what a single worker (and the tests) need; a multi-worker deployment plugs
+in a broker backed by shared infrastructure with the same three methods,
+named by ``REALTIME_BROKER`` (see ``load_broker``).
+"""
+import asyncio
+import importlib
+import json
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+TOPIC_KINDS = ("course", "event", "study_group")
+MAX_TOPICS_PER_SUBSCRIPTION = 50
+
+Deliver = Callable[[str, str], None]
+
+
+class Broker(ABC):
+    """Transport between publishers and the hubs of every worker.
+
+    ``publish`` ships an already serialised message; the broker must call the
+    ``deliver`` callback given to ``start`` once per message on every worker,
+    including the one that published it.
+    """
+
+    @abstractmethod
+    async def start(self, deliver: Deliver) -> None:
+        ...
+
+    @abstractmethod
+    async def publish(self, topic: str, payload: str) -> None:
+        ...
+
+    @abstractmethod
+    async def stop(self) -> None:
+        ...
+
+
+class InMemoryBroker(Broker):
+    """Single-process broker; what a single worker and the tests use"""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def publish(self, topic: str, payload: str) -> None:
+        if self._deliver is not None:
+            self._deliver(topic, payload)
+
+    async def stop(self) -> None:
+        self._deliver = None
+
+
+def load_broker(spec: Optional[str]) -> Broker:
+    """Instantiate the broker class named "module:Class"; InMemoryBroker when spec is empty"""
+    if not spec:
+        return InMemoryBroker()
+    module_name, _, class_name = spec.partition(":")
+    if not module_name or not class_name:
+        raise ValueError(f"Broker must be given as module:Class, not {spec!r}")
+    broker_class = getattr(importlib.import_module(module_name), class_name)
+    if not (isinstance(broker_class, type) and issubclass(broker_class, Broker)):
+        raise TypeError(f"{spec} is not a realtime.Broker")
+    return broker_class()
+
+
+class Subscription:
+    """One consumer (a socket or stream) listening on a set of topics"""
+
+    def __init__(self, topics: Set[str], max_queue: int):
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.evicted = False
+
+    async def get(self) -> Optional[str]:
+        """Next serialised message, or None once the subscription was evicted"""
+        payload = await self.queue.get()
+        if self.evicted:
+            return None
+        return payload
+
+
+class Hub:
+    def __init__(self, broker: Optional[Broker] = None, max_queue: int = 100):
+        self.broker = broker or InMemoryBroker()
+        self.max_queue = max_queue
+        self._topics: Dict[str, Set[Subscription]] = {}
+
+    async def start(self) -> None:
+        await self.broker.start(self._deliver)
+
+    async def stop(self) -> None:
+        await self.broker.stop()
+        for subscription in {s for subs in self._topics.values() for s in subs}:
+            self._evict(subscription)
+
+    async def publish(self, topic: str, message_type: str, data: Dict[str, Any]) -> None:
+        payload = json.dumps({
+            "type": message_type,
+            "topic": topic,
+            "data": data,
+            "ts": datetime.now(timezone.utc).isoformat()
+        }, default=str)
+        try:
+            await self.broker.publish(topic, payload)
+        except Exception as e:
+            # Live updates are best effort; never fail the write that triggered them
+            logger.warning("Realtime publish to %s failed: %s", topic, e)
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        subscription = Subscription(set(topics), self.max_queue)
+        for topic in subscription.topics:
+            self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for topic in subscription.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[topic]
+
+    def subscriber_count(self, topic: str) -> int:
+        return len(self._topics.get(topic, ()))
+
+    def _deliver(self, topic: str, payload: str) -> None:
+        for subscription in list(self._topics.get(topic, ())):
+            try:
+                subscription.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                logger.info("Evicting slow realtime consumer on %s", topic)
+                self._evict(subscription)
+
+    def _evict(self, subscription: Subscription) -> None:
+        self.unsubscribe(subscription)
+        subscription.evicted = True
+        # Drop the backlog and wake the consumer so it notices the eviction
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+
+
+def parse_topics(raw: str) -> Set[str]:
+    """Validate a comma separated ``kind:id`` topic list from a client"""
+    topics = {t.strip() for t in raw.split(",") if t.strip()}
+    if not topics or len(topics) > MAX_TOPICS_PER_SUBSCRIPTION:
+        raise ValueError(f"Subscribe to between 1 and {MAX_TOPICS_PER_SUBSCRIPTION} topics")
+    for topic in topics:
+        kind, _, entity_id = topic.partition(":")
+        if kind not in TOPIC_KINDS or not entity_id:
+            raise ValueError(f"Unknown topic: {topic}")
+    return topics
+
+
+async def pump(subscription: Subscription, send: Callable[[str], Awaitable[None]], send_timeout: float) -> None:
+    """Forward messages to one client until it is evicted or the send stalls"""
+    while True:
+        payload = await subscription.get()
+        if payload is None:
+            return
+        await asyncio.wait_for(send(payload), timeout=send_timeout)
@@ -0,0 +1,197 @@
+"""Study-group recommendations: course overlap, schedule fit and free places.
+
+``GroupIndex`` is rebuilt periodically from the membership edges. Each
+group gets a sparse course profile, stored in CSR form as plain NumPy
+arrays (indptr/indices/data). The weight of a course is the share of the
+group's members enrolled in it, and the group's own ``course_id`` always
+counts fully. Rows are L2-normalised. The index also keeps the transpose
+(course -> groups postings), so a user's course-overlap score against every
+group is a cosine similarity. It is computed as one ``np.bincount`` over
+the postings of that user's few courses, with no loop over groups.
+
+Schedule fit compares each group's weekly meeting with the user's busy
+slots from the timetable (see timetable.py) using one broadcast over
+(groups x slots). Free capacity is the fraction of places left.
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from timetable import MINUTES_PER_DAY, Slot, parse_day, parse_slot
+
+WEIGHT_COURSES = 0.6
+WEIGHT_SCHEDULE = 0.25
+WEIGHT_CAPACITY = 0.15
+# Groups that give only a start time ("14:00") are assumed to meet this long
+MEETING_MINUTES = 60
+# Fit score for groups with no (or an unreadable) schedule
+UNKNOWN_SCHEDULE_FIT = 0.5
+START_TIME = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*$")
+
+
+def meeting_interval(schedule: Optional[dict]) -> Optional[Tuple[int, int]]:
+    """(start, end) minutes since Monday for {"day", "time"}, or None"""
+    if not schedule:
+        return None
+    try:
+        if "-" in (schedule.get("time") or ""):
+            slot = parse_slot(schedule)
+            return slot.start, slot.end
+        day = parse_day(schedule.get("day"))
+    except ValueError:
+        return None
+    match = START_TIME.match(schedule.get("time") or "")
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        return None
+    start = day * MINUTES_PER_DAY + int(match.group(1)) * 60 + int(match.group(2))
+    return start, start + MEETING_MINUTES
+
+
+class GroupIndex:
+    """Precomputed group/course matrices for scoring every group at once"""
+
+    def __init__(
+        self,
+        groups: Sequence[dict],
+        memberships: Iterable[Tuple[str, str]],
+        enrollments: Iterable[Tuple[str, str]],
+    ):
+        """groups: study group docs; memberships: (group id, user id); enrollments: (course id, user id)"""
+        self.groups = list(groups)
+        self.group_ids = [group["id"] for group in self.groups]
+        self.group_pos = group_pos = {group_id: i for i, group_id in enumerate(self.group_ids)}
+        n_groups = len(self.groups)
+
+        enrollments = list(enrollments)
+        self.course_ids = sorted({course_id for course_id, _ in enrollments} | {
+            group["course_id"] for group in self.groups if group.get("course_id")
+        })
+        self.course_pos = {course_id: i for i, course_id in enumerate(self.course_ids)}
+        n_courses = len(self.course_ids)
+
+        # user -> courses as CSR, so each membership expands into its member's courses
+        user_pos: Dict[str, int] = {}
+        enrolled_users = np.array([user_pos.setdefault(user, len(user_pos)) for _, user in enrollments], dtype=np.int64)
+        enrolled_courses = np.array([self.course_pos[course] for course, _ in enrollments], dtype=np.int64)
+        order = np.argsort(enrolled_users, kind="stable")
+        user_courses = enrolled_courses[order]
+        user_indptr = np.zeros(len(user_pos) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(enrolled_users, minlength=len(user_pos)), out=user_indptr[1:])
+
+        members = np.zeros(n_groups, dtype=np.int64)
+        member_groups, member_users = [], []
+        for group_id, user in memberships:
+            if group_id in group_pos:
+                members[group_pos[group_id]] += 1
+                if user in user_pos:
+                    member_groups.append(group_pos[group_id])
+                    member_users.append(user_pos[user])
+        member_groups = np.array(member_groups, dtype=np.int64)
+        member_users = np.array(member_users, dtype=np.int64)
+        counts_per_member = user_indptr[member_users + 1] - user_indptr[member_users]
+        pair_groups = np.repeat(member_groups, counts_per_member)
+        # Positions of every member's courses inside user_courses
+        starts = np.repeat(user_indptr[member_users] - np.cumsum(counts_per_member) + counts_per_member, counts_per_member)
+        pair_courses = user_courses[starts + np.arange(len(pair_groups))]
+
+        # (group, course) -> members enrolled, as a share of the group's members
+        keys, counts = np.unique(pair_groups * max(n_courses, 1) + pair_courses, return_counts=True)
+        rows, cols = np.divmod(keys, max(n_courses, 1))
+        weights = counts / np.maximum(members, 1)[rows]
+
+        own = np.array([i for i, group in enumerate(self.groups) if group.get("course_id")], dtype=np.int64)
+        own_courses = np.array([self.course_pos[self.groups[i]["course_id"]] for i in own], dtype=np.int64)
+        rows = np.concatenate([rows, own])
+        cols = np.concatenate([cols, own_courses])
+        weights = np.concatenate([weights, np.ones(len(own))])
+        # Duplicates (own course also taken by members) keep the larger weight
+        order = np.lexsort((-weights, cols, rows))
+        rows, cols, weights = rows[order], cols[order], weights[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        rows, cols, weights = rows[first], cols[first], weights[first].astype(np.float32)
+
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=n_groups))
+        weights /= np.maximum(norms[rows], 1e-12).astype(np.float32)
+
+        # Group rows (CSR) for explaining results, course postings (CSC) for scoring
+        self.indptr = np.zeros(n_groups + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_groups), out=self.indptr[1:])
+        self.indices, self.data = cols, weights
+        order = np.argsort(cols, kind="stable")
+        self.posting_groups, self.posting_data = rows[order], weights[order]
+        self.posting_ptr = np.zeros(n_courses + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cols, minlength=n_courses), out=self.posting_ptr[1:])
+
+        meetings = [meeting_interval(group.get("schedule")) for group in self.groups]
+        self.meeting_start = np.array([m[0] if m else -1 for m in meetings], dtype=np.int64)
+        self.meeting_end = np.array([m[1] if m else -1 for m in meetings], dtype=np.int64)
+
+        capacity = np.array([group.get("max_members") or 0 for group in self.groups], dtype=np.float32)
+        joined = np.array([group.get("member_count") or 0 for group in self.groups], dtype=np.float32)
+        self.free = np.where(capacity > 0, np.clip((capacity - joined) / np.maximum(capacity, 1), 0, 1), 0).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def course_scores(self, course_ids: Iterable[str]) -> np.ndarray:
+        """Cosine similarity of every group's course profile with the user's courses"""
+        positions = [self.course_pos[c] for c in set(course_ids) if c in self.course_pos]
+        if not positions:
+            return np.zeros(len(self.groups), dtype=np.float32)
+        spans = [np.arange(self.posting_ptr[p], self.posting_ptr[p + 1]) for p in positions]
+        postings = np.concatenate(spans)
+        scores = np.bincount(
+            self.posting_groups[postings], weights=self.posting_data[postings], minlength=len(self.groups)
+        )
+        return (scores / np.sqrt(len(positions))).astype(np.float32)
+
+    def schedule_fit(self, busy: Sequence[Slot]) -> np.ndarray:
+        """1 where a group's meeting avoids every busy slot, 0 on a clash"""
+        fit = np.where(self.meeting_start < 0, UNKNOWN_SCHEDULE_FIT, 1.0).astype(np.float32)
+        if busy:
+            busy_start = np.array([slot.start for slot in busy], dtype=np.int64)
+            busy_end = np.array([slot.end for slot in busy], dtype=np.int64)
+            clash = (
+                (self.meeting_start[:, None] < busy_end) & (self.meeting_end[:, None] > busy_start)
+            ).any(axis=1)
+            fit[clash & (self.meeting_start >= 0)] = 0.0
+        return fit
+
+    def shared_courses(self, group: int, course_ids: Iterable[str]) -> List[str]:
+        row = self.indices[self.indptr[group]:self.indptr[group + 1]]
+        wanted = {self.course_pos[c] for c in course_ids if c in self.course_pos}
+        return [self.course_ids[c] for c in row if c in wanted]
+
+    def recommend(
+        self,
+        course_ids: Sequence[str],
+        busy: Sequence[Slot],
+        exclude: Iterable[str] = (),
+        limit: int = 10,
+    ) -> List[dict]:
+        """Top `limit` open groups by weighted score, with the score components"""
+        if not self.groups:
+            return []
+        courses = self.course_scores(course_ids)
+        fit = self.schedule_fit(busy)
+        score = WEIGHT_COURSES * courses + WEIGHT_SCHEDULE * fit + WEIGHT_CAPACITY * self.free
+        # Full groups, groups the user is already in and groups sharing nothing are out
+        score[(self.free <= 0) | (courses <= 0)] = -np.inf
+        score[[self.group_pos[g] for g in exclude if g in self.group_pos]] = -np.inf
+
+        limit = min(limit, len(score))
+        top = np.argpartition(-score, limit - 1)[:limit]
+        top = top[np.argsort(-score[top], kind="stable")]
+        return [
+            {
+                "group": self.groups[i],
+                "score": round(float(score[i]), 4),
+                "course_match": round(float(courses[i]), 4),
+                "schedule_fit": float(fit[i]),
+                "free_spots": round(float(self.free[i]), 4),
+                "shared_course_ids": self.shared_courses(i, course_ids),
+            }
+            for i in top if np.isfinite(score[i])
+        ]
@@ -0,0 +1,82 @@
+"""In-process token revocation list.
+
+Every JWT carries a ``jti``. Revoking a token (logout, refresh-token
+rotation) stores a record in the ``revoked_tokens`` collection and adds the
+jti here. Each worker keeps this copy in sync by polling that collection
+for new records, so ``get_current_user`` checks revocation with a set
+lookup instead of a database round-trip per request.
+
+Entries are only needed until the token they revoke would have expired
+anyway, so the list stays about as small as the number of logouts in one
+token lifetime. "Log out everywhere" is a per-user cut-off rather than a
+list of jtis: tokens issued to that user before it are rejected.
+"""
+import threading
+import time
+from typing import Dict, Iterable, Tuple
+
+
+class RevocationList:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # jti -> token expiry (epoch seconds)
+        self._jtis: Dict[str, float] = {}
+        # user id -> (reject tokens issued before, cut-off kept until)
+        self._user_cutoffs: Dict[str, Tuple[float, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._jtis) + len(self._user_cutoffs)
+
+    def revoke(self, jti: str, expires_at: float) -> None:
+        with self._lock:
+            self._jtis[jti] = expires_at
+
+    def revoke_user(self, user_id: str, issued_before: float, expires_at: float) -> None:
+        with self._lock:
+            current = self._user_cutoffs.get(user_id)
+            if current is None or current[0] < issued_before:
+                self._user_cutoffs[user_id] = (issued_before, expires_at)
+
+    def is_revoked(self, payload: dict) -> bool:
+        """Whether a decoded token is revoked by jti or by a per-user cut-off"""
+        jti = payload.get("jti")
+        if jti is not None and jti in self._jtis:
+            return True
+        cutoff = self._user_cutoffs.get(payload.get("sub"))
+        return cutoff is not None and payload.get("iat", 0) < cutoff[0]
+
+    def load(self, records: Iterable[dict]) -> None:
+        """Apply stored revocation records (see ``record_for``/``user_record_for``)"""
+        for record in records:
+            if record.get("user_id") and record.get("issued_before") is not None:
+                self.revoke_user(record["user_id"], record["issued_before"], record["expires_at"])
+            else:
+                self.revoke(record["jti"], record["expires_at"])
+
+    def prune(self, now: float = None) -> int:
+        """Drop entries whose tokens have expired; returns how many went"""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [jti for jti, expires_at in self._jtis.items() if expires_at <= now]
+            for jti in expired:
+                del self._jtis[jti]
+            stale = [user for user, (_, expires_at) in self._user_cutoffs.items() if expires_at <= now]
+            for user in stale:
+                del self._user_cutoffs[user]
+            return len(expired) + len(stale)
+
+
+def record_for(jti: str, expires_at: float, revoked_at: float = None) -> dict:
+    """Stored form of a single revoked token"""
+    return {"jti": jti, "expires_at": expires_at, "revoked_at": revoked_at or time.time()}
+
+
+def user_record_for(user_id: str, issued_before: float, expires_at: float) -> dict:
+    """Stored form of a per-user cut-off; the jti only keeps records unique"""
+    return {
+        "jti": f"user:{user_id}:{issued_before}",
+        "user_id": user_id,
+        "issued_before": issued_before,
+        "expires_at": expires_at,
+        "revoked_at": time.time(),
+    }
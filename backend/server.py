@@ -1,49 +1,96 @@
 
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, WebSocket, status, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-try:
-    from motor.motor_asyncio import AsyncIOMotorClient  # type: ignore
-except Exception:
-    AsyncIOMotorClient = None  # type: ignore
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from importlib.util import find_spec
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any, Set, Tuple
 import uuid
 from datetime import datetime, timezone, timedelta
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
-from passlib.context import CryptContext
-try:
-    from emergentintegrations.llm.chat import LlmChat, UserMessage  # type: ignore
-    EMERGENT_AVAILABLE = True
-except Exception:
-    LlmChat = None  # type: ignore
-    UserMessage = None  # type: ignore
-    EMERGENT_AVAILABLE = False
 import json
 import asyncio
+import hashlib
+import hmac
+from realtime import Hub, load_broker, parse_topics, pump
+from timetable import Timetable, parse_schedule
+from chat_history import BatchWriter, SessionBuffers
+import attendance_sync
+import media
+from revocation import RevocationList, record_for, user_record_for
+from attendance_store import METHODS as ATTENDANCE_METHODS
+from ratelimit import ConcurrencyGate, LoadShedMiddleware, Overloaded, RateLimited, RateLimiter, retry_after_header
+import metrics
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection. Motor is only imported (and the client created) by the
+# lifespan hook, so importing this module stays cheap.
 mongo_url = os.environ.get('MONGO_URL')
 MEMORY_DB = os.environ.get('MEMORY_DB', '1') == '1'
-client = AsyncIOMotorClient(mongo_url) if (mongo_url and not MEMORY_DB and AsyncIOMotorClient) else None
-db = client[os.environ['DB_NAME']] if client else None
+USE_MONGO = bool(mongo_url and not MEMORY_DB and find_spec("motor") is not None)
+client = None
+db = None
+
+# Pool sizing. minPoolSize connections are opened (and pinged) during startup
+# so the first requests after a deploy don't pay for the handshakes, and a
+# burst past maxPoolSize waits at most MONGO_WAIT_QUEUE_TIMEOUT_MS for a free
+# connection instead of queueing indefinitely.
+MONGO_POOL_OPTIONS = {
+    "minPoolSize": int(os.environ.get('MONGO_MIN_POOL_SIZE', '10')),
+    "maxPoolSize": int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+    "maxIdleTimeMS": int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000')),
+    "waitQueueTimeoutMS": int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '2000')),
+    "serverSelectionTimeoutMS": int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+}
+MONGO_HEALTH_INTERVAL = float(os.environ.get('MONGO_HEALTH_INTERVAL', '15'))
+
+# Read preference / write concern per route class:
+#   critical - auth, attendance and membership: primary reads, majority writes
+#   standard - other writes (events, study groups, chat): w=1
+#   listing  - list and stats reads that can tolerate slightly stale data
+DB_PROFILE_SETTINGS = {
+    "critical": ("primary", "majority"),
+    "standard": ("primary", 1),
+    "listing": (os.environ.get('MONGO_LISTING_READ_PREFERENCE', 'secondaryPreferred'), 1),
+}
+db_profiles: Dict[str, Any] = {}
 
-# In-memory fallback (dev convenience only)
-users_memory: list[dict] = []
-attendance_memory: list[dict] = []
-courses_memory: list[dict] = []
+# In-memory fallback (dev convenience only), also opened by the lifespan hook.
+# Set MEMORY_STORE_ADDRESS to share one store between several uvicorn workers
+# instead of a copy per process. Its calls then block the event loop for a
+# local socket round trip each (see memory_store.py), and live updates still
+# only reach clients of the worker that published them unless REALTIME_BROKER
+# is set. Attendance goes to a
+# compact columnar log rather than documents.
+memory = None
+attendance_log = None
+
+# Membership edges live in their own collections keyed by (entity_id, user_id)
+# instead of arrays embedded in the parent; the parent only keeps a count.
+# edge collection -> (parent collection, count field, legacy embedded array)
+MEMBERSHIP_EDGES = {
+    "course_enrollments": ("courses", "enrolled_count", "enrolled_students"),
+    "event_registrations": ("events", "registered_count", "registered_users"),
+    "study_group_members": ("study_groups", "member_count", "members"),
+}
 
 # Initialize sample courses for development
 def init_sample_courses():
     """Initialize sample courses for testing"""
-    if not courses_memory:
+    if memory is not None and not memory.count("courses"):
         sample_courses = [
             {
                 "id": str(uuid.uuid4()),
@@ -54,7 +101,7 @@ def init_sample_courses():
                 "credits": 3,
                 "description": "Fundamental concepts of computer science including programming, algorithms, and data structures.",
                 "schedule": [{"day": "Monday", "time": "09:00-10:30", "room": "A101"}, {"day": "Wednesday", "time": "09:00-10:30", "room": "A101"}],
-                "enrolled_students": [],
+                "enrolled_count": 0,
                 "created_at": datetime.now(timezone.utc).isoformat()
             },
             {
@@ -66,7 +113,7 @@ def init_sample_courses():
                 "credits": 4,
                 "description": "Advanced data structures, algorithm design, and complexity analysis.",
                 "schedule": [{"day": "Tuesday", "time": "11:00-12:30", "room": "B205"}, {"day": "Thursday", "time": "11:00-12:30", "room": "B205"}],
-                "enrolled_students": [],
+                "enrolled_count": 0,
                 "created_at": datetime.now(timezone.utc).isoformat()
             },
             {
@@ -78,7 +125,7 @@ def init_sample_courses():
                 "credits": 3,
                 "description": "Design and implementation of database systems, SQL, and data modeling.",
                 "schedule": [{"day": "Monday", "time": "14:00-15:30", "room": "C301"}, {"day": "Wednesday", "time": "14:00-15:30", "room": "C301"}],
-                "enrolled_students": [],
+                "enrolled_count": 0,
                 "created_at": datetime.now(timezone.utc).isoformat()
             },
             {
@@ -90,63 +137,508 @@ def init_sample_courses():
                 "credits": 3,
                 "description": "Modern web development using React, Node.js, and full-stack frameworks.",
                 "schedule": [{"day": "Tuesday", "time": "14:00-16:00", "room": "D401"}, {"day": "Friday", "time": "14:00-16:00", "room": "D401"}],
-                "enrolled_students": [],
+                "enrolled_count": 0,
                 "created_at": datetime.now(timezone.utc).isoformat()
             }
         ]
-        courses_memory.extend(sample_courses)
+        memory.seed("courses", sample_courses)
+
+background_tasks: list = []
+
+def db_for(profile: str):
+    """The database handle for a route class (see DB_PROFILE_SETTINGS), or plain db"""
+    return db_profiles.get(profile, db)
+
+def build_db_profiles(database) -> Dict[str, Any]:
+    from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+    from pymongo.write_concern import WriteConcern
+    profiles = {}
+    for name, (read_preference, w) in DB_PROFILE_SETTINGS.items():
+        profiles[name] = database.with_options(
+            read_preference=make_read_preference(read_pref_mode_from_name(read_preference), None),
+            write_concern=WriteConcern(w=w)
+        )
+    return profiles
+
+async def check_mongo(timeout: float = 2.0) -> bool:
+    """Ping the server and record the result in the mongo_up gauge"""
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=timeout)
+    except Exception as e:
+        metrics.mongo_up.set(0)
+        logger.warning("MongoDB health check failed: %s", e)
+        return False
+    metrics.mongo_up.set(1)
+    return True
+
+async def warm_mongo_pool():
+    """Open minPoolSize connections up front with concurrent pings"""
+    if not await check_mongo(timeout=MONGO_POOL_OPTIONS["serverSelectionTimeoutMS"] / 1000):
+        return
+    await asyncio.gather(
+        *(db.command("ping") for _ in range(MONGO_POOL_OPTIONS["minPoolSize"])),
+        return_exceptions=True
+    )
+
+EVENT_DATE_FORMAT = r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\+00:00$"
+
+def event_date(value: datetime) -> str:
+    """Stored form of Event.date: UTC, fixed width, so string order is time order"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat(timespec="seconds")
+
+async def archive_past_events() -> int:
+    global event_feed
+    cutoff = event_date(datetime.now(timezone.utc) - timedelta(seconds=EVENT_ARCHIVE_AFTER))
+    result = await db_for("standard").events.update_many(
+        {"is_active": True, "date": {"$lt": cutoff}},
+        {"$set": {"is_active": False, "archived_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    if result.modified_count:
+        event_feed = None
+        logger.info("Archived %d past events", result.modified_count)
+    return result.modified_count
+
+async def archive_events_periodically():
+    while True:
+        try:
+            await archive_past_events()
+        except Exception as e:
+            logger.warning("Event archiving failed: %s", e)
+        await asyncio.sleep(EVENT_ARCHIVE_INTERVAL)
 
-# Initialize sample courses on startup
-init_sample_courses()
+async def monitor_mongo():
+    while True:
+        await asyncio.sleep(MONGO_HEALTH_INTERVAL)
+        await check_mongo()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db, db_profiles, memory, attendance_log
+    started = time.perf_counter()
+    if db is None and USE_MONGO:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(
+            mongo_url,
+            event_listeners=[metrics.command_listener(), metrics.pool_listener()],
+            **MONGO_POOL_OPTIONS
+        )
+        db = client[os.environ['DB_NAME']]
+        db_profiles = build_db_profiles(db)
+        await warm_mongo_pool()
+    if db is not None:
+        # An injected stand-in (e.g. mongomock) keeps its default options
+        background_tasks.append(asyncio.create_task(monitor_mongo()))
+        background_tasks.append(asyncio.create_task(archive_events_periodically()))
+    if db is None:
+        import memory_store
+        store, log = memory_store.connect(os.environ.get('MEMORY_STORE_ADDRESS'))
+        memory = metrics.TimedStore(store)
+        attendance_log = metrics.TimedStore(log, collection="attendance")
+        init_sample_courses()
+
+    if RATE_LIMIT_STORE_ADDRESS:
+        import memory_store
+        rate_limiter.backend = memory_store.connect_rate_limits(RATE_LIMIT_STORE_ADDRESS)
+    await ensure_indexes()
+    await sync_revocations()
+    background_tasks.append(asyncio.create_task(poll_revocations()))
+    if REALTIME_BROKER:
+        hub.broker = load_broker(REALTIME_BROKER)
+    await hub.start()
+    if db is not None:
+        chat_writer.start()
+    background_tasks.append(asyncio.create_task(metrics.probe_event_loop_lag()))
+
+    ready = time.perf_counter()
+    metrics.startup_seconds.set(started - _import_started, "import")
+    metrics.startup_seconds.set(ready - started, "lifespan")
+    logger.info(
+        "Startup complete in %.0f ms (import %.0f ms, lifespan %.0f ms, store: %s)",
+        (ready - _import_started) * 1000, (started - _import_started) * 1000,
+        (ready - started) * 1000, "mongo" if db is not None else "memory"
+    )
+    yield
+
+    await chat_writer.stop()
+    for task in background_tasks:
+        task.cancel()
+    if group_index_refresh is not None:
+        group_index_refresh.cancel()
+    for pool in (face_pool, media_pool):
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    await hub.stop()
+    if client:
+        client.close()
 
 # Create the main app without a prefix
-app = FastAPI(title="Campus Management Platform API", version="1.0.0")
+app = FastAPI(title="Campus Management Platform API", version="1.0.0", lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # Security
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "change-this-in-dev")
 JWT_ALGORITHM = "HS256"
-JWT_EXPIRATION_HOURS = 24
+# Short-lived access tokens plus rotating refresh tokens. Revoked jtis are
+# mirrored into `revocations` on every worker (polled from the
+# revoked_tokens collection), so checking them costs no database round-trip.
+ACCESS_TOKEN_MINUTES = int(os.environ.get("ACCESS_TOKEN_MINUTES", "15"))
+REFRESH_TOKEN_DAYS = int(os.environ.get("REFRESH_TOKEN_DAYS", "30"))
+REVOCATION_SYNC_SECONDS = float(os.environ.get("REVOCATION_SYNC_SECONDS", "5"))
+# MEMORY_DB: how often expired revocation records are deleted (Mongo's TTL
+# monitor does the same for purge_at about once a minute)
+REVOCATION_PURGE_SECONDS = 60
+# A refresh token presented again this soon after its rotation (another tab,
+# a retried request) gets the same successor pair instead of counting as reuse
+REFRESH_REUSE_GRACE_SECONDS = float(os.environ.get("REFRESH_REUSE_GRACE_SECONDS", "30"))
+revocations = RevocationList()
+
+# Admission control (see ratelimit.py). Token buckets per client IP, user
+# and login email; the per-IP budgets are generous because a whole campus
+# can sit behind one NAT address. Buckets are shared between workers through
+# the memory store process when RATE_LIMIT_STORE_ADDRESS (or
+# MEMORY_STORE_ADDRESS) is set.
+RATE_LIMITS = {
+    "login_ip": os.environ.get("RATE_LIMIT_LOGIN_IP", "120/minute"),
+    "login_email": os.environ.get("RATE_LIMIT_LOGIN_EMAIL", "10/minute"),
+    "register_ip": os.environ.get("RATE_LIMIT_REGISTER_IP", "30/minute"),
+    "attendance_user": os.environ.get("RATE_LIMIT_ATTENDANCE_USER", "30/minute"),
+    "attendance_ip": os.environ.get("RATE_LIMIT_ATTENDANCE_IP", "1200/minute"),
+    # A face kiosk checks in a whole class from one account
+    "face_kiosk_user": os.environ.get("RATE_LIMIT_FACE_KIOSK_USER", "600/minute"),
+    "attendance_sync_user": os.environ.get("RATE_LIMIT_ATTENDANCE_SYNC_USER", "10/minute"),
+    "attendance_sync_ip": os.environ.get("RATE_LIMIT_ATTENDANCE_SYNC_IP", "600/minute"),
+    "chat_user": os.environ.get("RATE_LIMIT_CHAT_USER", "20/minute"),
+    "chat_ip": os.environ.get("RATE_LIMIT_CHAT_IP", "300/minute"),
+    "refresh_ip": os.environ.get("RATE_LIMIT_REFRESH_IP", "1200/minute"),
+    # Per upload request, each carrying up to MEDIA_MAX_BATCH images
+    "media_user": os.environ.get("RATE_LIMIT_MEDIA_USER", "10/minute"),
+    "media_ip": os.environ.get("RATE_LIMIT_MEDIA_IP", "300/minute"),
+}
+RATE_LIMIT_STORE_ADDRESS = os.environ.get("RATE_LIMIT_STORE_ADDRESS") or os.environ.get("MEMORY_STORE_ADDRESS")
+TRUST_PROXY_HEADERS = os.environ.get("TRUST_PROXY_HEADERS", "0") == "1"
+# Reverse proxies in front of the app, each appending to X-Forwarded-For
+TRUSTED_PROXY_COUNT = max(int(os.environ.get("TRUSTED_PROXY_COUNT", "1")), 1)
+rate_limiter = RateLimiter(RATE_LIMITS, enabled=os.environ.get("RATE_LIMIT_ENABLED", "1") == "1")
+# Per-worker caps on the expensive work; 0 disables a cap
+password_gate = ConcurrencyGate("password hashing", int(os.environ.get("AUTH_MAX_CONCURRENCY", str((os.cpu_count() or 1) * 2))))
+llm_gate = ConcurrencyGate("chat", int(os.environ.get("CHAT_MAX_CONCURRENCY", "32")))
+MAX_IN_FLIGHT = int(os.environ.get("MAX_IN_FLIGHT", "512"))
+
+# Face-recognition attendance (see faces.py). Extraction runs in a process
+# pool; NumPy, the pool and the model only load on the first face request.
+FACE_WORKERS = int(os.environ.get("FACE_WORKERS", str(os.cpu_count() or 1)))
+FACE_MATCH_THRESHOLD = float(os.environ.get("FACE_MATCH_THRESHOLD", "0.93"))
+FACE_ROSTER_TTL = float(os.environ.get("FACE_ROSTER_TTL", "60"))
+FACE_MAX_UPLOAD_BYTES = int(os.environ.get("FACE_MAX_UPLOAD_BYTES", str(5 * 1024 * 1024)))
+face_gate = ConcurrencyGate("face recognition", int(os.environ.get("FACE_MAX_CONCURRENCY", str(FACE_WORKERS * 2))))
+face_index = None
+face_pool = None
+
+# Image uploads (see media.py). A separate pool so a batch of large photos
+# never delays face check-ins.
+MEDIA_ROOT = os.environ.get("MEDIA_ROOT", str(ROOT_DIR / "media"))
+MEDIA_WORKERS = int(os.environ.get("MEDIA_WORKERS", "2"))
+MEDIA_MAX_UPLOAD_BYTES = int(os.environ.get("MEDIA_MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+MEDIA_MAX_BATCH = int(os.environ.get("MEDIA_MAX_BATCH", "10"))
+# Distinct images one user may store (media_uploads edges); 0 disables the cap
+MEDIA_MAX_PER_USER = int(os.environ.get("MEDIA_MAX_PER_USER", "200"))
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+media_gate = ConcurrencyGate("image processing", int(os.environ.get("MEDIA_MAX_CONCURRENCY", "4")))
+media_pool = None
+
+# Room/instructor occupancy (see timetable.py), rebuilt from storage every
+# TIMETABLE_TTL seconds so courses created by other workers are picked up
+TIMETABLE_TTL = float(os.environ.get("TIMETABLE_TTL", "30"))
+timetable: Optional[Timetable] = None
+timetable_built_at = 0.0
+timetable_lock = asyncio.Lock()
+
+# Offline check-ins replayed through /attendance/sync (see attendance_sync.py)
+ATTENDANCE_SYNC_MAX_BATCH = int(os.environ.get("ATTENDANCE_SYNC_MAX_BATCH", "200"))
+ATTENDANCE_SYNC_MAX_AGE = timedelta(days=float(os.environ.get("ATTENDANCE_SYNC_MAX_AGE_DAYS", "7")))
+# Device clocks run ahead; later than this is rejected
+ATTENDANCE_SYNC_CLOCK_SKEW = timedelta(minutes=5)
+# A synced check-in must fall within this long after the issue time of the
+# class session (course QR code) it carries
+ATTENDANCE_SESSION_WINDOW = timedelta(minutes=float(os.environ.get("ATTENDANCE_SESSION_MINUTES", "15")))
+
+# Study-group recommendations (see recommendations.py). The index is rebuilt
+# from the membership edges every RECOMMENDATION_TTL seconds, in the
+# background while requests keep using the previous one; only the first
+# recommendation request waits for a build (and loads NumPy).
+RECOMMENDATION_TTL = float(os.environ.get("RECOMMENDATION_TTL", "300"))
+group_index = None
+group_index_built_at = 0.0
+group_index_lock = asyncio.Lock()
+group_index_refresh: Optional[asyncio.Task] = None
+
+# Events are kept active until EVENT_ARCHIVE_AFTER seconds past their date,
+# then a background job archives them (is_active=False). The "this week"
+# feed is cached per worker and dropped on create_event or archiving.
+EVENT_ARCHIVE_AFTER = float(os.environ.get("EVENT_ARCHIVE_AFTER", str(24 * 3600)))
+EVENT_ARCHIVE_INTERVAL = float(os.environ.get("EVENT_ARCHIVE_INTERVAL", "600"))
+EVENT_FEED_TTL = float(os.environ.get("EVENT_FEED_TTL", "60"))
+EVENT_FEED_DAYS = 7
+event_feed: Optional[List[dict]] = None
+event_feed_built_at = 0.0
+
+# Live updates (WebSocket/SSE). REALTIME_BROKER ("module:Class", a
+# realtime.Broker) carries them between workers; the default in-process
+# broker only reaches clients of the publishing worker. Loaded at startup.
+REALTIME_BROKER = os.environ.get("REALTIME_BROKER", "")
+hub = Hub(max_queue=int(os.environ.get("REALTIME_MAX_QUEUE", "100")))
+REALTIME_SEND_TIMEOUT = float(os.environ.get("REALTIME_SEND_TIMEOUT", "5"))
+SSE_KEEPALIVE_SECONDS = 15
+# Open sockets/streams re-check their token this often and close once it
+# has expired or been revoked
+REALTIME_AUTH_RECHECK_SECONDS = float(os.environ.get("REALTIME_AUTH_RECHECK_SECONDS", "30"))
+
+# Chat history (see chat_history.py): the last CHAT_CONTEXT_TURNS turns of
+# each session stay in memory as prompt context; turns reach Mongo through a
+# batched background writer and expire after CHAT_HISTORY_RETENTION_DAYS.
+CHAT_CONTEXT_TURNS = int(os.environ.get("CHAT_CONTEXT_TURNS", "10"))
+CHAT_HISTORY_RETENTION_DAYS = int(os.environ.get("CHAT_HISTORY_RETENTION_DAYS", "90"))
+chat_sessions = SessionBuffers(
+    max_turns=CHAT_CONTEXT_TURNS, max_sessions=int(os.environ.get("CHAT_MAX_SESSIONS", "10000"))
+)
+chat_writer = BatchWriter(
+    lambda docs: write_chat_turns(docs),
+    max_batch=int(os.environ.get("CHAT_WRITE_BATCH", "100")),
+    interval=float(os.environ.get("CHAT_WRITE_INTERVAL", "1")),
+    max_pending=int(os.environ.get("CHAT_WRITE_MAX_PENDING", "10000")),
+    on_drop=lambda count: metrics.chat_turns_dropped.inc(amount=count)
+)
 
 # Emergent LLM Key
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
+_llm_sdk = None  # (LlmChat, UserMessage) once imported, False if unavailable
+
+def load_llm_sdk():
+    """Import the Emergent LLM SDK on first chat instead of at startup"""
+    global _llm_sdk
+    if _llm_sdk is None:
+        try:
+            from emergentintegrations.llm.chat import LlmChat, UserMessage  # type: ignore
+            _llm_sdk = (LlmChat, UserMessage)
+        except Exception:
+            _llm_sdk = False
+    return _llm_sdk or None
 
 # Helper functions
-def create_access_token(data: dict):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
-    return encoded_jwt
+def create_token(
+    user_id: str,
+    token_type: str,
+    lifetime: timedelta,
+    issued_at: Optional[float] = None,
+    jti: Optional[str] = None
+) -> str:
+    # iat keeps sub-second precision so a "log out everywhere" cut-off
+    # doesn't also reject a login made later within the same second
+    issued_at = time.time() if issued_at is None else issued_at
+    return jwt.encode({
+        "sub": user_id,
+        "type": token_type,
+        "jti": jti or uuid.uuid4().hex,
+        "iat": issued_at,
+        "exp": int(issued_at + lifetime.total_seconds())
+    }, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+def issue_tokens(user_id: str, issued_at: Optional[float] = None, rotated_from: Optional[str] = None) -> dict:
+    """New access/refresh pair; rotated_from (the replaced refresh jti) makes it reproducible"""
+    def jti(token_type: str) -> Optional[str]:
+        if rotated_from is None:
+            return None
+        seed = f"{rotated_from}:{token_type}".encode()
+        return hmac.new(JWT_SECRET_KEY.encode(), seed, hashlib.sha256).hexdigest()[:32]
+    return {
+        "access_token": create_token(
+            user_id, "access", timedelta(minutes=ACCESS_TOKEN_MINUTES), issued_at, jti("access")
+        ),
+        "refresh_token": create_token(
+            user_id, "refresh", timedelta(days=REFRESH_TOKEN_DAYS), issued_at, jti("refresh")
+        ),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_MINUTES * 60
+    }
+
+def decode_token(token: str, token_type: str = "access", allow_revoked: bool = False) -> dict:
+    """Verified claims of a token of the given type; 401 if invalid or revoked"""
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    # Tokens issued before refresh tokens existed carry no type and count as access
+    if payload.get("sub") is None or payload.get("type", "access") != token_type:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if not allow_revoked and revocations.is_revoked(payload):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    return payload
+
+async def store_revocation(record: dict) -> bool:
+    """Persist a revocation record; False if its jti was already revoked"""
+    if db is None:
+        return memory.insert_one("revoked_tokens", record, unique=("jti",))
+    from pymongo.errors import DuplicateKeyError
+    try:
+        await db_for("critical").revoked_tokens.insert_one({
+            **record,
+            # TTL index field: Mongo drops the record once the token is dead anyway
+            "purge_at": datetime.fromtimestamp(record["expires_at"], tz=timezone.utc)
+        })
+    except DuplicateKeyError:
+        return False
+    return True
+
+async def revoke_token(payload: dict, rotated_at: Optional[float] = None) -> bool:
+    """Revoke one token by jti; False if it had already been revoked.
+
+    rotated_at marks a refresh token replaced by a successor issued at that time.
+    """
+    if not payload.get("jti"):
+        return True  # pre-jti token, it simply runs out
+    record = record_for(payload["jti"], payload["exp"], rotated_at)
+    if rotated_at is not None:
+        record["rotated"] = True
+    stored = await store_revocation(record)
+    revocations.revoke(payload["jti"], payload["exp"])
+    return stored
+
+async def rotation_record(payload: dict) -> Optional[dict]:
+    """The revocation record of a refresh token that was rotated; None if it was revoked otherwise"""
+    if not payload.get("jti"):
+        return None
+    if db is None:
+        record = memory.find_one("revoked_tokens", {"jti": payload["jti"]})
+    else:
+        record = await db_for("critical").revoked_tokens.find_one({"jti": payload["jti"]}, {"_id": 0})
+    return record if record and record.get("rotated") else None
+
+def rotated_successor(payload: dict, rotation: dict) -> Optional[dict]:
+    """The pair a refresh token was rotated into, if that was within the grace window"""
+    if time.time() - rotation["revoked_at"] > REFRESH_REUSE_GRACE_SECONDS:
+        return None
+    return issue_tokens(payload["sub"], issued_at=rotation["revoked_at"], rotated_from=payload["jti"])
+
+async def revoke_all_sessions(user_id: str) -> None:
+    """Reject every access and refresh token issued to the user until now"""
+    now = time.time()
+    record = user_record_for(user_id, now, now + timedelta(days=REFRESH_TOKEN_DAYS).total_seconds())
+    await store_revocation(record)
+    revocations.load([record])
+
+_revocations_since = 0.0  # newest revoked_at applied
+_revocations_purged_at = 0.0  # MEMORY_DB: last sweep of expired records
+
+async def sync_revocations():
+    """Apply revocation records written by other workers since the last sync"""
+    global _revocations_since, _revocations_purged_at
+    now = time.time()
+    # Overlap the window so records committed slightly out of order are not missed
+    since = _revocations_since - 60
+    if db is None:
+        if now - _revocations_purged_at >= REVOCATION_PURGE_SECONDS:
+            memory.delete_expired("revoked_tokens", "expires_at", now)
+            _revocations_purged_at = now
+        records = [
+            r for r in memory.find_since("revoked_tokens", "revoked_at", since) if r["expires_at"] > now
+        ]
+    else:
+        records = await db_for("critical").revoked_tokens.find(
+            {"revoked_at": {"$gte": since}, "expires_at": {"$gt": now}},
+            {"_id": 0, "purge_at": 0}
+        ).to_list(None)
+    if records:
+        _revocations_since = max(_revocations_since, max(r["revoked_at"] for r in records))
+    revocations.load(records)
+    revocations.prune()
+
+async def poll_revocations():
+    while True:
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+        try:
+            await sync_revocations()
+        except Exception as e:
+            logger.warning("Revocation list sync failed: %s", e)
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    # passlib and the bcrypt backend load on first use
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+async def find_user(user_id: str) -> Optional[dict]:
+    if MEMORY_DB or db is None:
+        return memory.find_one("users", {"id": user_id})
+    return await db_for("critical").users.find_one({"id": user_id}, {"_id": 0})
+
+async def find_course(course_id: str) -> Optional[dict]:
+    if MEMORY_DB or db is None:
+        return memory.find_one("courses", {"id": course_id})
+    return await db_for("critical").courses.find_one({"id": course_id}, {"_id": 0})
+
+async def user_from_token(token: str):
+    payload = decode_token(token)
+    user = await find_user(payload["sub"])
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await user_from_token(credentials.credentials)
+
+optional_security = HTTPBearer(auto_error=False)
+
+async def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    """Resolve the caller when a valid token is sent, otherwise None (public listings)"""
+    if credentials is None:
+        return None
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
+        return await get_current_user(credentials)
+    except HTTPException:
+        return None
 
-        if MEMORY_DB or not db:
-            user = next((u for u in users_memory if u["id"] == user_id), None)
-        else:
-            user = await db.users.find_one({"id": user_id}, {"_id": 0})
+def client_ip(request: Request) -> str:
+    """Caller address for rate limits
 
-        if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    Behind proxies, the client can put anything into X-Forwarded-For; only the
+    entries appended by our own TRUSTED_PROXY_COUNT proxies are reliable, and
+    the leftmost of those is the address the outermost proxy saw.
+    """
+    if TRUST_PROXY_HEADERS:
+        hops = [
+            hop.strip()
+            for header in request.headers.getlist("x-forwarded-for")
+            for hop in header.split(",") if hop.strip()
+        ]
+        if hops:
+            return hops[-min(TRUSTED_PROXY_COUNT, len(hops))]
+    return request.client.host if request.client else ""
+
+def limit_by_ip(scope: str):
+    """Dependency spending one token of the client IP's `scope` budget"""
+    async def dependency(request: Request):
+        rate_limiter.check(scope, client_ip(request))
+    return dependency
+
+def limit_by_user(scope: str):
+    """Dependency spending the caller's `<scope>_user` and `<scope>_ip` budgets"""
+    async def dependency(request: Request, current_user: dict = Depends(get_current_user)):
+        rate_limiter.check(f"{scope}_user", current_user["id"])
+        rate_limiter.check(f"{scope}_ip", client_ip(request))
+    return dependency
 
 def prepare_for_mongo(data):
     """Convert datetime objects to ISO strings for MongoDB storage"""
@@ -175,6 +667,146 @@ def parse_from_mongo(data):
                 data[key] = [parse_from_mongo(item) if isinstance(item, dict) else item for item in value]
     return data
 
+# Membership helpers
+async def add_membership(edge: str, entity_id: str, user_id: str, capacity: Optional[int] = None) -> tuple:
+    """Insert a membership edge and bump the parent's count.
+
+    Returns (outcome, count) where outcome is "added", "exists" or "full" and
+    count is the parent's count after an add. The capacity check is a guarded
+    $inc on the parent, so concurrent joins cannot overshoot it.
+    """
+    parent, count_field, _ = MEMBERSHIP_EDGES[edge]
+    membership = {
+        "entity_id": entity_id,
+        "user_id": user_id,
+        "joined_at": datetime.now(timezone.utc).isoformat()
+    }
+
+    if MEMORY_DB or db is None:
+        if not memory.insert_one(edge, membership, unique=("entity_id", "user_id")):
+            return "exists", None
+        count = memory.increment(parent, {"id": entity_id}, count_field, below=capacity or None)
+        if count is None:
+            memory.delete_one(edge, {"entity_id": entity_id, "user_id": user_id})
+            return "full", None
+        return "added", count
+
+    from pymongo import ReturnDocument
+    from pymongo.errors import DuplicateKeyError
+    try:
+        await db_for("critical")[edge].insert_one(membership)
+    except DuplicateKeyError:
+        return "exists", None
+    guard: Dict[str, Any] = {"id": entity_id}
+    if capacity:
+        guard[count_field] = {"$lt": capacity}
+    previous = await db_for("critical")[parent].find_one_and_update(
+        guard,
+        {"$inc": {count_field: 1}},
+        projection={"_id": 0, count_field: 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if previous is None:
+        await db_for("critical")[edge].delete_one({"entity_id": entity_id, "user_id": user_id})
+        return "full", None
+    return "added", previous.get(count_field, 0) + 1
+
+async def list_members(edge: str, entity_id: str, skip: int, limit: int) -> Dict[str, Any]:
+    """Page through the user IDs of one entity in join order"""
+    if MEMORY_DB or db is None:
+        page = memory.find(edge, {"entity_id": entity_id}, skip=skip, limit=limit)
+        total = memory.count(edge, {"entity_id": entity_id})
+    else:
+        page = await db_for("listing")[edge].find(
+            {"entity_id": entity_id}, {"_id": 0, "user_id": 1}
+        ).sort("joined_at", 1).skip(skip).limit(limit).to_list(limit)
+        total = await db_for("listing")[edge].count_documents({"entity_id": entity_id})
+    return {"total": total, "skip": skip, "limit": limit, "user_ids": [e["user_id"] for e in page]}
+
+# The caller's own memberships are read from the primary: right after joining
+# something, a lagging secondary would still report them as not a member.
+async def count_user_memberships(edge: str, user_id: str) -> int:
+    if MEMORY_DB or db is None:
+        return memory.count(edge, {"user_id": user_id})
+    return await db_for("critical")[edge].count_documents({"user_id": user_id})
+
+async def user_entity_ids(edge: str, user_id: str, entity_ids: Optional[List[str]] = None) -> set:
+    """IDs of the entities the user belongs to, optionally restricted to entity_ids"""
+    if MEMORY_DB or db is None:
+        ids = set(memory.distinct(edge, "entity_id", {"user_id": user_id}))
+        return ids if entity_ids is None else ids & set(entity_ids)
+    query: Dict[str, Any] = {"user_id": user_id}
+    if entity_ids is not None:
+        query["entity_id"] = {"$in": entity_ids}
+    edges = await db_for("critical")[edge].find(query, {"_id": 0, "entity_id": 1}).to_list(None)
+    return {e["entity_id"] for e in edges}
+
+async def ensure_indexes():
+    """Create the indexes; fold legacy embedded arrays into edges and normalise event dates"""
+    if db is None:
+        return
+    from pymongo import UpdateOne
+    await db.revoked_tokens.create_index([("jti", 1)], unique=True)
+    await db.revoked_tokens.create_index([("revoked_at", 1)])
+    await db.revoked_tokens.create_index([("purge_at", 1)], expireAfterSeconds=0)
+    await db.face_templates.create_index([("user_id", 1)], unique=True)
+    await db.media_uploads.create_index([("user_id", 1), ("media_id", 1)], unique=True)
+    # Same-day check-in rule, and idempotent replay of offline check-ins
+    await db.attendance.create_index([("user_id", 1), ("class_id", 1), ("created_at", 1)])
+    await db.attendance.create_index(
+        [("user_id", 1), ("idempotency_key", 1)],
+        unique=True,
+        partialFilterExpression={"idempotency_key": {"$exists": True}}
+    )
+    await db.chat_history.create_index([("user_id", 1), ("timestamp", -1)])
+    await db.chat_history.create_index([("session_id", 1), ("timestamp", -1)])
+    await db.chat_history.create_index([("expires_at", 1)], expireAfterSeconds=0)
+    # Serves the upcoming/past/date-range listings and the archive job
+    await db.events.create_index([("is_active", 1), ("date", 1)])
+    for edge, (parent, count_field, legacy_field) in MEMBERSHIP_EDGES.items():
+        await db[edge].create_index([("entity_id", 1), ("user_id", 1)], unique=True)
+        await db[edge].create_index([("user_id", 1)])
+
+        async for doc in db[parent].find({legacy_field: {"$exists": True}}, {"_id": 0, "id": 1, legacy_field: 1}):
+            ops = [
+                UpdateOne(
+                    {"entity_id": doc["id"], "user_id": user_id},
+                    {"$setOnInsert": {"joined_at": datetime.now(timezone.utc).isoformat()}},
+                    upsert=True
+                )
+                for user_id in doc.get(legacy_field) or []
+            ]
+            if ops:
+                await db[edge].bulk_write(ops, ordered=False)
+            count = await db[edge].count_documents({"entity_id": doc["id"]})
+            await db[parent].update_one(
+                {"id": doc["id"]},
+                {"$set": {count_field: count}, "$unset": {legacy_field: ""}}
+            )
+    await normalize_event_dates()
+
+async def normalize_event_dates():
+    """Rewrite event dates stored before event_date() (offsets, fractions, BSON dates)
+
+    The listings and the archive job compare dates as strings, which only
+    orders correctly in the fixed-width UTC form.
+    """
+    from pymongo import UpdateOne
+    ops = []
+    async for doc in db.events.find({"date": {"$not": {"$regex": EVENT_DATE_FORMAT}}}, {"_id": 1, "date": 1}):
+        value = doc.get("date")
+        try:
+            if isinstance(value, str):
+                value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            normalized = event_date(value)
+        except (TypeError, ValueError, AttributeError):
+            logger.warning("Event %s has an unreadable date %r", doc["_id"], value)
+            continue
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"date": normalized}}))
+    if ops:
+        await db.events.bulk_write(ops, ordered=False)
+        logger.info("Normalised the dates of %d events", len(ops))
+
 # Models
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -204,6 +836,12 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 class AttendanceRecord(BaseModel):
     model_config = ConfigDict(extra="ignore")
     
@@ -217,10 +855,34 @@ class AttendanceRecord(BaseModel):
     status: str = Field(default="present")  # present, absent, late
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class Location(BaseModel):
+    lat: float = Field(ge=-90, le=90)
+    lng: float = Field(ge=-180, le=180)
+
+# attendance_store.METHODS; the columnar log interns each method into a byte
+AttendanceMethod = Literal["qr_code", "facial_recognition", "manual", "geolocation"]
+
 class AttendanceCreate(BaseModel):
+    class_id: str
+    method: AttendanceMethod
+    location: Optional[Location] = None
+
+class ClassSession(BaseModel):
+    course_id: str
+    issued_at: int = Field(ge=0, lt=10 ** 14)  # epoch milliseconds
+    signature: str  # attendance_sync.session_signature(...), from GET /courses/{id}/qr
+
+class AttendanceSyncItem(BaseModel):
+    idempotency_key: str = Field(min_length=8, max_length=128)  # generated by the device
     class_id: str
     method: str
-    location: Optional[Dict] = None
+    location: Optional[Location] = None
+    session: ClassSession  # the course QR payload scanned in class
+    checked_in_at: datetime  # device time of the check-in
+    signature: str  # hex HMAC-SHA256 of attendance_sync.canonical(...) under the sync key
+
+class AttendanceSyncRequest(BaseModel):
+    checkins: List[AttendanceSyncItem] = Field(max_length=ATTENDANCE_SYNC_MAX_BATCH)
 
 class Course(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -233,9 +895,14 @@ class Course(BaseModel):
     credits: int
     description: Optional[str] = None
     schedule: List[Dict] = []  # [{"day": "Monday", "time": "09:00-10:30", "room": "A101"}]
-    enrolled_students: List[str] = []
+    enrolled_count: int = 0
+    is_enrolled: Optional[bool] = None  # per-caller flag, never stored
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class TimetableCheck(BaseModel):
+    course_ids: List[str] = Field(max_length=100)
+    include_enrolled: bool = True
+
 class CourseCreate(BaseModel):
     name: str
     code: str
@@ -255,9 +922,11 @@ class Event(BaseModel):
     location: str
     category: str  # academic, cultural, sports, workshop
     max_participants: Optional[int] = None
-    registered_users: List[str] = []
+    registered_count: int = 0
+    is_registered: Optional[bool] = None  # per-caller flag, never stored
     is_active: bool = Field(default=True)
-    image_url: Optional[str] = None
+    image_id: Optional[str] = None
+    image_url: Optional[str] = None  # thumbnail of image_id
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class EventCreate(BaseModel):
@@ -267,7 +936,7 @@ class EventCreate(BaseModel):
     location: str
     category: str
     max_participants: Optional[int] = None
-    image_url: Optional[str] = None
+    image_id: Optional[str] = None  # from POST /api/media
 
 class StudyGroup(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -277,13 +946,22 @@ class StudyGroup(BaseModel):
     description: str
     creator_id: str
     course_id: Optional[str] = None
-    members: List[str] = []
+    member_count: int = 0
+    is_member: Optional[bool] = None  # per-caller flag, never stored
     max_members: int = Field(default=10)
     is_active: bool = Field(default=True)
     meeting_link: Optional[str] = None
     schedule: Optional[Dict] = None  # {"day": "Monday", "time": "14:00"}
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class StudyGroupRecommendation(BaseModel):
+    group: StudyGroup
+    score: float
+    course_match: float  # cosine similarity of course profiles
+    schedule_fit: float  # 1 no clash with the caller's classes, 0 clash, 0.5 unknown
+    free_spots: float  # fraction of places left
+    shared_course_ids: List[str]
+
 class StudyGroupCreate(BaseModel):
     name: str
     description: str
@@ -307,10 +985,11 @@ class ChatRequest(BaseModel):
     session_id: Optional[str] = None
 
 # Authentication Routes
-@api_router.post("/auth/register")
+@api_router.post("/auth/register", dependencies=[Depends(limit_by_ip("register_ip"))])
 async def register_user(user_data: UserCreate):
-    # Hash password
-    password_hash = get_password_hash(user_data.password)
+    # Hash password (bcrypt runs off the event loop, a bounded number at a time)
+    with password_gate:
+        password_hash = await run_in_threadpool(get_password_hash, user_data.password)
 
     # Create user object
     user_data.email = user_data.email.lower()
@@ -319,26 +998,21 @@ async def register_user(user_data: UserCreate):
         password_hash=password_hash
     )
 
-    if MEMORY_DB or not db:
+    if MEMORY_DB or db is None:
         # In-memory register
-        if any(u["email"] == user.email for u in users_memory):
+        if not memory.insert_one("users", user.model_dump(), unique=("email",)):
             raise HTTPException(status_code=400, detail="Email already registered")
-        users_memory.append(user.model_dump())
     else:
         # MongoDB register
-        existing_user = await db.users.find_one({"email": user.email})
+        existing_user = await db_for("critical").users.find_one({"email": user.email})
         if existing_user:
             raise HTTPException(status_code=400, detail="Email already registered")
         user_dict = prepare_for_mongo(user.model_dump())
-        await db.users.insert_one(user_dict)
-
-    # Create access token
-    access_token = create_access_token(data={"sub": user.id})
+        await db_for("critical").users.insert_one(user_dict)
 
     return {
         "message": "User registered successfully",
-        "access_token": access_token,
-        "token_type": "bearer",
+        **issue_tokens(user.id),
         "user": {
             "id": user.id,
             "email": user.email,
@@ -347,28 +1021,30 @@ async def register_user(user_data: UserCreate):
         }
     }
 
-@api_router.post("/auth/login")
+@api_router.post("/auth/login", dependencies=[Depends(limit_by_ip("login_ip"))])
 async def login_user(login_data: UserLogin):
-    logging.info(f"Login attempt for email: {login_data.email}")
+    logger.debug("Login attempt for email: %s", login_data.email)
+    login_data.email = login_data.email.lower()
+    # Per-account budget against credential stuffing spread over many IPs
+    rate_limiter.check("login_email", login_data.email)
     try:
-        login_data.email = login_data.email.lower()
-        if MEMORY_DB or not db:
-            user = next((u for u in users_memory if u["email"] == login_data.email), None)
+        if MEMORY_DB or db is None:
+            user = memory.find_one("users", {"email": login_data.email})
         else:
-            user = await db.users.find_one({"email": login_data.email}, {"_id": 0})
+            user = await db_for("critical").users.find_one({"email": login_data.email}, {"_id": 0})
 
-        if not user or not verify_password(login_data.password, user["password_hash"]):
-            logging.warning(f"Invalid login attempt for email: {login_data.email}")
+        password_ok = False
+        if user:
+            with password_gate:
+                password_ok = await run_in_threadpool(verify_password, login_data.password, user["password_hash"])
+        if not password_ok:
+            logger.warning("Invalid login attempt for email: %s", login_data.email)
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
-        # Create access token
-        access_token = create_access_token(data={"sub": user["id"]})
-        
-        logging.info(f"Successful login for email: {login_data.email}")
+        logger.debug("Successful login for email: %s", login_data.email)
 
         return {
-            "access_token": access_token,
-            "token_type": "bearer",
+            **issue_tokens(user["id"]),
             "user": {
                 "id": user["id"],
                 "email": user["email"],
@@ -376,97 +1052,346 @@ async def login_user(login_data: UserLogin):
                 "role": user["role"]
             }
         }
-    except HTTPException:
+    except (HTTPException, Overloaded):
         raise
     except Exception as e:
-        logging.error(f"Error during login for email {login_data.email}: {e}")
+        logger.error("Error during login for email %s: %s", login_data.email, e)
         raise HTTPException(status_code=500, detail="An internal server error occurred.")
 
+@api_router.post("/auth/refresh", dependencies=[Depends(limit_by_ip("refresh_ip"))])
+async def refresh_tokens(refresh_data: RefreshRequest):
+    payload = decode_token(refresh_data.refresh_token, "refresh", allow_revoked=True)
+    # Refresh tokens are single use: revoking the old one is the atomic step
+    # of the rotation. The successor pair is derived from the old jti and the
+    # rotation time, so a second tab presenting the same token within the
+    # grace window gets the identical pair. Later reuse of a rotated token
+    # suggests a leak, so every session of the user ends; a token ended by a
+    # logout is only refused.
+    rotated_at = time.time()
+    if not revocations.is_revoked(payload) and await revoke_token(payload, rotated_at):
+        tokens = issue_tokens(payload["sub"], issued_at=rotated_at, rotated_from=payload.get("jti"))
+    else:
+        rotation = await rotation_record(payload)
+        # Revoked by a logout or a "log out everywhere" cut-off, which may
+        # have come after the rotation and also ended the successor
+        if rotation is None or revocations.is_revoked({"sub": payload["sub"], "iat": rotation["revoked_at"]}):
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+        tokens = rotated_successor(payload, rotation)
+        if tokens is None:
+            logger.warning("Refresh token reuse for user %s, revoking all sessions", payload["sub"])
+            await revoke_all_sessions(payload["sub"])
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+    if await find_user(payload["sub"]) is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return tokens
+
+@api_router.post("/auth/logout")
+async def logout_user(
+    logout_data: Optional[LogoutRequest] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    payload = decode_token(credentials.credentials)
+    await revoke_token(payload)
+    if logout_data and logout_data.refresh_token:
+        try:
+            refresh_payload = decode_token(logout_data.refresh_token, "refresh")
+        except HTTPException:
+            refresh_payload = None  # already expired or revoked
+        if refresh_payload and refresh_payload["sub"] == payload["sub"]:
+            await revoke_token(refresh_payload)
+    return {"message": "Logged out"}
+
+@api_router.post("/auth/logout-all")
+async def logout_all_sessions(current_user: dict = Depends(get_current_user)):
+    await revoke_all_sessions(current_user["id"])
+    return {"message": "All sessions revoked"}
+
 # User Routes
 @api_router.get("/users/me")
 async def get_current_user_info(current_user: dict = Depends(get_current_user)):
     return current_user
 
+@api_router.put("/users/me/profile-image", dependencies=[Depends(limit_by_user("media"))])
+async def set_profile_image(image: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
+    """Upload a profile photo; the user keeps a reference to its thumbnail"""
+    stored = (await ingest_images([image], current_user["id"]))[0]
+    if MEMORY_DB or db is None:
+        memory.update_one("users", {"id": current_user["id"]}, {"profile_image": stored["thumbnail_url"]})
+    else:
+        await db_for("critical").users.update_one(
+            {"id": current_user["id"]}, {"$set": {"profile_image": stored["thumbnail_url"]}}
+        )
+    return stored
+
+# Media Routes
+def get_media_pool():
+    global media_pool
+    if media_pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        media_pool = ProcessPoolExecutor(max_workers=MEDIA_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return media_pool
+
+def media_reference(meta: dict) -> dict:
+    return {
+        "id": meta["id"],
+        "width": meta["width"],
+        "height": meta["height"],
+        "thumbnail_url": media.media_url(meta["id"], media.THUMBNAIL),
+        "url": media.media_url(meta["id"], media.DISPLAY)
+    }
+
+async def count_user_media(user_id: str) -> int:
+    if MEMORY_DB or db is None:
+        return memory.count("media_uploads", {"user_id": user_id})
+    return await db_for("critical").media_uploads.count_documents({"user_id": user_id})
+
+async def record_user_media(user_id: str, media_ids: List[str]) -> None:
+    """Count the images against the uploader's quota; a repeat upload counts once"""
+    uploaded_at = datetime.now(timezone.utc).isoformat()
+    for media_id in dict.fromkeys(media_ids):
+        edge = {"user_id": user_id, "media_id": media_id, "uploaded_at": uploaded_at}
+        if MEMORY_DB or db is None:
+            memory.insert_one("media_uploads", edge, unique=("user_id", "media_id"))
+        else:
+            await db_for("critical").media_uploads.update_one(
+                {"user_id": user_id, "media_id": media_id}, {"$setOnInsert": edge}, upsert=True
+            )
+
+async def ingest_images(uploads: List[UploadFile], user_id: str) -> List[dict]:
+    """Store uploads and render their variants; already known images are reused"""
+    if len(uploads) > MEDIA_MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MEDIA_MAX_BATCH} images per request")
+    if MEDIA_MAX_PER_USER > 0 and await count_user_media(user_id) + len(uploads) > MEDIA_MAX_PER_USER:
+        raise HTTPException(status_code=403, detail=f"Image quota of {MEDIA_MAX_PER_USER} reached")
+    with media_gate:
+        media_ids = []
+        for upload in uploads:
+            try:
+                tmp_path, media_id = await media.save_upload(upload, MEDIA_ROOT, MEDIA_MAX_UPLOAD_BYTES)
+            except media.UploadTooLarge as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            media.store_original(MEDIA_ROOT, tmp_path, media_id)
+            media_ids.append(media_id)
+
+        loop = asyncio.get_running_loop()
+
+        async def render(media_id):
+            meta = media.load_meta(MEDIA_ROOT, media_id)
+            if meta is None:
+                meta = await loop.run_in_executor(get_media_pool(), media.render_variants, MEDIA_ROOT, media_id)
+            return meta
+
+        results = await asyncio.gather(*(render(m) for m in media_ids), return_exceptions=True)
+    # Images stored before another one in the batch failed still count
+    await record_user_media(user_id, [m for m, r in zip(media_ids, results) if not isinstance(r, BaseException)])
+    for upload, result in zip(uploads, results):
+        if isinstance(result, ValueError):
+            raise HTTPException(status_code=400, detail=f"{upload.filename}: {result}")
+        if isinstance(result, BaseException):
+            raise result
+    return [media_reference(meta) for meta in results]
+
+@api_router.post("/media", dependencies=[Depends(limit_by_user("media"))])
+async def upload_media(files: List[UploadFile] = File(...), current_user: dict = Depends(get_current_user)):
+    """Upload one or more images; returns their IDs and variant URLs"""
+    return await ingest_images(files, current_user["id"])
+
+@api_router.get("/media/{media_id}/{variant}")
+async def get_media(media_id: str, variant: str, request: Request):
+    meta = media.load_meta(MEDIA_ROOT, media_id)
+    info = meta and meta["variants"].get(variant)
+    if not info:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = f'"{media_id[:16]}-{variant}"'
+    headers = {"Cache-Control": MEDIA_CACHE_CONTROL, "ETag": etag, "Accept-Ranges": "bytes"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    path = os.path.join(media.media_dir(MEDIA_ROOT, media_id), variant)
+    range_header = request.headers.get("range")
+    if range_header:
+        size = info["bytes"]
+        try:
+            start, end = media.parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        body = await run_in_threadpool(media.read_range, path, start, end)
+        return Response(
+            body,
+            status_code=206,
+            media_type=info["content_type"],
+            headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}"}
+        )
+    return FileResponse(path, media_type=info["content_type"], headers=headers)
+
 # Course Routes
 @api_router.get("/courses", response_model=List[Course])
-async def get_courses():
-    if MEMORY_DB or not db:
+async def get_courses(current_user: Optional[dict] = Depends(get_optional_user)):
+    if MEMORY_DB or db is None:
         # For in-memory, courses are already in the right format, just ensure created_at is datetime
         result = []
-        for course in courses_memory:
-            course_copy = course.copy()
+        for course_copy in memory.find("courses"):
             if isinstance(course_copy.get("created_at"), str):
                 try:
                     course_copy["created_at"] = datetime.fromisoformat(course_copy["created_at"].replace('Z', '+00:00'))
                 except:
                     pass
             result.append(parse_from_mongo(course_copy))
-        return result
     else:
-        courses = await db.courses.find({}, {"_id": 0}).to_list(1000)
-        return [parse_from_mongo(course) for course in courses]
+        courses = await db_for("listing").courses.find({}, {"_id": 0}).to_list(1000)
+        result = [parse_from_mongo(course) for course in courses]
+
+    if current_user:
+        enrolled = await user_entity_ids("course_enrollments", current_user["id"], [c["id"] for c in result])
+        for course in result:
+            course["is_enrolled"] = course["id"] in enrolled
+    return result
+
+async def get_timetable() -> Timetable:
+    global timetable, timetable_built_at
+    if timetable is not None and time.monotonic() - timetable_built_at < TIMETABLE_TTL:
+        return timetable
+    async with timetable_lock:
+        if timetable is None or time.monotonic() - timetable_built_at >= TIMETABLE_TTL:
+            if MEMORY_DB or db is None:
+                courses = memory.find("courses")
+            else:
+                courses = await db_for("critical").courses.find(
+                    {}, {"_id": 0, "id": 1, "code": 1, "name": 1, "instructor_id": 1, "schedule": 1}
+                ).to_list(None)
+            built = Timetable()
+            for course in courses:
+                built.add_course(course)
+            timetable, timetable_built_at = built, time.monotonic()
+    return timetable
 
 @api_router.post("/courses", response_model=Course)
 async def create_course(course_data: CourseCreate, current_user: dict = Depends(get_current_user)):
+    try:
+        slots = parse_schedule(course_data.schedule)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid schedule: {e}")
+    table = await get_timetable()
+    conflicts = table.conflicts(slots, current_user["id"])
+    if conflicts:
+        summary = "; ".join(
+            f"{'room ' + c['resource'] if c['kind'] == 'room' else c['kind']} on {c['day']} {c['start']}-{c['end']}"
+            + (f" ({c['course_code']})" if c["course_code"] else "")
+            for c in conflicts
+        )
+        raise HTTPException(status_code=409, detail=f"Schedule conflicts: {summary}")
+
     course = Course(**course_data.model_dump(), instructor_id=current_user["id"])
-    course_dict = prepare_for_mongo(course.model_dump())
-    
-    if MEMORY_DB or not db:
-        courses_memory.append(course_dict)
-    else:
-        await db.courses.insert_one(course_dict)
-    
+    course_dict = prepare_for_mongo(course.model_dump(exclude={"is_enrolled"}))
+    # Book the slots before awaiting the insert so a concurrent request sees them
+    table.add_course(course_dict, slots)
+    try:
+        if MEMORY_DB or db is None:
+            memory.insert_one("courses", course_dict)
+        else:
+            await db_for("standard").courses.insert_one(course_dict)
+    except Exception:
+        table.remove_course(course.id)
+        raise
+
     return course
 
+@api_router.post("/courses/{course_id}/enroll")
+async def enroll_in_course(course_id: str, current_user: dict = Depends(get_current_user)):
+    if MEMORY_DB or db is None:
+        course = memory.find_one("courses", {"id": course_id})
+    else:
+        course = await db_for("critical").courses.find_one({"id": course_id}, {"_id": 0, "id": 1})
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+
+    outcome, _ = await add_membership("course_enrollments", course_id, current_user["id"])
+    if outcome == "exists":
+        raise HTTPException(status_code=400, detail="Already enrolled in this course")
+    if face_index is not None:
+        face_index.invalidate(course_id)
+
+    return {"message": "Successfully enrolled in course"}
+
+@api_router.get("/courses/{course_id}/students")
+async def get_course_students(
+    course_id: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: dict = Depends(get_current_user)
+):
+    return await list_members("course_enrollments", course_id, skip, limit)
+
 @api_router.get("/courses/{course_id}/qr")
-async def get_course_qr(course_id: str):
-    """Generate QR code data for a course"""
-    if MEMORY_DB or not db:
-        course = next((c for c in courses_memory if c["id"] == course_id), None)
+async def get_course_qr(course_id: str, current_user: dict = Depends(get_current_user)):
+    """Generate QR code data for a course (its instructor or an admin).
+
+    The payload is a class session: the server signs the course and issue
+    time, and offline check-ins synced later must carry it.
+    """
+    if MEMORY_DB or db is None:
+        course = memory.find_one("courses", {"id": course_id})
     else:
-        course = await db.courses.find_one({"id": course_id}, {"_id": 0})
+        course = await db_for("standard").courses.find_one({"id": course_id}, {"_id": 0})
     
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
+    if current_user.get("role") != "admin" and course.get("instructor_id") != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Only the course instructor can open a class session")
     
-    # QR code contains course ID and timestamp for validation
+    now = datetime.now(timezone.utc)
+    issued_at = round(now.timestamp() * 1000)
     qr_data = {
         "course_id": course_id,
         "course_code": course.get("code", ""),
-        "timestamp": datetime.now(timezone.utc).isoformat()
+        "timestamp": now.isoformat(),
+        "issued_at": issued_at,
+        "signature": attendance_sync.session_signature(JWT_SECRET_KEY, course_id, issued_at)
     }
     return {"qr_data": qr_data, "qr_string": json.dumps(qr_data)}
 
+# Timetable Routes
+@api_router.get("/timetable/me")
+async def get_my_timetable(current_user: dict = Depends(get_current_user)):
+    """Weekly slots of the caller's enrolled (and taught) courses, with clashes"""
+    table = await get_timetable()
+    course_ids = list(await user_entity_ids("course_enrollments", current_user["id"]))
+    course_ids += table.taught_by(current_user["id"])
+    return {"slots": table.weekly(course_ids), "clashes": table.clashes(course_ids)}
+
+@api_router.post("/timetable/check")
+async def check_timetable(check: TimetableCheck, current_user: dict = Depends(get_current_user)):
+    """Clashes within a proposed set of courses, by default together with current enrolments"""
+    table = await get_timetable()
+    course_ids = list(dict.fromkeys(check.course_ids))
+    unknown = [course_id for course_id in course_ids if course_id not in table.courses]
+    if check.include_enrolled:
+        course_ids += await user_entity_ids("course_enrollments", current_user["id"])
+    return {"clashes": table.clashes(course_ids), "unknown_course_ids": unknown}
+
 # Attendance Routes
-@api_router.post("/attendance", response_model=AttendanceRecord)
+@api_router.post("/attendance", response_model=AttendanceRecord, dependencies=[Depends(limit_by_user("attendance"))])
 async def mark_attendance(attendance_data: AttendanceCreate, current_user: dict = Depends(get_current_user)):
+    return await record_attendance(current_user, attendance_data)
+
+async def record_attendance(current_user: dict, attendance_data: AttendanceCreate) -> AttendanceRecord:
+    """Store a check-in for the user unless they already have one today"""
     # Check if already marked for today
     today = datetime.now(timezone.utc).date()
     today_start = datetime.combine(today, datetime.min.time()).replace(tzinfo=timezone.utc)
     today_end = datetime.combine(today, datetime.max.time()).replace(tzinfo=timezone.utc)
     
-    if MEMORY_DB or not db:
+    if MEMORY_DB or db is None:
         # In-memory check
-        existing = None
-        for a in attendance_memory:
-            if a["user_id"] == current_user["id"] and a["class_id"] == attendance_data.class_id:
-                try:
-                    created_at = a.get("created_at")
-                    if isinstance(created_at, str):
-                        created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                    elif isinstance(created_at, datetime):
-                        pass
-                    else:
-                        continue
-                    if today_start <= created_at <= today_end:
-                        existing = a
-                        break
-                except:
-                    continue
+        existing = attendance_log.exists_between(
+            current_user["id"], attendance_data.class_id, today_start, today_end
+        )
         if existing:
             raise HTTPException(status_code=400, detail="Attendance already marked for today")
     else:
-        existing = await db.attendance.find_one({
+        existing = await db_for("critical").attendance.find_one({
             "user_id": current_user["id"],
             "class_id": attendance_data.class_id,
             "created_at": {
@@ -485,106 +1410,572 @@ async def mark_attendance(attendance_data: AttendanceCreate, current_user: dict
     
     attendance_dict = prepare_for_mongo(attendance.model_dump())
     
-    if MEMORY_DB or not db:
-        attendance_memory.append(attendance_dict)
+    if MEMORY_DB or db is None:
+        attendance_log.append(attendance_dict)
     else:
-        await db.attendance.insert_one(attendance_dict)
+        await db_for("critical").attendance.insert_one(attendance_dict)
+
+    await hub.publish(f"course:{attendance.class_id}", "attendance.checked_in", {
+        "id": attendance.id,
+        "user_id": attendance.user_id,
+        "full_name": current_user.get("full_name"),
+        "method": attendance.method,
+        "status": attendance.status,
+        "check_in_time": attendance_dict["check_in_time"]
+    })
     
     return attendance
 
+def get_face_index():
+    global face_index
+    if face_index is None:
+        import faces
+        face_index = faces.FaceIndex(ttl=FACE_ROSTER_TTL)
+    return face_index
+
+def get_face_pool():
+    global face_pool
+    if face_pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn rather than fork: the server process already runs threads
+        face_pool = ProcessPoolExecutor(max_workers=FACE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return face_pool
+
+async def face_embedding_from_upload(image: UploadFile) -> List[float]:
+    """Run face extraction for an uploaded photo in the process pool"""
+    import faces
+    if not faces.engine_available():
+        raise HTTPException(status_code=503, detail="Face recognition is not available on this server")
+    data = await image.read(FACE_MAX_UPLOAD_BYTES + 1)
+    if len(data) > FACE_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Image too large")
+    with face_gate:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                get_face_pool(), faces.extract_embedding, data
+            )
+        except faces.NoFaceFound as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+async def course_face_roster(course_id: str):
+    """(user ids, template matrix) for the course's enrolled students"""
+    index = get_face_index()
+    cached = index.get(course_id)
+    if cached is not None:
+        return cached
+    if MEMORY_DB or db is None:
+        user_ids = memory.distinct("course_enrollments", "user_id", {"entity_id": course_id})
+        found = (memory.find_one("face_templates", {"user_id": user_id}) for user_id in user_ids)
+        templates = [(t["user_id"], t["embedding"]) for t in found if t]
+    else:
+        user_ids = await db_for("critical").course_enrollments.distinct("user_id", {"entity_id": course_id})
+        docs = await db_for("critical").face_templates.find(
+            {"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "embedding": 1}
+        ).to_list(None)
+        templates = [(t["user_id"], t["embedding"]) for t in docs]
+    return index.put(course_id, templates)
+
+@api_router.put("/users/me/face")
+async def enroll_face(image: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
+    """Store (or replace) the caller's face template from a photo"""
+    embedding = await face_embedding_from_upload(image)
+    template = {
+        "user_id": current_user["id"],
+        "embedding": embedding,
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+    if MEMORY_DB or db is None:
+        memory.delete_one("face_templates", {"user_id": current_user["id"]})
+        memory.insert_one("face_templates", template)
+    else:
+        await db_for("critical").face_templates.replace_one(
+            {"user_id": current_user["id"]}, template, upsert=True
+        )
+    # The user may be on any number of rosters
+    get_face_index().invalidate()
+    return {"message": "Face template saved"}
+
+@api_router.post("/courses/{course_id}/attendance/face", response_model=AttendanceRecord)
+async def mark_face_attendance(
+    course_id: str,
+    request: Request,
+    image: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """Check in by photo, matched against the course's enrolled students.
+
+    Students can only check themselves in; the course's instructor (or an
+    admin) can run a kiosk that checks in whoever is recognised. A kiosk
+    spends its own, larger budget, and each recognised student their usual
+    attendance budget.
+    """
+    course = await find_course(course_id)
+    if course is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    kiosk = current_user.get("role") == "admin" or (
+        current_user.get("role") == "faculty" and course.get("instructor_id") == current_user["id"]
+    )
+    rate_limiter.check("face_kiosk_user" if kiosk else "attendance_user", current_user["id"])
+    rate_limiter.check("attendance_ip", client_ip(request))
+
+    embedding = await face_embedding_from_upload(image)
+    user_ids, matrix = await course_face_roster(course_id)
+    user_id, similarity = get_face_index().best_match(user_ids, matrix, embedding)
+    if user_id is None or similarity < FACE_MATCH_THRESHOLD:
+        raise HTTPException(status_code=404, detail="Face not recognised for this course")
+
+    if user_id == current_user["id"]:
+        student = current_user
+    elif kiosk:
+        rate_limiter.check("attendance_user", user_id)
+        student = await find_user(user_id)
+        if student is None:
+            raise HTTPException(status_code=404, detail="Face not recognised for this course")
+    else:
+        raise HTTPException(status_code=403, detail="Face does not match the signed-in user")
+
+    return await record_attendance(student, AttendanceCreate(class_id=course_id, method="facial_recognition"))
+
+@api_router.get("/attendance/sync-key")
+async def get_attendance_sync_key(current_user: dict = Depends(get_current_user)):
+    """Key the device signs offline check-ins with; derived, so nothing is stored"""
+    return {"key": attendance_sync.sync_key(JWT_SECRET_KEY, current_user["id"])}
+
+async def stored_sync_keys(user_id: str, keys: List[str]) -> Dict[str, str]:
+    """idempotency key -> id of the record it already created"""
+    if MEMORY_DB or db is None:
+        found = (memory.find_one("attendance_sync_keys", {"key": f"{user_id}:{key}"}) for key in keys)
+        return {doc["key"].split(":", 1)[1]: doc["record_id"] for doc in found if doc}
+    docs = await db_for("critical").attendance.find(
+        {"user_id": user_id, "idempotency_key": {"$in": keys}}, {"_id": 0, "id": 1, "idempotency_key": 1}
+    ).to_list(None)
+    return {doc["idempotency_key"]: doc["id"] for doc in docs}
+
+async def existing_course_ids(course_ids: List[str]) -> set:
+    if MEMORY_DB or db is None:
+        return {course_id for course_id in course_ids if memory.find_one("courses", {"id": course_id})}
+    docs = await db_for("critical").courses.find({"id": {"$in": course_ids}}, {"_id": 0, "id": 1}).to_list(None)
+    return {doc["id"] for doc in docs}
+
+async def checked_in_days(user_id: str, items: List[tuple]) -> set:
+    """(class id, UTC date) pairs among items [(class id, check-in time)] that already have a record"""
+    if MEMORY_DB or db is None:
+        return {
+            (class_id, when.date()) for class_id, when in items
+            if attendance_log.exists_between(user_id, class_id, *attendance_sync.day_bounds(when))
+        }
+    start = attendance_sync.day_bounds(min(when for _, when in items))[0]
+    end = attendance_sync.day_bounds(max(when for _, when in items))[1]
+    docs = await db_for("critical").attendance.find({
+        "user_id": user_id,
+        "class_id": {"$in": list({class_id for class_id, _ in items})},
+        "created_at": {"$gte": start.isoformat(), "$lte": end.isoformat()}
+    }, {"_id": 0, "class_id": 1, "created_at": 1}).to_list(None)
+    return {(doc["class_id"], attendance_sync.as_utc(datetime.fromisoformat(doc["created_at"])).date()) for doc in docs}
+
+@api_router.post("/attendance/sync", dependencies=[Depends(limit_by_user("attendance_sync"))])
+async def sync_attendance(batch: AttendanceSyncRequest, current_user: dict = Depends(get_current_user)):
+    """Apply a device's queue of offline check-ins in one request; safe to replay.
+
+    Each item carries the class session (course QR payload) it was made in
+    and must be for a course the caller is enrolled in. Each result has the
+    item's idempotency_key and a status: created, duplicate (already synced,
+    with the record id), already_marked (another check-in that day), or
+    rejected (with a detail).
+    """
+    user_id = current_user["id"]
+    key = attendance_sync.sync_key(JWT_SECRET_KEY, user_id)
+    now = datetime.now(timezone.utc)
+    results: Dict[str, dict] = {}
+    pending = []
+    for item in batch.checkins:
+        if item.idempotency_key in results:
+            continue
+        checked_in_at = attendance_sync.as_utc(item.checked_in_at)
+        location = item.location.model_dump() if item.location else None
+        message = attendance_sync.canonical(
+            item.idempotency_key, item.class_id, item.method, checked_in_at, location
+        )
+        session = item.session
+        session_opened = datetime.fromtimestamp(session.issued_at / 1000, tz=timezone.utc)
+        detail = None
+        if not attendance_sync.verify(key, message, item.signature):
+            detail = "Invalid signature"
+        elif item.method not in ATTENDANCE_METHODS:
+            detail = "Unsupported attendance method"
+        elif session.course_id != item.class_id or not attendance_sync.verify_session(
+            JWT_SECRET_KEY, session.course_id, session.issued_at, session.signature
+        ):
+            detail = "Invalid class session"
+        elif checked_in_at > now + ATTENDANCE_SYNC_CLOCK_SKEW:
+            detail = "Check-in time is in the future"
+        elif checked_in_at < now - ATTENDANCE_SYNC_MAX_AGE:
+            detail = "Check-in is too old to sync"
+        elif not (
+            session_opened - ATTENDANCE_SYNC_CLOCK_SKEW
+            <= checked_in_at
+            <= session_opened + ATTENDANCE_SESSION_WINDOW + ATTENDANCE_SYNC_CLOCK_SKEW
+        ):
+            detail = "Check-in is outside the class session"
+        results[item.idempotency_key] = {"idempotency_key": item.idempotency_key, "status": "rejected", "detail": detail}
+        if detail is None:
+            pending.append((item, checked_in_at, location))
+
+    if pending:
+        class_ids = list({item.class_id for item, _, _ in pending})
+        known = await existing_course_ids(class_ids)
+        enrolled = await user_entity_ids("course_enrollments", user_id, class_ids)
+        for item, _, _ in pending:
+            if item.class_id not in known:
+                results[item.idempotency_key]["detail"] = "Unknown class"
+            elif item.class_id not in enrolled:
+                results[item.idempotency_key]["detail"] = "Not enrolled in this class"
+        pending = [entry for entry in pending if results[entry[0].idempotency_key]["detail"] is None]
+
+    if pending:
+        stored = await stored_sync_keys(user_id, [item.idempotency_key for item, _, _ in pending])
+        pending = [entry for entry in pending if entry[0].idempotency_key not in stored]
+        for idempotency_key, record_id in stored.items():
+            results[idempotency_key] = {"idempotency_key": idempotency_key, "status": "duplicate", "id": record_id}
+
+    records = []
+    if pending:
+        # One check-in per class per day, counting those earlier in this batch
+        taken = await checked_in_days(user_id, [(item.class_id, when) for item, when, _ in pending])
+        for item, when, location in sorted(pending, key=lambda entry: entry[1]):
+            if (item.class_id, when.date()) in taken:
+                results[item.idempotency_key] = {"idempotency_key": item.idempotency_key, "status": "already_marked"}
+                continue
+            taken.add((item.class_id, when.date()))
+            record = AttendanceRecord(
+                user_id=user_id,
+                class_id=item.class_id,
+                method=item.method,
+                location=location,
+                check_in_time=when,
+                # The same-day rule reads created_at, so it is the check-in time, not arrival
+                created_at=when
+            )
+            record_dict = prepare_for_mongo(record.model_dump())
+            record_dict["idempotency_key"] = item.idempotency_key
+            record_dict["synced_at"] = now.isoformat()
+            records.append(record_dict)
+            results[item.idempotency_key] = {"idempotency_key": item.idempotency_key, "status": "created", "id": record.id}
+
+    created = []
+    if MEMORY_DB or db is None:
+        for record_dict in records:
+            claim = {"key": f"{user_id}:{record_dict['idempotency_key']}", "record_id": record_dict["id"]}
+            if not memory.insert_one("attendance_sync_keys", claim, unique=("key",)):
+                # A concurrent replay of the same queue got there first
+                existing = memory.find_one("attendance_sync_keys", {"key": claim["key"]})
+                results[record_dict["idempotency_key"]] = {
+                    "idempotency_key": record_dict["idempotency_key"], "status": "duplicate", "id": existing["record_id"]
+                }
+                continue
+            try:
+                attendance_log.append(record_dict)
+            except Exception:
+                # Release the key, or every replay would report a record that was never stored
+                memory.delete_one("attendance_sync_keys", {"key": claim["key"]})
+                raise
+            created.append(record_dict)
+    elif records:
+        from pymongo.errors import BulkWriteError
+        try:
+            await db_for("critical").attendance.insert_many(records, ordered=False)
+            created = records
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details["writeErrors"] if error["code"] == 11000}
+            if len(failed) < len(e.details["writeErrors"]):
+                raise
+            created = [record for position, record in enumerate(records) if position not in failed]
+            stored = await stored_sync_keys(user_id, [records[position]["idempotency_key"] for position in failed])
+            for idempotency_key, record_id in stored.items():
+                results[idempotency_key] = {"idempotency_key": idempotency_key, "status": "duplicate", "id": record_id}
+
+    for record_dict in created:
+        await hub.publish(f"course:{record_dict['class_id']}", "attendance.checked_in", {
+            "id": record_dict["id"],
+            "user_id": user_id,
+            "full_name": current_user.get("full_name"),
+            "method": record_dict["method"],
+            "status": record_dict["status"],
+            "check_in_time": record_dict["check_in_time"]
+        })
+    return {"results": [results[item.idempotency_key] for item in batch.checkins]}
+
 @api_router.get("/attendance/my", response_model=List[AttendanceRecord])
 async def get_my_attendance(current_user: dict = Depends(get_current_user)):
-    if MEMORY_DB or not db:
-        records = [a for a in attendance_memory if a["user_id"] == current_user["id"]]
-        return [parse_from_mongo(record) for record in records]
+    if MEMORY_DB or db is None:
+        # Rows come back already typed; only this page is materialised
+        return attendance_log.records_for_user(current_user["id"], limit=1000)
     else:
-        attendance_records = await db.attendance.find(
+        attendance_records = await db_for("critical").attendance.find(
             {"user_id": current_user["id"]}, {"_id": 0}
         ).to_list(1000)
         return [parse_from_mongo(record) for record in attendance_records]
 
 # Event Routes
+async def mark_registered(events: List[dict], current_user: Optional[dict]) -> List[dict]:
+    if current_user:
+        registered = await user_entity_ids("event_registrations", current_user["id"], [e["id"] for e in events])
+        for event in events:
+            event["is_registered"] = event["id"] in registered
+    return events
+
 @api_router.get("/events", response_model=List[Event])
-async def get_events():
-    if MEMORY_DB or not db:
+async def get_events(
+    when: Optional[Literal["upcoming", "past"]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    current_user: Optional[dict] = Depends(get_optional_user)
+):
+    """Events by date: active ones by default, ?when=upcoming|past, and/or ?start=&end="""
+    if MEMORY_DB or db is None:
+        return []
+    now = event_date(datetime.now(timezone.utc))
+    date_range: Dict[str, str] = {}
+    if when == "upcoming":
+        date_range["$gte"] = now
+    elif when == "past":
+        date_range["$lt"] = now
+    if start is not None:
+        date_range["$gte"] = max(date_range.get("$gte", ""), event_date(start))
+    if end is not None:
+        until = event_date(end)
+        date_range["$lt"] = min(date_range.get("$lt", until), until)
+
+    # Past events are usually archived; the $in keeps the (is_active, date) index usable
+    query: Dict[str, Any] = {"is_active": {"$in": [True, False]} if when == "past" else True}
+    if date_range:
+        query["date"] = date_range
+    events = await db_for("listing").events.find(query, {"_id": 0}).sort(
+        "date", -1 if when == "past" else 1
+    ).skip(skip).to_list(limit)
+    return await mark_registered([parse_from_mongo(event) for event in events], current_user)
+
+@api_router.get("/events/this-week", response_model=List[Event])
+async def get_events_this_week(current_user: Optional[dict] = Depends(get_optional_user)):
+    """Active events in the next EVENT_FEED_DAYS days, served from a per-worker cache"""
+    global event_feed, event_feed_built_at
+    if MEMORY_DB or db is None:
         return []
-    events = await db.events.find({"is_active": True}, {"_id": 0}).to_list(1000)
-    return [parse_from_mongo(event) for event in events]
+    if event_feed is None or time.monotonic() - event_feed_built_at > EVENT_FEED_TTL:
+        now = datetime.now(timezone.utc)
+        events = await db_for("listing").events.find(
+            {"is_active": True, "date": {"$gte": event_date(now), "$lt": event_date(now + timedelta(days=EVENT_FEED_DAYS))}},
+            {"_id": 0}
+        ).sort("date", 1).to_list(500)
+        event_feed, event_feed_built_at = events, time.monotonic()
+    # Copies, so per-caller flags never leak into the cached feed
+    events = [parse_from_mongo(dict(event)) for event in event_feed]
+    return await mark_registered(events, current_user)
 
 @api_router.post("/events", response_model=Event)
 async def create_event(event_data: EventCreate, current_user: dict = Depends(get_current_user)):
-    if not db:
+    global event_feed
+    if db is None:
         raise HTTPException(status_code=503, detail="Events store not configured")
-    event = Event(**event_data.model_dump(), organizer_id=current_user["id"])
-    event_dict = prepare_for_mongo(event.model_dump())
-    await db.events.insert_one(event_dict)
+    image_url = None
+    if event_data.image_id:
+        if media.load_meta(MEDIA_ROOT, event_data.image_id) is None:
+            raise HTTPException(status_code=400, detail="Unknown image_id")
+        # Listings only ever carry the thumbnail reference
+        image_url = media.media_url(event_data.image_id, media.THUMBNAIL)
+    event = Event(**event_data.model_dump(), image_url=image_url, organizer_id=current_user["id"])
+    event_dict = prepare_for_mongo(event.model_dump(exclude={"is_registered"}))
+    event_dict["date"] = event_date(event.date)
+    await db_for("standard").events.insert_one(event_dict)
+    event_feed = None
     return event
 
 @api_router.post("/events/{event_id}/register")
 async def register_for_event(event_id: str, current_user: dict = Depends(get_current_user)):
-    if not db:
+    if db is None:
         raise HTTPException(status_code=503, detail="Events store not configured")
-    event = await db.events.find_one({"id": event_id}, {"_id": 0})
+    event = await db_for("critical").events.find_one({"id": event_id}, {"_id": 0, "id": 1, "max_participants": 1})
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
-    if current_user["id"] in event.get("registered_users", []):
+    outcome, registered_count = await add_membership(
+        "event_registrations", event_id, current_user["id"], capacity=event.get("max_participants")
+    )
+    if outcome == "exists":
         raise HTTPException(status_code=400, detail="Already registered for this event")
-    
-    if event.get("max_participants") and len(event.get("registered_users", [])) >= event["max_participants"]:
+    if outcome == "full":
         raise HTTPException(status_code=400, detail="Event is full")
-    
-    await db.events.update_one(
-        {"id": event_id},
-        {"$push": {"registered_users": current_user["id"]}}
-    )
+
+    max_participants = event.get("max_participants")
+    await hub.publish(f"event:{event_id}", "event.registration", {
+        "event_id": event_id,
+        "registered_count": registered_count,
+        "max_participants": max_participants,
+        "seats_left": max(max_participants - registered_count, 0) if max_participants else None
+    })
     
     return {"message": "Successfully registered for event"}
 
+@api_router.get("/events/{event_id}/registrations")
+async def get_event_registrations(
+    event_id: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: dict = Depends(get_current_user)
+):
+    return await list_members("event_registrations", event_id, skip, limit)
+
 # Study Group Routes
 @api_router.get("/study-groups", response_model=List[StudyGroup])
-async def get_study_groups():
-    if MEMORY_DB or not db:
+async def get_study_groups(current_user: Optional[dict] = Depends(get_optional_user)):
+    if MEMORY_DB or db is None:
         return []
-    groups = await db.study_groups.find({"is_active": True}, {"_id": 0}).to_list(1000)
-    return [parse_from_mongo(group) for group in groups]
+    groups = await db_for("listing").study_groups.find({"is_active": True}, {"_id": 0}).to_list(1000)
+    result = [parse_from_mongo(group) for group in groups]
+    if current_user:
+        joined = await user_entity_ids("study_group_members", current_user["id"], [g["id"] for g in result])
+        for group in result:
+            group["is_member"] = group["id"] in joined
+    return result
+
+async def build_group_index():
+    global group_index, group_index_built_at
+    from recommendations import GroupIndex
+    edge_fields = {"_id": 0, "entity_id": 1, "user_id": 1}
+    groups = await db_for("listing").study_groups.find({"is_active": True}, {"_id": 0}).to_list(None)
+    members = await db_for("listing").study_group_members.find({}, edge_fields).to_list(None)
+    enrollments = await db_for("listing").course_enrollments.find({}, edge_fields).to_list(None)
+    group_index = await run_in_threadpool(
+        GroupIndex,
+        groups,
+        [(m["entity_id"], m["user_id"]) for m in members],
+        [(e["entity_id"], e["user_id"]) for e in enrollments]
+    )
+    group_index_built_at = time.monotonic()
+
+async def refresh_group_index():
+    try:
+        async with group_index_lock:
+            await build_group_index()
+    except Exception as e:
+        # Keep serving the previous index; the next request past the TTL retries
+        logger.warning("Rebuilding the study group index failed: %s", e)
+
+async def get_group_index():
+    """Current index; a stale one is returned while a background task replaces it"""
+    global group_index_refresh
+    if group_index is None:
+        async with group_index_lock:
+            if group_index is None:
+                await build_group_index()
+    elif time.monotonic() - group_index_built_at >= RECOMMENDATION_TTL and (
+        group_index_refresh is None or group_index_refresh.done()
+    ):
+        group_index_refresh = asyncio.create_task(refresh_group_index())
+    return group_index
+
+@api_router.get("/study-groups/recommended", response_model=List[StudyGroupRecommendation])
+async def recommend_study_groups(
+    limit: int = Query(10, ge=1, le=50),
+    current_user: dict = Depends(get_current_user)
+):
+    """Open groups ranked by shared courses, fit with the caller's timetable and free places"""
+    if MEMORY_DB or db is None:
+        return []
+    index = await get_group_index()
+    course_ids = await user_entity_ids("course_enrollments", current_user["id"])
+    joined = await user_entity_ids("study_group_members", current_user["id"])
+    table = await get_timetable()
+    busy = [slot for course_id in course_ids if course_id in table.courses for slot in table.courses[course_id]["slots"]]
+    results = index.recommend(list(course_ids), busy, exclude=joined, limit=limit)
+    for result in results:
+        result["group"] = {**parse_from_mongo(dict(result["group"])), "is_member": False}
+    return results
 
 @api_router.post("/study-groups", response_model=StudyGroup)
 async def create_study_group(group_data: StudyGroupCreate, current_user: dict = Depends(get_current_user)):
-    if not db:
+    if db is None:
         raise HTTPException(status_code=503, detail="Study groups store not configured")
     group = StudyGroup(
         **group_data.model_dump(),
-        creator_id=current_user["id"],
-        members=[current_user["id"]]
+        creator_id=current_user["id"]
     )
-    group_dict = prepare_for_mongo(group.model_dump())
-    await db.study_groups.insert_one(group_dict)
+    group_dict = prepare_for_mongo(group.model_dump(exclude={"is_member"}))
+    await db_for("standard").study_groups.insert_one(group_dict)
+    await add_membership("study_group_members", group.id, current_user["id"])
+    group.member_count = 1
+    group.is_member = True
     return group
 
 @api_router.post("/study-groups/{group_id}/join")
 async def join_study_group(group_id: str, current_user: dict = Depends(get_current_user)):
-    if not db:
+    if db is None:
         raise HTTPException(status_code=503, detail="Study groups store not configured")
-    group = await db.study_groups.find_one({"id": group_id}, {"_id": 0})
+    group = await db_for("critical").study_groups.find_one({"id": group_id}, {"_id": 0, "id": 1, "max_members": 1})
     if not group:
         raise HTTPException(status_code=404, detail="Study group not found")
     
-    if current_user["id"] in group.get("members", []):
+    outcome, member_count = await add_membership(
+        "study_group_members", group_id, current_user["id"], capacity=group.get("max_members", 10)
+    )
+    if outcome == "exists":
         raise HTTPException(status_code=400, detail="Already a member of this group")
-    
-    if len(group.get("members", [])) >= group.get("max_members", 10):
+    if outcome == "full":
         raise HTTPException(status_code=400, detail="Study group is full")
-    
-    await db.study_groups.update_one(
-        {"id": group_id},
-        {"$push": {"members": current_user["id"]}}
-    )
+
+    await hub.publish(f"study_group:{group_id}", "study_group.joined", {
+        "group_id": group_id,
+        "user_id": current_user["id"],
+        "member_count": member_count,
+        "max_members": group.get("max_members", 10)
+    })
     
     return {"message": "Successfully joined study group"}
 
+@api_router.get("/study-groups/{group_id}/members")
+async def get_study_group_members(
+    group_id: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: dict = Depends(get_current_user)
+):
+    return await list_members("study_group_members", group_id, skip, limit)
+
 # Campus Helper Bot Routes
-@api_router.post("/chat")
+async def write_chat_turns(docs: List[dict]):
+    await db_for("standard").chat_history.insert_many(docs, ordered=False)
+
+async def session_context(session_id: str, user_id: str) -> List[dict]:
+    """Recent turns of a session, from this worker's buffer or loaded once from storage"""
+    turns = chat_sessions.get(session_id, user_id)
+    if turns is not None:
+        return turns
+    stored = []
+    if db is not None:
+        stored = await db_for("standard").chat_history.find(
+            {"session_id": session_id, "user_id": user_id},
+            {"_id": 0, "expires_at": 0}
+        ).sort("timestamp", -1).limit(CHAT_CONTEXT_TURNS).to_list(CHAT_CONTEXT_TURNS)
+    chat_sessions.load(session_id, user_id, [parse_from_mongo(turn) for turn in reversed(stored)])
+    return chat_sessions.get(session_id, user_id) or []
+
+def record_chat_turn(user_id: str, session_id: str, message: str, response: str):
+    """Buffer the turn for context and queue it for storage; never waits on the database"""
+    record = ChatMessage(user_id=user_id, session_id=session_id, message=message, response=response)
+    chat_sessions.append(session_id, user_id, record.model_dump())
+    if db is not None:
+        chat_dict = prepare_for_mongo(record.model_dump())
+        # Fixed width, so string order is time order
+        chat_dict["timestamp"] = record.timestamp.isoformat(timespec="microseconds")
+        chat_dict["expires_at"] = record.timestamp + timedelta(days=CHAT_HISTORY_RETENTION_DAYS)
+        chat_writer.submit(chat_dict)
+
+@api_router.post("/chat", dependencies=[Depends(limit_by_user("chat"))])
 async def chat_with_bot(chat_request: ChatRequest, current_user: dict = Depends(get_current_user)):
     session_id = chat_request.session_id or str(uuid.uuid4())
     
@@ -605,8 +1996,10 @@ async def chat_with_bot(chat_request: ChatRequest, current_user: dict = Depends(
             return f"Thanks for your message: '{message}'. I'm a campus assistant bot. In development mode, I provide basic responses. For full AI capabilities, please configure the EMERGENT_LLM_KEY. How else can I help you with campus life?"
     
     # Check if Emergent is available and API key is set
-    if not EMERGENT_AVAILABLE or not EMERGENT_LLM_KEY:
+    llm_sdk = load_llm_sdk() if EMERGENT_LLM_KEY else None
+    if llm_sdk is None:
         response = get_mock_response(chat_request.message)
+        record_chat_turn(current_user["id"], session_id, chat_request.message, response)
         return {
             "response": response,
             "session_id": session_id
@@ -623,25 +2016,27 @@ async def chat_with_bot(chat_request: ChatRequest, current_user: dict = Depends(
         6. General campus life questions
         
         Provide helpful, accurate, and friendly responses. Keep responses concise but informative."""
+        if chat_request.session_id:
+            turns = await session_context(session_id, current_user["id"])
+            if turns:
+                system_message += "\n\nConversation so far:\n" + "\n".join(
+                    f"Student: {turn['message']}\nAssistant: {turn['response']}" for turn in turns
+                )
         
+        LlmChat, UserMessage = llm_sdk
         chat = LlmChat(
             api_key=EMERGENT_LLM_KEY,
             session_id=session_id,
             system_message=system_message
         ).with_model("gemini", "gemini-2.5-pro")
         user_message = UserMessage(text=chat_request.message)
-        response = await chat.send_message(user_message)
+        with llm_gate:
+            response = await chat.send_message(user_message)
         
-        if db:
-            chat_record = ChatMessage(
-                user_id=current_user["id"],
-                session_id=session_id,
-                message=chat_request.message,
-                response=response
-            )
-            chat_dict = prepare_for_mongo(chat_record.model_dump())
-            await db.chat_history.insert_one(chat_dict)
+        record_chat_turn(current_user["id"], session_id, chat_request.message, response)
         return {"response": response, "session_id": session_id}
+    except Overloaded:
+        raise
     except Exception as e:
         logging.error(f"Chat error: {str(e)}")
         # Fallback to mock response on error
@@ -649,54 +2044,202 @@ async def chat_with_bot(chat_request: ChatRequest, current_user: dict = Depends(
         return {"response": response, "session_id": session_id}
 
 @api_router.get("/chat/history")
-async def get_chat_history(current_user: dict = Depends(get_current_user)):
-    if not db:
-        return []
-    history = await db.chat_history.find(
-        {"user_id": current_user["id"]}, {"_id": 0}
-    ).sort("timestamp", -1).limit(50).to_list(50)
+async def get_chat_history(
+    session_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_current_user)
+):
+    if db is None:
+        if session_id:
+            return (chat_sessions.get(session_id, current_user["id"]) or [])[::-1][:limit]
+        return chat_sessions.for_user(current_user["id"], limit)
+    query = {"user_id": current_user["id"]}
+    if session_id:
+        query["session_id"] = session_id
+    history = await db_for("standard").chat_history.find(
+        query, {"_id": 0, "expires_at": 0}
+    ).sort("timestamp", -1).limit(limit).to_list(limit)
     return [parse_from_mongo(record) for record in history]
 
 # Dashboard Stats
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
-    if MEMORY_DB or not db:
+    registered_events = await count_user_memberships("event_registrations", current_user["id"])
+    study_groups = await count_user_memberships("study_group_members", current_user["id"])
+    if MEMORY_DB or db is None:
         # In-memory stats
-        attendance_count = len([a for a in attendance_memory if a["user_id"] == current_user["id"]])
-        total_courses = len(courses_memory)
-        # For events and study groups, return 0 in memory mode
-        return {
-            "attendance_records": attendance_count,
-            "registered_events": 0,
-            "study_groups": 0,
-            "total_courses": total_courses
-        }
+        attendance_count = attendance_log.count_for_user(current_user["id"])
+        total_courses = memory.count("courses")
     else:
         # MongoDB stats
-        attendance_count = await db.attendance.count_documents({"user_id": current_user["id"]})
-        registered_events = await db.events.count_documents({
-            "registered_users": {"$in": [current_user["id"]]}
-        })
-        study_groups = await db.study_groups.count_documents({
-            "members": {"$in": [current_user["id"]]}
-        })
-        total_courses = await db.courses.count_documents({})
-        
-        return {
-            "attendance_records": attendance_count,
-            "registered_events": registered_events,
-            "study_groups": study_groups,
-            "total_courses": total_courses
-        }
+        attendance_count = await db_for("listing").attendance.count_documents({"user_id": current_user["id"]})
+        total_courses = await db_for("listing").courses.count_documents({})
+    
+    return {
+        "attendance_records": attendance_count,
+        "registered_events": registered_events,
+        "study_groups": study_groups,
+        "total_courses": total_courses
+    }
+
+# Live Update Routes
+async def authorize_topics(user: dict, topics: Set[str]) -> None:
+    """403 unless the user may follow every topic
+
+    Course topics carry each student's name as they check in, so only the
+    course's instructor (or an admin) may follow them.
+    """
+    if user.get("role") == "admin":
+        return
+    for topic in topics:
+        kind, _, entity_id = topic.partition(":")
+        if kind != "course":
+            continue
+        course = await find_course(entity_id)
+        if course is None or course.get("instructor_id") != user["id"]:
+            raise HTTPException(status_code=403, detail=f"Not allowed to follow {topic}")
+
+def token_usable(payload: dict) -> bool:
+    return payload["exp"] > time.time() and not revocations.is_revoked(payload)
+
+async def token_lapsed(payload: dict) -> None:
+    """Return once the token has expired or been revoked"""
+    while token_usable(payload):
+        await asyncio.sleep(min(REALTIME_AUTH_RECHECK_SECONDS, max(payload["exp"] - time.time(), 0)))
+
+async def open_subscription(token: str, topics: str) -> Tuple[dict, Set[str]]:
+    """Token claims and validated topics for a live connection; raises 400/401/403"""
+    payload = decode_token(token)
+    user = await find_user(payload["sub"])
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    try:
+        topic_set = parse_topics(topics)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await authorize_topics(user, topic_set)
+    return payload, topic_set
+
+@api_router.websocket("/ws")
+async def live_updates_socket(websocket: WebSocket, topics: str, token: str):
+    """Push deltas for e.g. ?topics=course:<id>,event:<id> over a WebSocket"""
+    try:
+        payload, topic_set = await open_subscription(token, topics)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    subscription = hub.subscribe(topic_set)
+
+    async def drain_client():
+        # Nothing is expected from the client; this only notices disconnects
+        while True:
+            await websocket.receive_text()
+
+    reader = asyncio.create_task(drain_client())
+    writer = asyncio.create_task(pump(subscription, websocket.send_text, REALTIME_SEND_TIMEOUT))
+    lapsed = asyncio.create_task(token_lapsed(payload))
+    try:
+        done, _ = await asyncio.wait({reader, writer, lapsed}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        hub.unsubscribe(subscription)
+        reader.cancel()
+        writer.cancel()
+        lapsed.cancel()
+    stalled = writer in done and writer.exception() is not None
+    if reader in done:
+        reader.exception()  # the disconnect itself; nothing left to send to
+    elif lapsed in done:
+        # 1008: policy violation -- reconnect with a fresh token
+        try:
+            await websocket.close(code=1008)
+        except Exception:
+            pass
+    elif subscription.evicted or stalled:
+        # 1013: try again later -- the client fell too far behind
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+@api_router.get("/stream")
+async def live_updates_stream(request: Request, topics: str, token: str):
+    """Server-sent events variant of /ws for clients that cannot open sockets"""
+    claims, topic_set = await open_subscription(token, topics)
+    subscription = hub.subscribe(topic_set)
+
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                if not token_usable(claims):
+                    # The client reconnects with a fresh token
+                    yield "event: expired\ndata: {}\n\n"
+                    return
+                wait = min(SSE_KEEPALIVE_SECONDS, REALTIME_AUTH_RECHECK_SECONDS, max(claims["exp"] - time.time(), 0))
+                try:
+                    payload = await asyncio.wait_for(subscription.get(), timeout=wait)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if payload is None:
+                    yield "event: evicted\ndata: {}\n\n"
+                    return
+                if not token_usable(claims):
+                    continue
+                yield f"data: {payload}\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Root route
 @api_router.get("/")
 async def root():
     return {"message": "Campus Management Platform API", "status": "running"}
 
+@api_router.get("/health")
+async def health():
+    """Readiness probe: pings MongoDB, always ok for the in-memory store"""
+    if db is None:
+        return {"status": "ok", "store": "memory"}
+    if not await check_mongo():
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    return {"status": "ok", "store": "mongo"}
+
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request: Request, exc: RateLimited):
+    metrics.admission_rejections.inc(exc.scope, "rate_limited")
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many requests, please retry later"},
+        headers=retry_after_header(exc.retry_after)
+    )
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    metrics.admission_rejections.inc(exc.scope, "overloaded")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry shortly"},
+        headers=retry_after_header(exc.retry_after)
+    )
+
+# Inside CORS so shed requests still carry CORS headers to the browser
+app.add_middleware(
+    LoadShedMiddleware,
+    max_in_flight=MAX_IN_FLIGHT,
+    exempt=("/metrics", "/api/health"),
+    on_shed=lambda: metrics.admission_rejections.inc("global", "overloaded")
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -705,14 +2248,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so CORS preflights and errors are measured too
+app.add_middleware(
+    metrics.MetricsMiddleware,
+    profile_sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', '0')),
+    profile_hook=metrics.dump_profile_to(os.environ['PROFILE_DIR']) if os.environ.get('PROFILE_DIR') else None
+)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    if client:
-        client.close()
@@ -0,0 +1,223 @@
+"""Weekly timetable engine: room/instructor occupancy and student clashes.
+
+A course schedule slot ``{"day": "Monday", "time": "09:00-10:30", "room":
+"A101"}`` becomes a half-open interval of minutes since Monday 00:00, so
+all comparisons are integer arithmetic. Each room and each instructor has
+an ``IntervalIndex``: intervals sorted by start, where an overlap probe is a
+binary search plus a short backward walk. Occupancy of a room or of one
+instructor is kept conflict-free, so that walk normally stops after a
+single step, and validating a new course costs O(log n) per slot however
+many sections exist.
+
+Student timetables and proposed course sets are checked with a sweep over
+the slots sorted by start, which is O(n log n) in the number of slots.
+"""
+import re
+from bisect import bisect_left
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MINUTES_PER_DAY = 24 * 60
+TIME_RANGE = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*$")
+
+
+class Slot(NamedTuple):
+    start: int  # minutes since Monday 00:00
+    end: int
+    room: str
+
+
+def parse_day(value: str) -> int:
+    day = (value or "").strip().lower()
+    for index, name in enumerate(DAYS):
+        if day == name or (len(day) >= 3 and name.startswith(day)):
+            return index
+    raise ValueError(f"Unknown day {value!r}")
+
+
+def parse_slot(slot: dict) -> Slot:
+    """Slot for one schedule entry; ValueError if it is malformed"""
+    day = parse_day(slot.get("day"))
+    match = TIME_RANGE.match(slot.get("time") or "")
+    if not match:
+        raise ValueError(f"Invalid time {slot.get('time')!r}, expected HH:MM-HH:MM")
+    start_h, start_m, end_h, end_m = (int(part) for part in match.groups())
+    start, end = start_h * 60 + start_m, end_h * 60 + end_m
+    if not (0 <= start < end <= MINUTES_PER_DAY) or start_m > 59 or end_m > 59:
+        raise ValueError(f"Invalid time {slot.get('time')!r}")
+    offset = day * MINUTES_PER_DAY
+    return Slot(offset + start, offset + end, (slot.get("room") or "").strip().upper())
+
+
+def parse_schedule(schedule: Iterable[dict]) -> List[Slot]:
+    return [parse_slot(slot) for slot in schedule or []]
+
+
+def describe(start: int, end: int) -> dict:
+    day, minute = divmod(start, MINUTES_PER_DAY)
+    end_minute = end - day * MINUTES_PER_DAY
+    return {
+        "day": DAYS[day].capitalize(),
+        "start": f"{minute // 60:02d}:{minute % 60:02d}",
+        "end": f"{end_minute // 60:02d}:{end_minute % 60:02d}",
+    }
+
+
+class IntervalIndex:
+    """Half-open intervals of one resource, sorted by start"""
+
+    def __init__(self):
+        self._starts: List[int] = []
+        self._items: List[Tuple[int, int, str]] = []  # (start, end, owner)
+        self._max_length = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, start: int, end: int, owner: str) -> None:
+        index = bisect_left(self._starts, start)
+        self._starts.insert(index, start)
+        self._items.insert(index, (start, end, owner))
+        self._max_length = max(self._max_length, end - start)
+
+    def remove_owner(self, owner: str) -> None:
+        kept = [item for item in self._items if item[2] != owner]
+        self._items = kept
+        self._starts = [item[0] for item in kept]
+
+    def overlapping(self, start: int, end: int) -> List[Tuple[int, int, str]]:
+        """Intervals sharing at least one minute with [start, end)"""
+        found = []
+        # Candidates start before `end`; none starting before start - max_length can reach `start`
+        index = bisect_left(self._starts, end) - 1
+        floor = start - self._max_length
+        while index >= 0 and self._starts[index] > floor:
+            item = self._items[index]
+            if item[1] > start:
+                found.append(item)
+            index -= 1
+        return found
+
+
+class Timetable:
+    """Room and instructor occupancy for every course with a schedule"""
+
+    def __init__(self):
+        self.courses: Dict[str, dict] = {}
+        self.rooms: Dict[str, IntervalIndex] = {}
+        self.instructors: Dict[str, IntervalIndex] = {}
+
+    def add_course(self, course: dict, slots: Optional[List[Slot]] = None) -> None:
+        """Index a course; stored courses with malformed slots keep the valid ones"""
+        if slots is None:
+            slots = []
+            for raw in course.get("schedule") or []:
+                try:
+                    slots.append(parse_slot(raw))
+                except ValueError:
+                    continue
+        course_id = course["id"]
+        self.courses[course_id] = {
+            "id": course_id,
+            "code": course.get("code"),
+            "name": course.get("name"),
+            "instructor_id": course.get("instructor_id"),
+            "slots": slots,
+        }
+        for slot in slots:
+            if slot.room:
+                self.rooms.setdefault(slot.room, IntervalIndex()).add(slot.start, slot.end, course_id)
+            if course.get("instructor_id"):
+                self.instructors.setdefault(course["instructor_id"], IntervalIndex()).add(slot.start, slot.end, course_id)
+
+    def remove_course(self, course_id: str) -> None:
+        course = self.courses.pop(course_id, None)
+        if course is None:
+            return
+        for slot in course["slots"]:
+            if slot.room in self.rooms:
+                self.rooms[slot.room].remove_owner(course_id)
+        if course["instructor_id"] in self.instructors:
+            self.instructors[course["instructor_id"]].remove_owner(course_id)
+
+    def taught_by(self, instructor_id: str) -> List[str]:
+        index = self.instructors.get(instructor_id)
+        return list(dict.fromkeys(owner for _, _, owner in index._items)) if index else []
+
+    def conflicts(self, slots: List[Slot], instructor_id: Optional[str]) -> List[dict]:
+        """Room or instructor double-bookings a new course with `slots` would cause"""
+        found = []
+        for slot in slots:
+            probes = []
+            if slot.room and slot.room in self.rooms:
+                probes.append(("room", slot.room, self.rooms[slot.room]))
+            if instructor_id and instructor_id in self.instructors:
+                probes.append(("instructor", instructor_id, self.instructors[instructor_id]))
+            for kind, resource, index in probes:
+                for start, end, owner in index.overlapping(slot.start, slot.end):
+                    found.append({
+                        "kind": kind,
+                        "resource": resource,
+                        "course_id": owner,
+                        "course_code": self.courses[owner]["code"],
+                        **describe(max(start, slot.start), min(end, slot.end)),
+                    })
+        # Two slots of the new schedule overlapping each other clash as well
+        for (first, _), (second, _), start, end in _sweep_owned([(slot, None) for slot in slots]):
+            found.append({
+                "kind": "schedule",
+                "resource": first.room or second.room,
+                "course_id": None,
+                "course_code": None,
+                **describe(start, end),
+            })
+        return found
+
+    def weekly(self, course_ids: Iterable[str]) -> List[dict]:
+        """Slots of the given courses in week order"""
+        entries = []
+        for course_id in course_ids:
+            course = self.courses.get(course_id)
+            if course is None:
+                continue
+            for slot in course["slots"]:
+                entries.append((slot.start, {
+                    "course_id": course_id,
+                    "course_code": course["code"],
+                    "course_name": course["name"],
+                    "room": slot.room,
+                    **describe(slot.start, slot.end),
+                }))
+        entries.sort(key=lambda entry: entry[0])
+        return [entry for _, entry in entries]
+
+    def clashes(self, course_ids: Iterable[str]) -> List[dict]:
+        """Pairs of the given courses whose slots overlap"""
+        tagged = []
+        for course_id in dict.fromkeys(course_ids):
+            course = self.courses.get(course_id)
+            if course is not None:
+                tagged.extend((slot, course_id) for slot in course["slots"])
+        found = []
+        for (_, first), (_, second), start, end in _sweep_owned(tagged):
+            if first == second:
+                continue
+            found.append({
+                "course_ids": [first, second],
+                "course_codes": [self.courses[first]["code"], self.courses[second]["code"]],
+                **describe(start, end),
+            })
+        return found
+
+
+def _sweep_owned(tagged: List[Tuple[Slot, Optional[str]]]):
+    """Yield ((slot, owner), (slot, owner), overlap start, overlap end) for every overlap"""
+    tagged = sorted(tagged, key=lambda item: item[0].start)
+    active: List[Tuple[Slot, Optional[str]]] = []
+    for item in tagged:
+        slot = item[0]
+        active = [other for other in active if other[0].end > slot.start]
+        for other in active:
+            yield other, item, slot.start, min(other[0].end, slot.end)
+        active.append(item)
+
@@ -0,0 +1,267 @@
+"""Load test / benchmark for the API hot paths.
+
+Drives the FastAPI app in-process through httpx's ASGI transport (default) or
+a running server (``--url``) with concurrent async clients, and reports
+p50/p95/p99 latency and requests per second per scenario. Only 2xx answers
+count as successes; 4xx and 5xx answers (and transport failures, counted
+as 5xx) are reported separately, so auth failures or rate limiting show up
+instead of passing as fast successes.
+
+    python backend_bench.py                              # in-process, MEMORY_DB
+    python backend_bench.py --store mongo                # in-process, MONGO_URL/DB_NAME
+    python backend_bench.py --store mongomock            # in-process, mongomock-motor stand-in
+    python backend_bench.py --url http://localhost:8000/api
+    python backend_bench.py --save-baseline bench.json   # record a baseline
+    python backend_bench.py --compare bench.json         # exit 1 on regression
+
+The chat scenario uses a stub LLM with a fixed delay, so it measures our own
+overhead rather than the upstream model.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+
+
+class StubUserMessage:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubLlmChat:
+    """Stands in for emergentintegrations' LlmChat with a fixed upstream delay"""
+    delay = 0.05
+
+    def __init__(self, api_key=None, session_id=None, system_message=None):
+        self.session_id = session_id
+
+    def with_model(self, provider, model):
+        return self
+
+    async def send_message(self, message):
+        await asyncio.sleep(self.delay)
+        return f"stub reply to: {message.text[:40]}"
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class CampusAPIBenchmark:
+    def __init__(self, client, users=20, concurrency=20, requests_per_scenario=500):
+        self.client = client
+        self.users = users
+        self.concurrency = concurrency
+        self.requests_per_scenario = requests_per_scenario
+        self.password = "BenchPass123!"
+        self.accounts = []  # [(email, headers)]
+        self.course_ids = []
+        self.results = {}
+
+    async def setup(self):
+        """Register users and make sure there are courses to check in to"""
+        run_id = uuid.uuid4().hex[:8]
+        for i in range(self.users):
+            email = f"bench_{run_id}_{i}@campus-bench.com"
+            response = await self.client.post("/auth/register", json={
+                "email": email,
+                "password": self.password,
+                "full_name": f"Bench User {i}",
+                "role": "faculty" if i == 0 else "student"
+            })
+            response.raise_for_status()
+            token = response.json()["access_token"]
+            self.accounts.append((email, {"Authorization": f"Bearer {token}"}))
+
+        response = await self.client.get("/courses")
+        response.raise_for_status()
+        self.course_ids = [c["id"] for c in response.json()]
+        while len(self.course_ids) < 4:
+            response = await self.client.post("/courses", headers=self.accounts[0][1], json={
+                "name": f"Bench Course {len(self.course_ids)}",
+                "code": f"BENCH{run_id}{len(self.course_ids)}",
+                "department": "Benchmarking",
+                "credits": 3
+            })
+            response.raise_for_status()
+            self.course_ids.append(response.json()["id"])
+
+    async def run_scenario(self, name, make_request, total):
+        """Fire `total` requests from `concurrency` workers and record latencies"""
+        latencies = []
+        failures = {"4xx": 0, "5xx": 0}
+        counter = iter(range(total))
+
+        async def worker():
+            for i in counter:
+                started = time.perf_counter()
+                try:
+                    status_code = (await make_request(i)).status_code
+                except httpx.HTTPError:
+                    status_code = None
+                latencies.append(time.perf_counter() - started)
+                if status_code is None or status_code >= 500:
+                    failures["5xx"] += 1
+                elif not 200 <= status_code < 300:
+                    failures["4xx"] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, total))))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        self.results[name] = {
+            "requests": total,
+            "errors": failures["4xx"] + failures["5xx"],
+            "4xx": failures["4xx"],
+            "5xx": failures["5xx"],
+            "rps": round(total / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0
+        }
+        print(f"{name:<18} {self.results[name]}")
+
+    async def run_all(self):
+        await self.setup()
+        n = self.requests_per_scenario
+        accounts = self.accounts
+
+        def headers(i):
+            return accounts[i % len(accounts)][1]
+
+        # bcrypt dominates login, so it gets a smaller request budget
+        await self.run_scenario("login", lambda i: self.client.post("/auth/login", json={
+            "email": accounts[i % len(accounts)][0], "password": self.password
+        }), max(n // 10, self.concurrency))
+
+        # Check-in storm: every user hits every course once (one mark per day)
+        pairs = [(a, c) for a in range(len(accounts)) for c in self.course_ids]
+        await self.run_scenario("attendance_storm", lambda i: self.client.post(
+            "/attendance", headers=accounts[pairs[i][0]][1],
+            json={"class_id": pairs[i][1], "method": "qr_code"}
+        ), len(pairs))
+
+        await self.run_scenario("dashboard_stats", lambda i: self.client.get(
+            "/dashboard/stats", headers=headers(i)), n)
+        await self.run_scenario("courses", lambda i: self.client.get("/courses", headers=headers(i)), n)
+        await self.run_scenario("chat", lambda i: self.client.post(
+            "/chat", headers=headers(i), json={"message": f"When is my next course? #{i}"}
+        ), n)
+        return self.results
+
+
+def compare(results, baseline, tolerance):
+    """Scenarios that fail more often, or whose p95 grew or throughput dropped beyond tolerance"""
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if not current:
+            continue
+        if current["errors"] > base.get("errors", 0):
+            regressions.append(f"{name}: errors {base.get('errors', 0)} -> {current['errors']}")
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {base['rps']} -> {current['rps']}")
+    return regressions
+
+
+def load_app(store):
+    """Import server.py configured for the requested store, with the LLM stubbed"""
+    if store == "memory":
+        os.environ["MEMORY_DB"] = "1"
+    else:
+        os.environ["MEMORY_DB"] = "0"
+        os.environ.setdefault("DB_NAME", "campus_bench")
+        if store == "mongo" and not os.environ.get("MONGO_URL"):
+            sys.exit("--store mongo needs MONGO_URL pointing at a local mongod")
+    # Measure the handlers, not the admission limits (export these to include them)
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+    os.environ.setdefault("AUTH_MAX_CONCURRENCY", "0")
+    os.environ.setdefault("CHAT_MAX_CONCURRENCY", "0")
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+
+    # server.py logs at INFO, which includes one httpx line per request
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if store == "mongomock":
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("--store mongomock needs `pip install mongomock-motor`")
+        server.MEMORY_DB = False
+        # Picked up by the lifespan hook instead of connecting to a real mongod
+        server.db = AsyncMongoMockClient()[os.environ["DB_NAME"]]
+
+    server.EMERGENT_LLM_KEY = "bench"
+    server._llm_sdk = (StubLlmChat, StubUserMessage)
+    return server.app
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the campus API hot paths")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--store", choices=["memory", "mongo", "mongomock"], default="memory")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--llm-delay", type=float, default=0.05, help="stub LLM latency in seconds")
+    parser.add_argument("--save-baseline", help="write results to this JSON file")
+    parser.add_argument("--compare", help="compare against this baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression ratio")
+    args = parser.parse_args()
+    StubLlmChat.delay = args.llm_delay
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url.rstrip("/"), limits=limits, timeout=30)
+        lifespan = None
+    else:
+        app = load_app(args.store)
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench/api", timeout=30
+        )
+        lifespan = app.router.lifespan_context(app)
+
+    async with client:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        try:
+            bench = CampusAPIBenchmark(client, args.users, args.concurrency, args.requests)
+            results = await bench.run_all()
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(results, indent=2))
+        print(f"Baseline written to {args.save_baseline}")
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.tolerance)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,130 @@
+// Offline-first attendance for the static check-in pages.
+//
+// Check-ins are signed with the per-user sync key (GET /attendance/sync-key)
+// and queued in localStorage with a random idempotency key, then posted in
+// one batch to /attendance/sync whenever the device is online. Replaying the
+// same queue is safe: the server answers "duplicate" for keys it has seen.
+// Each check-in carries the class session it was made in: the server-signed
+// payload of the course QR code (GET /courses/{id}/qr).
+//
+// Devices can be shared, so the queue, the cached sync key and the list of
+// rejected check-ins are all stored per user id; the SPA drops the cached
+// key on logout (App.js). Needs auth-fetch.js loaded first.
+(function () {
+  const { authorizedFetch, currentUserId } = window.campusAuth;
+  // Outcomes after which a check-in never needs sending again
+  const SETTLED = new Set(['created', 'duplicate', 'already_marked']);
+
+  const queueKey = (userId) => `attendanceQueue:${userId}`;
+  const rejectedKey = (userId) => `attendanceRejected:${userId}`;
+  const syncKeyKey = (userId) => `attendanceSyncKey:${userId}`;
+  const load = (key) => JSON.parse(localStorage.getItem(key) || '[]');
+  const save = (key, entries) => localStorage.setItem(key, JSON.stringify(entries));
+
+  // Written by earlier versions for whoever was signed in at the time
+  localStorage.removeItem('attendanceSyncKey');
+
+  async function syncKey(userId) {
+    let key = localStorage.getItem(syncKeyKey(userId));
+    if (!key) {
+      const response = await authorizedFetch('/attendance/sync-key');
+      if (!response.ok) throw new Error('No sync key yet; go online once while signed in');
+      key = (await response.json()).key;
+      localStorage.setItem(syncKeyKey(userId), key);
+    }
+    return key;
+  }
+
+  async function sign(key, fields) {
+    const encoder = new TextEncoder();
+    const cryptoKey = await crypto.subtle.importKey(
+      'raw', encoder.encode(key), { name: 'HMAC', hash: 'SHA-256' }, false, ['sign']
+    );
+    const signature = await crypto.subtle.sign('HMAC', cryptoKey, encoder.encode(fields.join('\n')));
+    return Array.from(new Uint8Array(signature), (byte) => byte.toString(16).padStart(2, '0')).join('');
+  }
+
+  // The class session in a scanned QR payload, or null if it is not one
+  function parseSession(text) {
+    try {
+      const { course_id: courseId, issued_at: issuedAt, signature } = JSON.parse(text);
+      if (courseId && Number.isInteger(issuedAt) && signature) {
+        return { course_id: courseId, issued_at: issuedAt, signature };
+      }
+    } catch (error) {
+      // not JSON
+    }
+    return null;
+  }
+
+  // Queue a check-in for a class session now (device time) and try to send the queue
+  async function checkIn(session, method, location) {
+    const userId = currentUserId();
+    if (!userId) throw new Error('Sign in to check in');
+    const key = await syncKey(userId);
+    const classId = session.course_id;
+    const idempotencyKey = crypto.randomUUID();
+    const checkedInAt = Date.now();
+    const lat = location ? String(location.lat) : '';
+    const lng = location ? String(location.lng) : '';
+    const queue = load(queueKey(userId));
+    queue.push({
+      idempotency_key: idempotencyKey,
+      class_id: classId,
+      method,
+      location: location || null,
+      session,
+      checked_in_at: new Date(checkedInAt).toISOString(),
+      signature: await sign(key, [idempotencyKey, classId, method, String(checkedInAt), lat, lng])
+    });
+    save(queueKey(userId), queue);
+    return flush();
+  }
+
+  // Send the signed-in user's queued check-ins. Settled entries leave the
+  // queue; rejected ones move to the rejected list for the page to show.
+  async function flush() {
+    const userId = currentUserId();
+    if (!userId) return [];
+    const queue = load(queueKey(userId));
+    if (!queue.length || !navigator.onLine) return [];
+    let response;
+    try {
+      response = await authorizedFetch('/attendance/sync', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ checkins: queue.slice(0, 200) })
+      });
+    } catch (error) {
+      return [];  // still offline; the queue is kept
+    }
+    if (!response.ok) return [];
+    const { results } = await response.json();
+    const outcomes = new Map(results.map((result) => [result.idempotency_key, result]));
+    const remaining = [];
+    const rejected = load(rejectedKey(userId));
+    for (const entry of load(queueKey(userId))) {
+      const result = outcomes.get(entry.idempotency_key);
+      if (result && result.status === 'rejected') {
+        rejected.push({ ...entry, detail: result.detail });
+      } else if (!result || !SETTLED.has(result.status)) {
+        remaining.push(entry);
+      }
+    }
+    save(queueKey(userId), remaining);
+    save(rejectedKey(userId), rejected);
+    return results;
+  }
+
+  const pending = () => {
+    const userId = currentUserId();
+    return userId ? load(queueKey(userId)).length : 0;
+  };
+  const rejected = () => {
+    const userId = currentUserId();
+    return userId ? load(rejectedKey(userId)) : [];
+  };
+
+  window.addEventListener('online', flush);
+  window.attendanceQueue = { checkIn, flush, parseSession, pending, rejected };
+})();
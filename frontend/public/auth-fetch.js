@@ -0,0 +1,61 @@
+// Authenticated fetch for the static pages (qr.html, location.html,
+// face.html), which run outside the SPA but share its stored tokens.
+//
+// Access tokens only last ACCESS_TOKEN_MINUTES, so a 401 trades the refresh
+// token for a new pair once and the request is replayed.
+(function () {
+  const params = new URLSearchParams(window.location.search);
+  const apiBase = params.get('api') || '/api';
+
+  // Same lock as the SPA (src/lib/axiosConfig.js): only one tab presents a
+  // refresh token at a time, and a tab that waited reuses the stored result
+  async function refreshTokens(staleToken) {
+    const refresh = async () => {
+      const current = localStorage.getItem('token');
+      if (current && current !== staleToken) return true;
+      const refreshToken = localStorage.getItem('refresh_token');
+      if (!refreshToken) return false;
+      const response = await fetch(`${apiBase}/auth/refresh`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ refresh_token: refreshToken })
+      });
+      if (!response.ok) return false;
+      const data = await response.json();
+      localStorage.setItem('token', data.access_token);
+      localStorage.setItem('refresh_token', data.refresh_token);
+      return true;
+    };
+    return navigator.locks ? navigator.locks.request('campus-token-refresh', refresh) : refresh();
+  }
+
+  // fetch with the stored access token, refreshing it once on a 401
+  async function authorizedFetch(path, options = {}) {
+    let sentWith = null;
+    const send = () => {
+      sentWith = localStorage.getItem('token');
+      return fetch(`${apiBase}${path}`, {
+        ...options,
+        headers: { ...(options.headers || {}), Authorization: `Bearer ${sentWith}` }
+      });
+    };
+    let response = await send();
+    if (response.status === 401 && await refreshTokens(sentWith)) {
+      response = await send();
+    }
+    return response;
+  }
+
+  // The signed-in user's id (the access token's sub claim), or null
+  function currentUserId() {
+    const token = localStorage.getItem('token');
+    try {
+      const payload = JSON.parse(atob(token.split('.')[1].replace(/-/g, '+').replace(/_/g, '/')));
+      return payload.sub || null;
+    } catch (error) {
+      return null;
+    }
+  }
+
+  window.campusAuth = { apiBase, authorizedFetch, currentUserId };
+})();
@@ -43,20 +43,36 @@ function App() {
     } catch (error) {
       console.error('Error fetching user info:', error);
       localStorage.removeItem('token');
+      localStorage.removeItem('refresh_token');
       delete api.defaults.headers.common['Authorization'];
     } finally {
       setLoading(false);
     }
   };
 
-  const handleLogin = (userData, token) => {
+  const handleLogin = (userData, token, refreshToken) => {
     localStorage.setItem('token', token);
+    if (refreshToken) {
+      localStorage.setItem('refresh_token', refreshToken);
+    }
     api.defaults.headers.common['Authorization'] = `Bearer ${token}`;
     setUser(userData);
   };
 
   const handleLogout = () => {
+    // Revoke both tokens server-side; the local logout doesn't wait for it
+    api.post(
+      '/auth/logout',
+      { refresh_token: localStorage.getItem('refresh_token') },
+      { headers: { Authorization: `Bearer ${localStorage.getItem('token')}` } }
+    ).catch(() => {});
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
+    // The offline check-in pages cache a signing key per user (attendance-queue.js);
+    // queued check-ins stay and are sent when the user signs in again
+    if (user) {
+      localStorage.removeItem(`attendanceSyncKey:${user.id}`);
+    }
     delete api.defaults.headers.common['Authorization'];
     setUser(null);
   };
@@ -173,7 +173,7 @@ const Courses = ({ user }) => {
                                     <div className="flex items-center space-x-2 text-gray-600">
                                         <Users className="w-4 h-4" />
                                         <span className="text-sm">
-                                            {course.enrolled_students?.length || 0} students enrolled
+                                            {course.enrolled_count || 0} students enrolled
                                         </span>
                                     </div>
 
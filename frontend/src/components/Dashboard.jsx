@@ -26,7 +26,7 @@ const Dashboard = ({ user }) => {
         try {
             const [statsResponse, eventsResponse, groupsResponse] = await Promise.all([
                 api.get('/dashboard/stats'),
-                api.get('/events'),
+                api.get('/events/this-week'),
                 api.get('/study-groups')
             ]);
 
@@ -247,7 +247,7 @@ const Dashboard = ({ user }) => {
                                             <h4 className="font-semibold text-gray-900">{group.name}</h4>
                                             <p className="text-gray-600 text-sm mt-1 line-clamp-2">{group.description}</p>
                                             <p className="text-gray-500 text-xs mt-2">
-                                                {group.members?.length || 0} members
+                                                {group.member_count || 0} members
                                             </p>
                                         </div>
                                     </div>
@@ -10,7 +10,7 @@ import {
     Tag,
     User
 } from 'lucide-react';
-import api from '../lib/axiosConfig';
+import api, { assetUrl, freshAccessToken } from '../lib/axiosConfig';
 
 const Events = ({ user }) => {
     const [events, setEvents] = useState([]);
@@ -32,9 +32,62 @@ const Events = ({ user }) => {
         fetchEvents();
     }, []);
 
+    // Live seat counts: one SSE stream covering the listed events. The
+    // token in the URL is short-lived and the server ends the stream when it
+    // expires, so every reconnect opens a new stream with a fresh token.
+    const eventIds = events.slice(0, 50).map((event) => event.id).join(',');
+    useEffect(() => {
+        if (!localStorage.getItem('token') || !eventIds) return undefined;
+        const topics = eventIds.split(',').map((id) => `event:${id}`).join(',');
+        let source = null;
+        let retryTimer = null;
+        let closed = false;
+        let failures = 0;
+
+        const connect = async () => {
+            let token;
+            try {
+                token = await freshAccessToken();
+            } catch (error) {
+                token = null;
+            }
+            if (closed || !token) return;
+            source = new EventSource(
+                `${api.defaults.baseURL}/stream?topics=${encodeURIComponent(topics)}&token=${encodeURIComponent(token)}`
+            );
+            source.onopen = () => {
+                failures = 0;
+            };
+            source.onmessage = (message) => {
+                const { type, data } = JSON.parse(message.data);
+                if (type !== 'event.registration') return;
+                setEvents((prev) => prev.map((event) => (
+                    event.id === data.event_id ? { ...event, registered_count: data.registered_count } : event
+                )));
+            };
+            source.addEventListener('expired', () => {
+                // The server ends the stream once the token lapses; reconnect with a fresh one
+                source.close();
+                connect();
+            });
+            source.onerror = () => {
+                source.close();
+                failures += 1;
+                retryTimer = setTimeout(connect, Math.min(30000, 1000 * 2 ** Math.min(failures, 5)));
+            };
+        };
+
+        connect();
+        return () => {
+            closed = true;
+            clearTimeout(retryTimer);
+            if (source) source.close();
+        };
+    }, [eventIds]);
+
     const fetchEvents = async () => {
         try {
-            const response = await api.get('/events');
+            const response = await api.get('/events', { params: { when: 'upcoming' } });
             setEvents(response.data);
         } catch (error) {
             console.error('Error fetching events:', error);
@@ -158,9 +211,9 @@ const Events = ({ user }) => {
                 <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6" data-testid="events-grid">
                     {filteredEvents.length > 0 ? (
                         filteredEvents.map((event) => {
-                            const isRegistered = event.registered_users?.includes(user.id);
+                            const isRegistered = event.is_registered;
                             const isFull = event.max_participants &&
-                                event.registered_users?.length >= event.max_participants;
+                                event.registered_count >= event.max_participants;
 
                             return (
                                 <div
@@ -172,8 +225,9 @@ const Events = ({ user }) => {
                                     <div className="h-48 bg-gradient-to-br from-indigo-400 to-purple-600 relative">
                                         {event.image_url ? (
                                             <img
-                                                src={event.image_url}
+                                                src={assetUrl(event.image_url)}
                                                 alt={event.title}
+                                                loading="lazy"
                                                 className="w-full h-full object-cover"
                                             />
                                         ) : (
@@ -216,7 +270,7 @@ const Events = ({ user }) => {
                                             <div className="flex items-center space-x-2 text-gray-600">
                                                 <Users className="w-4 h-4" />
                                                 <span className="text-sm">
-                                                    {event.registered_users?.length || 0}
+                                                    {event.registered_count || 0}
                                                     {event.max_participants && ` / ${event.max_participants}`} registered
                                                 </span>
                                             </div>
@@ -89,7 +89,7 @@ const Login = ({ onLogin }) => {
             const response = await axios.post(endpoint, data);
 
             if (response.data.access_token) {
-                onLogin(response.data.user, response.data.access_token);
+                onLogin(response.data.user, response.data.access_token, response.data.refresh_token);
             }
         } catch (error) {
             const data = error.response?.data;
@@ -108,7 +108,7 @@ const Login = ({ onLogin }) => {
                     await axios.post('/auth/register', fallback);
                     const loginRes = await axios.post('/auth/login', { email: formData.email, password: formData.password });
                     if (loginRes.data.access_token) {
-                        onLogin(loginRes.data.user, loginRes.data.access_token);
+                        onLogin(loginRes.data.user, loginRes.data.access_token, loginRes.data.refresh_token);
                         setErrors({});
                         return;
                     }
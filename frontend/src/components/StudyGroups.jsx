@@ -158,8 +158,8 @@ const StudyGroups = ({ user }) => {
                 <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6" data-testid="study-groups-grid">
                     {filteredGroups.length > 0 ? (
                         filteredGroups.map((group) => {
-                            const isMember = group.members?.includes(user.id);
-                            const isFull = group.members?.length >= group.max_members;
+                            const isMember = group.is_member;
+                            const isFull = group.member_count >= group.max_members;
                             const course = courses.find(c => c.id === group.course_id);
 
                             return (
@@ -203,7 +203,7 @@ const StudyGroups = ({ user }) => {
                                         <div className="flex items-center space-x-2 text-gray-600">
                                             <User className="w-4 h-4" />
                                             <span className="text-sm">
-                                                {group.members?.length || 0} / {group.max_members} members
+                                                {group.member_count || 0} / {group.max_members} members
                                             </span>
                                         </div>
 
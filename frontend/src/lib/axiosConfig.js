@@ -5,6 +5,9 @@ const baseURL = `${backendUrl}/api`;
 
 console.log('Axios config - Backend URL:', backendUrl, 'Base URL:', baseURL);
 
+// Uploaded images come back as backend paths ("/api/media/...")
+export const assetUrl = (path) => (path && path.startsWith('/api/') ? `${backendUrl}${path}` : path);
+
 const instance = axios.create({
   baseURL,
 });
@@ -23,4 +26,85 @@ instance.interceptors.request.use(
   }
 );
 
+// Access tokens are short-lived: on a 401, trade the refresh token for a new
+// pair once and replay the request. Each refresh token can only be used once,
+// so concurrent 401s share one refresh call, and a Web Lock serialises
+// refreshes across tabs: a tab that waited finds the pair another tab already
+// stored and uses it instead of presenting the spent token again.
+const REFRESH_LOCK = 'campus-token-refresh';
+let refreshing = null;
+
+const withRefreshLock = (task) => (
+  navigator.locks ? navigator.locks.request(REFRESH_LOCK, task) : task()
+);
+
+const refreshTokens = (staleToken) => {
+  if (!refreshing) {
+    refreshing = withRefreshLock(async () => {
+      const current = localStorage.getItem('token');
+      if (current && current !== staleToken) {
+        return current;
+      }
+      const response = await axios.post(`${baseURL}/auth/refresh`, {
+        refresh_token: localStorage.getItem('refresh_token')
+      });
+      localStorage.setItem('token', response.data.access_token);
+      localStorage.setItem('refresh_token', response.data.refresh_token);
+      return response.data.access_token;
+    }).finally(() => {
+      refreshing = null;
+    });
+  }
+  return refreshing;
+};
+
+const tokenExpiry = (token) => {
+  try {
+    const payload = JSON.parse(atob(token.split('.')[1].replace(/-/g, '+').replace(/_/g, '/')));
+    return payload.exp * 1000;
+  } catch (error) {
+    return 0;
+  }
+};
+
+// Access token valid for at least another 30 s, refreshing it first if
+// needed; for URLs that carry the token themselves (EventSource, WebSocket)
+export const freshAccessToken = async () => {
+  const token = localStorage.getItem('token');
+  if (token && tokenExpiry(token) - Date.now() > 30000) {
+    return token;
+  }
+  if (!localStorage.getItem('refresh_token')) {
+    return token;
+  }
+  return refreshTokens(token);
+};
+
+instance.interceptors.response.use(
+  (response) => response,
+  async (error) => {
+    const { config, response } = error;
+    if (
+      response?.status !== 401 ||
+      !config ||
+      config._retried ||
+      config.url?.startsWith('/auth/') ||
+      !localStorage.getItem('refresh_token')
+    ) {
+      return Promise.reject(error);
+    }
+    config._retried = true;
+    try {
+      const sentWith = (config.headers.Authorization || '').replace('Bearer ', '');
+      const token = await refreshTokens(sentWith);
+      config.headers.Authorization = `Bearer ${token}`;
+      return instance(config);
+    } catch (refreshError) {
+      localStorage.removeItem('token');
+      localStorage.removeItem('refresh_token');
+      return Promise.reject(error);
+    }
+  }
+);
+
 export default instance;
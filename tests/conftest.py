@@ -0,0 +1,106 @@
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+# The backend is a flat set of modules run from backend/ (uvicorn server:app)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MEMORY_DB", "1")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def client():
+    """API client against the app in MEMORY_DB mode, lifespan included"""
+    import httpx
+    import server
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.app.router.lifespan_context(server.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test/api") as api:
+            yield api
+
+
+def registration(api):
+    """Register a fresh user; returns (auth headers, token response)"""
+    async def register(role: str = "student"):
+        response = await api.post("/auth/register", json={
+            "email": f"{uuid.uuid4().hex[:12]}@campus-test.com",
+            "password": "secret-pass",
+            "full_name": "Test User",
+            "role": role,
+        })
+        assert response.status_code == 200, response.text
+        body = response.json()
+        return {"Authorization": f"Bearer {body['access_token']}"}, body
+    return register
+
+
+def course_creation(api):
+    """Create a course taught by the caller; returns its id"""
+    async def create_course(headers, code: str = "C1", schedule=()):
+        response = await api.post("/courses", headers=headers, json={
+            "name": code, "code": code, "department": "X", "credits": 3, "schedule": list(schedule)
+        })
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+    return create_course
+
+
+@pytest.fixture
+def signup(client):
+    return registration(client)
+
+
+@pytest.fixture
+def create_course(client):
+    return course_creation(client)
+
+
+@pytest.fixture
+async def mongo(monkeypatch):
+    """Primary and lagging secondary for the app's Mongo code paths, lifespan included
+
+    Both are mongomock databases. The "listing" profile reads the secondary,
+    which replicates nothing by itself, so any read that has to see the
+    caller's own writes fails if it goes there.
+    """
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import server
+
+    mongo_client = mongomock_motor.AsyncMongoMockClient()
+    primary, secondary = mongo_client["campus"], mongo_client["campus_secondary"]
+    monkeypatch.setattr(server, "MEMORY_DB", False)
+    monkeypatch.setattr(server, "db", primary)
+    monkeypatch.setattr(server, "db_profiles", {"critical": primary, "standard": primary, "listing": secondary})
+    monkeypatch.setattr(server, "timetable", None)
+    monkeypatch.setattr(server, "group_index", None)
+    async with server.app.router.lifespan_context(server.app):
+        yield primary, secondary
+
+
+@pytest.fixture
+async def mongo_client(mongo):
+    import httpx
+    import server
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test/api") as api:
+        yield api
+
+
+@pytest.fixture
+def mongo_signup(mongo_client):
+    return registration(mongo_client)
+
+
+@pytest.fixture
+def mongo_create_course(mongo_client):
+    return course_creation(mongo_client)
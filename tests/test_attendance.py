@@ -0,0 +1,56 @@
+from typing import get_args
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def test_accepted_methods_are_the_stored_ones():
+    import server
+    from attendance_store import METHODS
+
+    assert list(get_args(server.AttendanceMethod)) == METHODS
+
+
+async def test_unknown_method_is_422(client, signup):
+    headers, _ = await signup()
+    response = await client.post("/attendance", headers=headers, json={"class_id": "c1", "method": "telepathy"})
+    assert response.status_code == 422
+    assert (await client.get("/attendance/my", headers=headers)).json() == []
+
+
+@pytest.mark.parametrize("location", [
+    {"lat": "x", "lng": 1},
+    {"lat": [1], "lng": 1},
+    {"lat": 12.5},
+    {"lat": 91, "lng": 0},
+    {"lat": 0, "lng": -180.5},
+])
+async def test_malformed_location_is_422(client, signup, location):
+    headers, _ = await signup()
+    response = await client.post("/attendance", headers=headers, json={
+        "class_id": "c1", "method": "geolocation", "location": location
+    })
+    assert response.status_code == 422, response.text
+    assert (await client.get("/attendance/my", headers=headers)).json() == []
+
+
+async def test_location_is_stored(client, signup):
+    headers, _ = await signup()
+    response = await client.post("/attendance", headers=headers, json={
+        "class_id": "c1", "method": "geolocation", "location": {"lat": "12.5", "lng": -3}
+    })
+    assert response.status_code == 200, response.text
+    assert response.json()["location"] == {"lat": 12.5, "lng": -3.0}
+
+    records = (await client.get("/attendance/my", headers=headers)).json()
+    assert [r["location"] for r in records] == [{"lat": 12.5, "lng": -3.0}]
+
+
+async def test_second_check_in_the_same_day_is_refused(client, signup):
+    headers, _ = await signup()
+    checkin = {"class_id": "c1", "method": "qr_code"}
+    assert (await client.post("/attendance", headers=headers, json=checkin)).status_code == 200
+    response = await client.post("/attendance", headers=headers, json=checkin)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Attendance already marked for today"
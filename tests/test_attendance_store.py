@@ -0,0 +1,88 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from attendance_store import NO_TIME, AttendanceColumns, from_micros, to_micros
+
+NOW = datetime(2030, 3, 4, 9, 30, 15, 123456, tzinfo=timezone.utc)
+
+
+def record(user_id="u1", class_id="c1", created_at=NOW, **fields):
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "class_id": class_id,
+        "method": "qr_code",
+        "status": "present",
+        "created_at": created_at,
+        "check_in_time": created_at,
+        **fields,
+    }
+
+
+def test_micros_round_trip():
+    assert from_micros(to_micros(NOW)) == NOW
+    assert to_micros("2030-03-04T09:30:15.123456Z") == to_micros(NOW)
+    assert to_micros("2030-03-04T10:30:15.123456+01:00") == to_micros(NOW)
+    assert to_micros(NOW.replace(tzinfo=None)) == to_micros(NOW)
+    assert to_micros(None) == NO_TIME and from_micros(NO_TIME) is None
+
+
+def test_rows_come_back_as_stored():
+    log = AttendanceColumns()
+    first = record(location={"lat": 52.520008, "lng": 13.404954}, check_out_time="2030-03-04T11:00:00+00:00")
+    log.append(first)
+
+    [row] = log.records_for_user("u1")
+    assert row == {
+        **first,
+        "check_out_time": datetime(2030, 3, 4, 11, tzinfo=timezone.utc),
+        "location": {"lat": 52.52001, "lng": 13.40495},
+    }
+
+
+def test_pages_counts_and_unknown_users():
+    log = AttendanceColumns()
+    ids = []
+    for i in range(5):
+        entry = record(created_at=NOW + timedelta(days=i))
+        ids.append(entry["id"])
+        log.append(entry)
+    log.append(record(user_id="u2"))
+
+    assert len(log) == 6
+    assert log.count_for_user("u1") == 5
+    assert [r["id"] for r in log.records_for_user("u1", skip=1, limit=2)] == ids[1:3]
+    assert log.count_for_user("nobody") == 0
+    assert log.records_for_user("nobody") == []
+
+
+def test_exists_between_is_inclusive_and_per_class():
+    log = AttendanceColumns()
+    log.append(record())
+    assert log.exists_between("u1", "c1", NOW, NOW)
+    assert log.exists_between("u1", "c1", NOW - timedelta(hours=1), NOW + timedelta(hours=1))
+    assert not log.exists_between("u1", "c1", NOW + timedelta(microseconds=1), NOW + timedelta(hours=1))
+    assert not log.exists_between("u1", "c2", NOW - timedelta(hours=1), NOW + timedelta(hours=1))
+    assert not log.exists_between("u2", "c1", NOW - timedelta(hours=1), NOW + timedelta(hours=1))
+
+
+def test_new_methods_and_statuses_are_interned():
+    log = AttendanceColumns()
+    log.append(record(method="nfc", status="excused"))
+    [row] = log.records_for_user("u1")
+    assert (row["method"], row["status"]) == ("nfc", "excused")
+
+
+def test_rejected_records_leave_no_trace():
+    log = AttendanceColumns()
+    for bad in (record(id="not-a-uuid"), record(location={"lat": "north", "lng": 1.0})):
+        with pytest.raises(ValueError):
+            log.append(bad)
+    assert len(log) == 0
+    assert log.count_for_user("u1") == 0
+
+    log.append(record())
+    assert log.count_for_user("u1") == 1
+    assert log.nbytes() > 0
@@ -0,0 +1,263 @@
+import asyncio
+import hashlib
+import hmac
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import attendance_sync
+
+pytestmark = pytest.mark.anyio
+
+
+async def sync_key(api, headers):
+    response = await api.get("/attendance/sync-key", headers=headers)
+    assert response.status_code == 200
+    return response.json()["key"]
+
+
+def session_at(class_id, issued_at):
+    """The class session GET /courses/{id}/qr would have issued at that time"""
+    import server
+
+    issued_ms = round(issued_at.timestamp() * 1000)
+    return {
+        "course_id": class_id,
+        "issued_at": issued_ms,
+        "signature": attendance_sync.session_signature(server.JWT_SECRET_KEY, class_id, issued_ms),
+    }
+
+
+@pytest.fixture
+def enrolled(client, signup, create_course):
+    """Sign up a student enrolled in n new courses; returns (headers, course ids)"""
+    async def setup(n=1):
+        instructor, _ = await signup("faculty")
+        headers, _ = await signup()
+        course_ids = []
+        for i in range(n):
+            course_id = await create_course(instructor, code=f"S{i}")
+            assert (await client.post(f"/courses/{course_id}/enroll", headers=headers)).status_code == 200
+            course_ids.append(course_id)
+        return headers, course_ids
+    return setup
+
+
+def signed(key, class_id, checked_in_at=None, location=None, method="qr_code", fields=None, session=None):
+    """A queued check-in as attendance-queue.js builds it; fields overrides the signed strings
+
+    Unless given, the session was opened a minute before the check-in.
+    """
+    idempotency_key = uuid.uuid4().hex
+    checked_in_at = checked_in_at or datetime.now(timezone.utc) - timedelta(minutes=5)
+    message = attendance_sync.canonical(idempotency_key, class_id, method, checked_in_at, location)
+    if fields is not None:
+        message = "\n".join([idempotency_key, class_id, method, str(round(checked_in_at.timestamp() * 1000)), *fields]).encode()
+    return {
+        "idempotency_key": idempotency_key,
+        "class_id": class_id,
+        "method": method,
+        "location": location,
+        "session": session or session_at(class_id, checked_in_at - timedelta(minutes=1)),
+        "checked_in_at": checked_in_at.isoformat(),
+        "signature": hmac.new(key.encode(), message, hashlib.sha256).hexdigest(),
+    }
+
+
+def statuses(response):
+    assert response.status_code == 200, response.text
+    return [result["status"] for result in response.json()["results"]]
+
+
+async def test_replay_reports_duplicates_with_the_stored_ids(client, enrolled):
+    headers, (c1, c2) = await enrolled(2)
+    key = await sync_key(client, headers)
+    batch = {"checkins": [signed(key, c1), signed(key, c2, location={"lat": 12, "lng": 77.5})]}
+
+    first = await client.post("/attendance/sync", headers=headers, json=batch)
+    assert statuses(first) == ["created", "created"]
+    again = await client.post("/attendance/sync", headers=headers, json=batch)
+    assert statuses(again) == ["duplicate", "duplicate"]
+    assert [r["id"] for r in again.json()["results"]] == [r["id"] for r in first.json()["results"]]
+
+    records = (await client.get("/attendance/my", headers=headers)).json()
+    assert sorted(r["id"] for r in records) == sorted(r["id"] for r in first.json()["results"])
+
+
+async def test_second_check_in_the_same_day_is_already_marked(client, enrolled):
+    headers, (c1,) = await enrolled()
+    key = await sync_key(client, headers)
+    earlier = datetime.now(timezone.utc) - timedelta(days=1, hours=1)
+    batch = [signed(key, c1, earlier + timedelta(minutes=10)), signed(key, c1, earlier)]
+    assert statuses(await client.post("/attendance/sync", headers=headers, json={"checkins": batch})) == [
+        "already_marked", "created"
+    ]
+
+    later = await client.post("/attendance/sync", headers=headers, json={
+        "checkins": [signed(key, c1, earlier + timedelta(minutes=45))]
+    })
+    assert statuses(later) == ["already_marked"]
+
+
+async def test_check_in_from_a_scanned_qr_code_is_created(client, signup, create_course):
+    instructor, _ = await signup("faculty")
+    headers, _ = await signup()
+    course_id = await create_course(instructor)
+    assert (await client.post(f"/courses/{course_id}/enroll", headers=headers)).status_code == 200
+    key = await sync_key(client, headers)
+
+    assert (await client.get(f"/courses/{course_id}/qr", headers=headers)).status_code == 403
+    qr = (await client.get(f"/courses/{course_id}/qr", headers=instructor)).json()["qr_data"]
+    session = {field: qr[field] for field in ("course_id", "issued_at", "signature")}
+    item = signed(key, course_id, datetime.now(timezone.utc), session=session)
+
+    assert statuses(await client.post("/attendance/sync", headers=headers, json={"checkins": [item]})) == ["created"]
+
+
+async def test_invalid_items_are_rejected(client, enrolled):
+    headers, course_ids = await enrolled(7)
+    key = await sync_key(client, headers)
+    now = datetime.now(timezone.utc)
+    tampered = signed(key, course_ids[0])
+    tampered["class_id"] = course_ids[6]
+    forged_session = signed(key, course_ids[2])
+    forged_session["session"]["issued_at"] += 60 * 60 * 1000
+    batch = [
+        tampered,
+        signed("not-the-sync-key", course_ids[1]),
+        forged_session,
+        signed(key, course_ids[3], session=session_at(course_ids[6], now - timedelta(minutes=6))),
+        signed(key, course_ids[4], now - timedelta(days=30)),
+        signed(key, course_ids[5], now + timedelta(hours=1)),
+        signed(key, course_ids[6], method="telepathy"),
+    ]
+
+    response = await client.post("/attendance/sync", headers=headers, json={"checkins": batch})
+    assert statuses(response) == ["rejected"] * 7
+    assert [r["detail"] for r in response.json()["results"]] == [
+        "Invalid signature",
+        "Invalid signature",
+        "Invalid class session",
+        "Invalid class session",
+        "Check-in is too old to sync",
+        "Check-in time is in the future",
+        "Unsupported attendance method",
+    ]
+    assert (await client.get("/attendance/my", headers=headers)).json() == []
+
+
+async def test_backdated_check_ins_are_rejected(client, enrolled):
+    # A session from an earlier class cannot cover a check-in hours later,
+    # nor one before the class started
+    headers, (c1,) = await enrolled()
+    key = await sync_key(client, headers)
+    opened = datetime.now(timezone.utc) - timedelta(days=2)
+    batch = [
+        signed(key, c1, opened - timedelta(hours=1), session=session_at(c1, opened)),
+        signed(key, c1, opened + timedelta(hours=3), session=session_at(c1, opened)),
+    ]
+
+    response = await client.post("/attendance/sync", headers=headers, json={"checkins": batch})
+    assert statuses(response) == ["rejected", "rejected"]
+    assert {r["detail"] for r in response.json()["results"]} == {"Check-in is outside the class session"}
+    assert (await client.get("/attendance/my", headers=headers)).json() == []
+
+
+async def test_unknown_and_unenrolled_classes_are_rejected(client, signup, enrolled, create_course):
+    headers, _ = await enrolled()
+    instructor, _ = await signup("faculty")
+    other_course = await create_course(instructor, code="OTHER")
+    key = await sync_key(client, headers)
+    batch = [signed(key, "no-such-course"), signed(key, other_course)]
+
+    response = await client.post("/attendance/sync", headers=headers, json={"checkins": batch})
+    assert statuses(response) == ["rejected", "rejected"]
+    assert [r["detail"] for r in response.json()["results"]] == ["Unknown class", "Not enrolled in this class"]
+    assert (await client.get("/attendance/my", headers=headers)).json() == []
+
+
+async def test_items_signed_in_the_browser_verify(client, enrolled):
+    headers, (c1,) = await enrolled()
+    key = await sync_key(client, headers)
+    # String(12) in JS is "12", String(0.00001) is "0.00001"
+    item = signed(key, c1, location={"lat": 12, "lng": 0.00001}, fields=["12", "0.00001"])
+    assert statuses(await client.post("/attendance/sync", headers=headers, json={"checkins": [item]})) == ["created"]
+
+
+async def test_malformed_location_is_422(client, enrolled):
+    headers, (c1,) = await enrolled()
+    key = await sync_key(client, headers)
+    item = signed(key, c1, fields=["abc", "1"])
+    item["location"] = {"lat": "abc", "lng": 1}
+
+    response = await client.post("/attendance/sync", headers=headers, json={"checkins": [item]})
+    assert response.status_code == 422
+    assert (await client.get("/attendance/my", headers=headers)).json() == []
+
+
+async def test_concurrent_replays_store_each_check_in_once(client, enrolled):
+    headers, course_ids = await enrolled(5)
+    key = await sync_key(client, headers)
+    batch = {"checkins": [signed(key, course_id) for course_id in course_ids]}
+
+    first, second = await asyncio.gather(
+        client.post("/attendance/sync", headers=headers, json=batch),
+        client.post("/attendance/sync", headers=headers, json=batch),
+    )
+
+    assert sorted(statuses(first) + statuses(second)) == ["created"] * 5 + ["duplicate"] * 5
+    ids = {r["idempotency_key"]: r["id"] for r in first.json()["results"]}
+    assert all(ids[r["idempotency_key"]] == r["id"] for r in second.json()["results"])
+    assert len((await client.get("/attendance/my", headers=headers)).json()) == 5
+
+
+async def test_failed_write_does_not_claim_the_key(client, enrolled, monkeypatch):
+    import server
+
+    headers, (c1,) = await enrolled()
+    key = await sync_key(client, headers)
+    batch = {"checkins": [signed(key, c1)]}
+
+    def broken_append(record):
+        raise ValueError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(server.attendance_log, "append", broken_append)
+        with pytest.raises(ValueError):
+            await client.post("/attendance/sync", headers=headers, json=batch)
+
+    assert statuses(await client.post("/attendance/sync", headers=headers, json=batch)) == ["created"]
+    assert len((await client.get("/attendance/my", headers=headers)).json()) == 1
+
+
+async def test_mongo_insert_race_reports_the_winners_record(
+    mongo, mongo_client, mongo_signup, mongo_create_course, monkeypatch
+):
+    import server
+
+    primary, _ = mongo
+    instructor, _ = await mongo_signup("faculty")
+    headers, body = await mongo_signup()
+    c1, c2 = await mongo_create_course(instructor, "M1"), await mongo_create_course(instructor, "M2")
+    for course_id in (c1, c2):
+        assert (await mongo_client.post(f"/courses/{course_id}/enroll", headers=headers)).status_code == 200
+    key = await sync_key(mongo_client, headers)
+    raced, fresh = signed(key, c1), signed(key, c2)
+    checked_in_days = server.checked_in_days
+
+    async def concurrent_replay_wins(user_id, items):
+        taken = await checked_in_days(user_id, items)
+        # Another request stores the same item between the lookups and the insert
+        await primary.attendance.insert_one({
+            "id": "winner", "user_id": user_id, "class_id": c1, "method": "qr_code",
+            "idempotency_key": raced["idempotency_key"], "created_at": raced["checked_in_at"]
+        })
+        return taken
+
+    monkeypatch.setattr(server, "checked_in_days", concurrent_replay_wins)
+    response = await mongo_client.post("/attendance/sync", headers=headers, json={"checkins": [raced, fresh]})
+
+    assert statuses(response) == ["duplicate", "created"]
+    assert response.json()["results"][0]["id"] == "winner"
+    assert await primary.attendance.count_documents({"user_id": body["user"]["id"]}) == 2
@@ -0,0 +1,92 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_refresh_rotates_tokens(client, signup):
+    _, tokens = await signup()
+    response = await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    me = await client.get("/users/me", headers={"Authorization": f"Bearer {rotated['access_token']}"})
+    assert me.status_code == 200
+
+
+async def test_concurrent_refresh_within_grace_gets_the_same_pair(client, signup):
+    # Two tabs hit a 401 together and present the same refresh token
+    _, tokens = await signup()
+    first = await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    second = await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert first.status_code == second.status_code == 200
+    assert first.json()["refresh_token"] == second.json()["refresh_token"]
+    assert first.json()["access_token"] == second.json()["access_token"]
+    headers = {"Authorization": f"Bearer {second.json()['access_token']}"}
+    assert (await client.get("/users/me", headers=headers)).status_code == 200
+
+
+async def test_reuse_after_grace_revokes_every_session(client, signup, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "REFRESH_REUSE_GRACE_SECONDS", 0)
+    _, tokens = await signup()
+    rotated = (await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})).json()
+    reuse = await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert reuse.status_code == 401
+    headers = {"Authorization": f"Bearer {rotated['access_token']}"}
+    assert (await client.get("/users/me", headers=headers)).status_code == 401
+
+
+async def test_refresh_after_logout_is_rejected(client, signup):
+    headers, tokens = await signup()
+    await client.post("/auth/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]})
+    response = await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+    assert (await client.get("/users/me", headers=headers)).status_code == 401
+
+
+async def test_stale_refresh_after_logout_all_does_not_end_new_sessions(client, signup):
+    headers, tokens = await signup()
+    assert (await client.post("/auth/logout-all", headers=headers)).status_code == 200
+    login = await client.post("/auth/login", json={"email": tokens["user"]["email"], "password": "secret-pass"})
+    assert login.status_code == 200
+    fresh = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    # Another device still holds the refresh token from before the cut-off
+    stale = await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert stale.status_code == 401
+
+    assert (await client.get("/users/me", headers=fresh)).status_code == 200
+    refreshed = await client.post("/auth/refresh", json={"refresh_token": login.json()["refresh_token"]})
+    assert refreshed.status_code == 200
+
+
+async def test_refresh_token_reused_after_logout_does_not_end_other_sessions(client, signup):
+    headers, tokens = await signup()
+    other = await client.post("/auth/login", json={"email": tokens["user"]["email"], "password": "secret-pass"})
+    await client.post("/auth/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]})
+
+    assert (await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})).status_code == 401
+    assert (await client.get("/users/me", headers={
+        "Authorization": f"Bearer {other.json()['access_token']}"
+    })).status_code == 200
+
+
+async def test_expired_revocation_records_are_deleted(client, signup, monkeypatch):
+    import time
+
+    import server
+    from revocation import record_for
+
+    _, tokens = await signup()
+    await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    server.memory.insert_one("revoked_tokens", record_for("long-gone", time.time() - 1, time.time() - 3600))
+    assert server.memory.count("revoked_tokens") == 2
+
+    monkeypatch.setattr(server, "_revocations_purged_at", 0.0)
+    await server.sync_revocations()
+
+    assert server.memory.find_one("revoked_tokens", {"jti": "long-gone"}) is None
+    assert server.memory.count("revoked_tokens") == 1
+    reuse = await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert reuse.status_code == 200  # still inside the reuse grace window
@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from chat_history import BatchWriter, SessionBuffers
+
+
+def turn(message, minutes=0):
+    return {"message": message, "timestamp": datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=minutes)}
+
+
+def test_session_buffer_keeps_last_turns():
+    buffers = SessionBuffers(max_turns=2)
+    for i in range(3):
+        buffers.append("s1", "u1", turn(f"m{i}", i))
+    assert [t["message"] for t in buffers.get("s1", "u1")] == ["m1", "m2"]
+    assert buffers.get("s1", "someone-else") is None
+    assert buffers.get("unknown", "u1") is None
+
+
+def test_session_buffers_evict_least_recently_used():
+    buffers = SessionBuffers(max_turns=2, max_sessions=2)
+    buffers.append("a", "u1", turn("a"))
+    buffers.append("b", "u1", turn("b"))
+    buffers.get("a", "u1")
+    buffers.append("c", "u1", turn("c", 2))
+    assert len(buffers) == 2
+    assert buffers.get("b", "u1") is None
+    assert [t["message"] for t in buffers.for_user("u1", 10)] == ["c", "a"]
+
+
+def test_load_does_not_replace_a_live_session():
+    buffers = SessionBuffers(max_turns=3)
+    buffers.append("s1", "u1", turn("live"))
+    buffers.load("s1", "u1", [turn("stored")])
+    assert [t["message"] for t in buffers.get("s1", "u1")] == ["live"]
+    buffers.load("s2", "u1", [turn(f"m{i}", i) for i in range(5)])
+    assert [t["message"] for t in buffers.get("s2", "u1")] == ["m2", "m3", "m4"]
+
+
+class Sink:
+    def __init__(self):
+        self.batches = []
+
+    async def __call__(self, docs):
+        self.batches.append(list(docs))
+
+
+@pytest.mark.anyio
+async def test_stop_mid_interval_flushes_and_returns():
+    sink = Sink()
+    writer = BatchWriter(sink, max_batch=100, interval=60)
+    writer.start()
+    for i in range(3):
+        writer.submit({"n": i})
+    # Let the task pick the first document up and start waiting out the interval
+    await asyncio.sleep(0.05)
+    await asyncio.wait_for(writer.stop(), timeout=2)
+    assert [doc["n"] for batch in sink.batches for doc in batch] == [0, 1, 2]
+    assert not writer.submit({"n": 3})
+
+
+@pytest.mark.anyio
+async def test_stop_while_idle_returns():
+    sink = Sink()
+    writer = BatchWriter(sink, interval=60)
+    writer.start()
+    await asyncio.sleep(0.01)
+    await asyncio.wait_for(writer.stop(), timeout=2)
+    assert sink.batches == []
+
+
+@pytest.mark.anyio
+async def test_full_batches_are_written_without_waiting_for_the_interval():
+    sink = Sink()
+    writer = BatchWriter(sink, max_batch=2, interval=60)
+    writer.start()
+    for i in range(4):
+        writer.submit({"n": i})
+    await asyncio.sleep(0.05)
+    assert [len(batch) for batch in sink.batches] == [2, 2]
+    await asyncio.wait_for(writer.stop(), timeout=2)
+
+
+@pytest.mark.anyio
+async def test_full_queue_and_failed_writes_are_counted():
+    dropped = []
+
+    async def failing(docs):
+        raise RuntimeError("down")
+
+    writer = BatchWriter(failing, max_batch=10, interval=0.01, max_pending=2, on_drop=dropped.append)
+    writer.start()
+    assert writer.submit({"n": 0}) and writer.submit({"n": 1})
+    assert not writer.submit({"n": 2})
+    await asyncio.wait_for(writer.stop(), timeout=2)
+    assert sum(dropped) == 3
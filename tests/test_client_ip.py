@@ -0,0 +1,44 @@
+import pytest
+from starlette.requests import Request
+
+
+def request_with(*forwarded, peer="10.0.0.1"):
+    headers = [(b"x-forwarded-for", value.encode()) for value in forwarded]
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+@pytest.fixture
+def behind_proxies(monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "TRUST_PROXY_HEADERS", True)
+
+    def configure(count):
+        monkeypatch.setattr(server, "TRUSTED_PROXY_COUNT", count)
+        return server.client_ip
+    return configure
+
+
+def test_peer_address_without_trusted_proxies():
+    import server
+
+    assert server.client_ip(request_with("1.1.1.1")) == "10.0.0.1"
+
+
+def test_spoofed_leftmost_entries_are_ignored(behind_proxies):
+    client_ip = behind_proxies(1)
+    # The client sent "6.6.6.6"; our proxy appended the address it actually saw
+    assert client_ip(request_with("6.6.6.6, 203.0.113.7")) == "203.0.113.7"
+
+
+def test_counts_hops_from_the_right(behind_proxies):
+    client_ip = behind_proxies(2)
+    assert client_ip(request_with("6.6.6.6, 203.0.113.7, 172.16.0.2")) == "203.0.113.7"
+    # Repeated headers are one list, in order
+    assert client_ip(request_with("6.6.6.6", "203.0.113.7, 172.16.0.2")) == "203.0.113.7"
+
+
+def test_fewer_hops_than_proxies(behind_proxies):
+    client_ip = behind_proxies(3)
+    assert client_ip(request_with("203.0.113.7, 172.16.0.2")) == "203.0.113.7"
+    assert client_ip(request_with()) == "10.0.0.1"
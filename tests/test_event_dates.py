@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_legacy_event_dates_are_normalised(mongo):
+    import server
+
+    primary, _ = mongo
+    await primary.events.insert_many([
+        {"id": "offset", "date": "2030-01-01T12:00:00+02:00"},
+        {"id": "zulu", "date": "2030-01-01T10:00:00.250000Z"},
+        {"id": "naive", "date": "2030-01-01T10:00:00"},
+        {"id": "bson", "date": datetime(2030, 1, 1, 10, 0)},
+        {"id": "aware", "date": datetime(2030, 1, 1, 11, 0, tzinfo=timezone(timedelta(hours=1)))},
+        {"id": "current", "date": "2030-01-01T10:00:00+00:00"},
+        {"id": "garbage", "date": "next tuesday"},
+    ])
+
+    await server.ensure_indexes()
+
+    dates = {e["id"]: e["date"] async for e in primary.events.find({}, {"_id": 0})}
+    assert dates.pop("garbage") == "next tuesday"
+    assert set(dates.values()) == {"2030-01-01T10:00:00+00:00"}
+
+
+async def test_normalised_dates_order_the_listing(mongo, mongo_client, mongo_signup):
+    import server
+
+    primary, secondary = mongo
+    headers, _ = await mongo_signup()
+    soon = datetime.now(timezone.utc) + timedelta(days=1)
+    # Written by an older build: a local offset sorts before an earlier UTC time as a string
+    legacy = [
+        {"id": "later", "date": (soon + timedelta(hours=3)).astimezone(timezone(timedelta(hours=-8))).isoformat()},
+        {"id": "earlier", "date": soon.isoformat()},
+    ]
+    await primary.events.insert_many([
+        {**event, "title": event["id"], "description": "d", "location": "x", "category": "academic",
+         "organizer_id": "o", "is_active": True, "registered_count": 0}
+        for event in legacy
+    ])
+    await server.ensure_indexes()
+    await secondary.events.insert_many(await primary.events.find({}, {"_id": 0}).to_list(None))
+
+    events = (await mongo_client.get("/events", headers=headers, params={"when": "upcoming"})).json()
+    assert [e["id"] for e in events] == ["earlier", "later"]
+
+
+def stored_event(event_id, date, is_active=True):
+    return {
+        "id": event_id, "title": event_id, "description": "d", "location": "x", "category": "academic",
+        "organizer_id": "o", "is_active": is_active, "registered_count": 0, "date": date,
+    }
+
+
+async def seed_events(mongo, events):
+    """Write events to the primary and replicate them to the listing secondary"""
+    primary, secondary = mongo
+    await primary.events.insert_many([dict(event) for event in events])
+    await secondary.events.insert_many([dict(event) for event in events])
+
+
+async def test_archive_deactivates_events_past_the_grace_period(mongo, monkeypatch):
+    import server
+
+    primary, _ = mongo
+    now = datetime.now(timezone.utc)
+    grace = timedelta(seconds=server.EVENT_ARCHIVE_AFTER)
+    await primary.events.insert_many([
+        stored_event("long-over", server.event_date(now - grace - timedelta(hours=1))),
+        stored_event("just-over", server.event_date(now - grace + timedelta(hours=1))),
+        stored_event("upcoming", server.event_date(now + timedelta(days=1))),
+    ])
+    monkeypatch.setattr(server, "event_feed", [{"id": "cached"}])
+
+    assert await server.archive_past_events() == 1
+
+    active = {e["id"]: e["is_active"] async for e in primary.events.find({}, {"_id": 0})}
+    assert active == {"long-over": False, "just-over": True, "upcoming": True}
+    assert server.event_feed is None
+    assert await server.archive_past_events() == 0
+
+
+async def test_listing_filters_by_date(mongo, mongo_client, mongo_signup):
+    import server
+
+    headers, _ = await mongo_signup()
+    now = datetime.now(timezone.utc)
+    at = {name: now + timedelta(days=days) for name, days in
+          {"archived": -10, "yesterday": -1, "tomorrow": 1, "next-week": 8}.items()}
+    await seed_events(mongo, [
+        stored_event(name, server.event_date(when), is_active=name != "archived") for name, when in at.items()
+    ])
+
+    async def listed(**params):
+        response = await mongo_client.get("/events", headers=headers, params=params)
+        assert response.status_code == 200, response.text
+        return [e["id"] for e in response.json()]
+
+    assert await listed() == ["yesterday", "tomorrow", "next-week"]
+    assert await listed(when="upcoming") == ["tomorrow", "next-week"]
+    assert await listed(when="past") == ["yesterday", "archived"]
+    window = {"start": (now - timedelta(days=2)).isoformat(), "end": (now + timedelta(days=2)).isoformat()}
+    assert await listed(**window) == ["yesterday", "tomorrow"]
+    assert await listed(when="upcoming", **window) == ["tomorrow"]
+    assert await listed(when="past", start=(now - timedelta(days=20)).isoformat()) == ["yesterday", "archived"]
+    assert await listed(when="upcoming", limit=1, skip=1) == ["next-week"]
+    assert (await mongo_client.get("/events", params={"when": "soon"})).status_code == 422
+
+
+async def test_creating_an_event_clears_the_weekly_feed(mongo, mongo_client, mongo_signup, monkeypatch):
+    import server
+
+    primary, secondary = mongo
+    monkeypatch.setattr(server, "event_feed", None)
+    headers, _ = await mongo_signup("faculty")
+    assert (await mongo_client.get("/events/this-week", headers=headers)).json() == []
+
+    response = await mongo_client.post("/events", headers=headers, json={
+        "title": "Hackathon", "description": "d", "location": "Hall", "category": "workshop",
+        "date": (datetime.now(timezone.utc) + timedelta(days=2)).isoformat(),
+    })
+    assert response.status_code == 200, response.text
+    await secondary.events.insert_many(await primary.events.find({}, {"_id": 0}).to_list(None))
+
+    feed = (await mongo_client.get("/events/this-week", headers=headers)).json()
+    assert [e["id"] for e in feed] == [response.json()["id"]]
+    assert feed[0]["is_registered"] is False
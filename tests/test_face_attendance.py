@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def faces_by_filename(monkeypatch):
+    """Stand in for the extraction worker: the upload's filename picks the embedding"""
+    import server
+
+    vectors = {}
+
+    async def fake_embedding(image):
+        return vectors[image.filename]
+
+    monkeypatch.setattr(server, "face_embedding_from_upload", fake_embedding)
+    return vectors
+
+
+async def enrolled_student_with_face(client, signup, course_id, vectors):
+    import server
+
+    headers, _ = await signup()
+    me = (await client.get("/users/me", headers=headers)).json()
+    assert (await client.post(f"/courses/{course_id}/enroll", headers=headers)).status_code == 200
+    vector = np.random.default_rng(len(vectors)).normal(size=128).tolist()
+    server.memory.insert_one("face_templates", {"user_id": me["id"], "embedding": vector})
+    server.get_face_index().invalidate()
+    vectors[me["id"]] = vector
+    return headers, me["id"]
+
+
+def photo(user_id):
+    return {"image": (user_id, b"jpeg", "image/jpeg")}
+
+
+async def test_only_the_instructor_can_run_a_kiosk(client, signup, create_course, faces_by_filename):
+    instructor, _ = await signup("faculty")
+    other_faculty, _ = await signup("faculty")
+    course_id = await create_course(instructor)
+    _, student_id = await enrolled_student_with_face(client, signup, course_id, faces_by_filename)
+
+    url = f"/courses/{course_id}/attendance/face"
+    assert (await client.post(url, headers=other_faculty, files=photo(student_id))).status_code == 403
+    response = await client.post(url, headers=instructor, files=photo(student_id))
+    assert response.status_code == 200
+    assert response.json()["user_id"] == student_id
+
+
+async def test_students_only_check_themselves_in(client, signup, create_course, faces_by_filename):
+    instructor, _ = await signup("faculty")
+    course_id = await create_course(instructor)
+    alice, alice_id = await enrolled_student_with_face(client, signup, course_id, faces_by_filename)
+    _, bob_id = await enrolled_student_with_face(client, signup, course_id, faces_by_filename)
+
+    url = f"/courses/{course_id}/attendance/face"
+    assert (await client.post(url, headers=alice, files=photo(bob_id))).status_code == 403
+    assert (await client.post(url, headers=alice, files=photo(alice_id))).status_code == 200
+
+
+async def test_kiosk_is_not_limited_by_the_per_user_attendance_budget(client, signup, create_course, faces_by_filename, monkeypatch):
+    import server
+    from ratelimit import RateLimiter
+
+    instructor, _ = await signup("faculty")
+    course_id = await create_course(instructor)
+    students = [await enrolled_student_with_face(client, signup, course_id, faces_by_filename) for _ in range(3)]
+    monkeypatch.setattr(server, "rate_limiter", RateLimiter(dict(server.RATE_LIMITS, attendance_user="1/minute")))
+
+    url = f"/courses/{course_id}/attendance/face"
+    for _, student_id in students:
+        response = await client.post(url, headers=instructor, files=photo(student_id))
+        assert response.status_code == 200, response.text
+
+
+async def test_unknown_course_is_404(client, signup, faces_by_filename):
+    headers, _ = await signup()
+    response = await client.post("/courses/missing/attendance/face", headers=headers, files=photo("x"))
+    assert response.status_code == 404
@@ -0,0 +1,179 @@
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import media
+from media import parse_range
+
+
+@pytest.mark.parametrize("header,expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=999-999", (999, 999)),
+    (" bytes = 0-0", (0, 0)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=1000-",
+    "bytes=500-100",
+    "bytes=-0",
+    "bytes=-",
+    "bytes=a-b",
+    "bytes=0-1,5-6",
+    "items=0-1",
+    "0-1",
+])
+def test_parse_range_rejects(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_empty_file_has_no_satisfiable_range():
+    for header in ("bytes=0-", "bytes=-5"):
+        with pytest.raises(ValueError):
+            parse_range(header, 0)
+
+
+@pytest.fixture
+def media_root(tmp_path, monkeypatch):
+    """Media under tmp_path, rendered in a thread instead of the process pool"""
+    import server
+
+    pytest.importorskip("PIL")
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(server, "MEDIA_ROOT", str(tmp_path))
+    monkeypatch.setattr(server, "get_media_pool", lambda: pool)
+    yield tmp_path
+    pool.shutdown()
+
+
+def png(width=64, height=48, color=(200, 30, 30)):
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(out, "PNG")
+    return out.getvalue()
+
+
+def images(*contents):
+    return [("files", (f"photo{i}.png", content, "image/png")) for i, content in enumerate(contents)]
+
+
+@pytest.mark.anyio
+async def test_upload_renders_the_variants(client, signup, media_root):
+    headers, _ = await signup()
+    response = await client.post("/media", headers=headers, files=images(png(2000, 1000)))
+    assert response.status_code == 200, response.text
+    [stored] = response.json()
+    assert (stored["width"], stored["height"]) == (2000, 1000)
+    assert stored["thumbnail_url"] == media.media_url(stored["id"], media.THUMBNAIL)
+
+    meta = media.load_meta(str(media_root), stored["id"])
+    assert {name: (v["width"], v["height"]) for name, v in meta["variants"].items()} == {
+        "thumb.webp": (320, 160), "thumb.jpg": (320, 160), "display.webp": (1280, 640)
+    }
+    thumbnail = await client.get(f"/media/{stored['id']}/thumb.webp")
+    assert thumbnail.status_code == 200
+    assert thumbnail.headers["content-type"] == "image/webp"
+    assert thumbnail.headers["cache-control"] == "public, max-age=31536000, immutable"
+    cached = await client.get(f"/media/{stored['id']}/thumb.webp", headers={"If-None-Match": thumbnail.headers["etag"]})
+    assert cached.status_code == 304
+
+
+@pytest.mark.anyio
+async def test_identical_uploads_share_one_image(client, signup, media_root):
+    headers, _ = await signup()
+    response = await client.post("/media", headers=headers, files=images(png(), png()))
+    first, second = response.json()
+    assert first["id"] == second["id"]
+
+
+@pytest.mark.anyio
+async def test_bad_uploads_are_refused(client, signup, media_root, monkeypatch):
+    import server
+
+    headers, _ = await signup()
+    response = await client.post("/media", headers=headers, files=images(b"not an image"))
+    assert response.status_code == 400
+
+    monkeypatch.setattr(server, "MEDIA_MAX_UPLOAD_BYTES", 100)
+    assert (await client.post("/media", headers=headers, files=images(png(200, 200, (1, 2, 3))))).status_code == 413
+    monkeypatch.setattr(server, "MEDIA_MAX_BATCH", 1)
+    assert (await client.post("/media", headers=headers, files=images(png(), png()))).status_code == 400
+
+
+@pytest.mark.anyio
+async def test_uploads_count_against_a_per_user_quota(client, signup, media_root, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "MEDIA_MAX_PER_USER", 2)
+    headers, _ = await signup()
+    other, _ = await signup()
+    assert (await client.post("/media", headers=headers, files=images(png(color=(1, 1, 1))))).status_code == 200
+    assert (await client.post("/media", headers=headers, files=images(png(color=(1, 1, 1))))).status_code == 200
+    assert (await client.post("/media", headers=headers, files=images(png(color=(2, 2, 2))))).status_code == 200
+
+    response = await client.post("/media", headers=headers, files=images(png(color=(3, 3, 3))))
+    assert response.status_code == 403
+    assert (await client.post("/media", headers=other, files=images(png(color=(3, 3, 3))))).status_code == 200
+
+
+@pytest.mark.anyio
+async def test_uploads_are_rate_limited(client, signup, media_root, monkeypatch):
+    import server
+    from ratelimit import RateLimiter
+
+    monkeypatch.setattr(server, "rate_limiter", RateLimiter(dict(server.RATE_LIMITS, media_user="1/minute")))
+    headers, _ = await signup()
+    assert (await client.post("/media", headers=headers, files=images(png()))).status_code == 200
+    response = await client.put("/users/me/profile-image", headers=headers, files={"image": ("me.png", png(), "image/png")})
+    assert response.status_code == 429
+
+
+@pytest.mark.anyio
+async def test_range_requests(client, signup, media_root):
+    headers, _ = await signup()
+    [stored] = (await client.post("/media", headers=headers, files=images(png()))).json()
+    url = f"/media/{stored['id']}/thumb.jpg"
+    whole = (await client.get(url)).content
+
+    partial = await client.get(url, headers={"Range": "bytes=10-19"})
+    assert partial.status_code == 206
+    assert partial.content == whole[10:20]
+    assert partial.headers["content-range"] == f"bytes 10-19/{len(whole)}"
+
+    suffix = await client.get(url, headers={"Range": "bytes=-5"})
+    assert (suffix.status_code, suffix.content) == (206, whole[-5:])
+
+    beyond = await client.get(url, headers={"Range": f"bytes={len(whole)}-"})
+    assert beyond.status_code == 416
+    assert beyond.headers["content-range"] == f"bytes */{len(whole)}"
+
+
+@pytest.mark.anyio
+async def test_range_on_an_empty_variant_is_416(client, media_root):
+    media_id = "0" * 64
+    directory = media.media_dir(str(media_root), media_id)
+    os.makedirs(directory)
+    open(os.path.join(directory, "thumb.webp"), "wb").close()
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump({"id": media_id, "variants": {"thumb.webp": {"bytes": 0, "content_type": "image/webp"}}}, f)
+
+    for header in ("bytes=0-", "bytes=-5"):
+        response = await client.get(f"/media/{media_id}/thumb.webp", headers={"Range": header})
+        assert response.status_code == 416
+        assert response.headers["content-range"] == "bytes */0"
+
+
+@pytest.mark.anyio
+async def test_unknown_media_is_404(client, media_root):
+    assert (await client.get(f"/media/{'f' * 64}/thumb.webp")).status_code == 404
@@ -0,0 +1,93 @@
+"""Membership edges: the migration from embedded arrays, capacity and paging."""
+import asyncio
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_legacy_member_arrays_become_edges(mongo):
+    import server
+
+    primary, _ = mongo
+    await primary.courses.insert_one({"id": "course1", "enrolled_students": ["u1", "u2", "u1"]})
+    await primary.study_groups.insert_one({"id": "group1", "members": [], "member_count": 7})
+    await primary.events.insert_one({"id": "event1", "registered_users": ["u3"], "date": "2030-01-01T00:00:00+00:00"})
+    # Already migrated by an earlier start that stopped half way
+    await primary.course_enrollments.insert_one({"entity_id": "course1", "user_id": "u2", "joined_at": "then"})
+
+    await server.ensure_indexes()
+    await server.ensure_indexes()  # a second start changes nothing
+
+    enrollments = await primary.course_enrollments.find({"entity_id": "course1"}, {"_id": 0}).to_list(None)
+    assert sorted(e["user_id"] for e in enrollments) == ["u1", "u2"]
+    assert [e["joined_at"] for e in enrollments if e["user_id"] == "u2"] == ["then"]
+    course = await primary.courses.find_one({"id": "course1"}, {"_id": 0})
+    assert course == {"id": "course1", "enrolled_count": 2}
+
+    group = await primary.study_groups.find_one({"id": "group1"}, {"_id": 0})
+    assert group == {"id": "group1", "member_count": 0}
+    assert await primary.event_registrations.count_documents({"entity_id": "event1", "user_id": "u3"}) == 1
+    assert (await primary.events.find_one({"id": "event1"}))["registered_count"] == 1
+
+
+async def test_capacity_is_never_overshot(mongo):
+    import server
+
+    primary, _ = mongo
+    await primary.study_groups.insert_one({"id": "group1", "member_count": 0, "max_members": 2})
+
+    outcomes = await asyncio.gather(*(
+        server.add_membership("study_group_members", "group1", f"u{i}", capacity=2) for i in range(5)
+    ))
+
+    assert sorted(outcome for outcome, _ in outcomes) == ["added", "added", "full", "full", "full"]
+    assert sorted(count for outcome, count in outcomes if outcome == "added") == [1, 2]
+    assert (await primary.study_groups.find_one({"id": "group1"}))["member_count"] == 2
+    # The edges of refused joins are rolled back
+    assert await primary.study_group_members.count_documents({"entity_id": "group1"}) == 2
+
+    added = [f"u{i}" for i, (outcome, _) in enumerate(outcomes) if outcome == "added"]
+    assert await server.add_membership("study_group_members", "group1", added[0], capacity=2) == ("exists", None)
+
+
+async def test_memory_store_capacity_and_duplicates(client):
+    import server
+
+    server.memory.insert_one("study_groups", {"id": "group1", "member_count": 0})
+
+    assert await server.add_membership("study_group_members", "group1", "u1", capacity=1) == ("added", 1)
+    assert await server.add_membership("study_group_members", "group1", "u1", capacity=1) == ("exists", None)
+    assert await server.add_membership("study_group_members", "group1", "u2", capacity=1) == ("full", None)
+    assert server.memory.count("study_group_members", {"entity_id": "group1"}) == 1
+
+
+async def test_members_are_paged_in_join_order(client, signup, create_course):
+    instructor, _ = await signup("faculty")
+    course_id = await create_course(instructor)
+    student_ids = []
+    for _ in range(5):
+        headers, body = await signup()
+        assert (await client.post(f"/courses/{course_id}/enroll", headers=headers)).status_code == 200
+        student_ids.append(body["user"]["id"])
+
+    page = await client.get(f"/courses/{course_id}/students?skip=1&limit=2", headers=instructor)
+    assert page.json() == {"total": 5, "skip": 1, "limit": 2, "user_ids": student_ids[1:3]}
+    last = await client.get(f"/courses/{course_id}/students?skip=4&limit=2", headers=instructor)
+    assert last.json()["user_ids"] == student_ids[4:]
+    too_many = await client.get(f"/courses/{course_id}/students?limit=501", headers=instructor)
+    assert too_many.status_code == 422
+
+
+async def test_mongo_members_are_paged_in_join_order(mongo, monkeypatch):
+    import server
+
+    primary, _ = mongo
+    monkeypatch.setitem(server.db_profiles, "listing", primary)
+    await primary.event_registrations.insert_many([
+        {"entity_id": "event1", "user_id": f"u{i}", "joined_at": f"2030-01-01T00:00:0{i}+00:00"}
+        for i in reversed(range(5))
+    ])
+
+    page = await server.list_members("event_registrations", "event1", skip=1, limit=3)
+    assert page == {"total": 5, "skip": 1, "limit": 3, "user_ids": ["u1", "u2", "u3"]}
@@ -0,0 +1,92 @@
+import os
+import stat
+from multiprocessing import AuthenticationError
+
+import pytest
+
+import memory_store
+
+
+@pytest.fixture
+def key_file(tmp_path, monkeypatch):
+    monkeypatch.delenv("MEMORY_STORE_AUTHKEY", raising=False)
+    path = tmp_path / "store.key"
+    monkeypatch.setenv("MEMORY_STORE_AUTHKEY_FILE", str(path))
+    return path
+
+
+@pytest.mark.parametrize("address,local", [
+    ("127.0.0.1:50055", True),
+    (":50055", True),
+    ("localhost:50055", True),
+    ("::1:50055", True),
+    ("/run/campus/store.sock", True),
+    ("0.0.0.0:50055", False),
+    ("10.0.0.5:50055", False),
+    ("store.internal:50055", False),
+])
+def test_is_local(address, local):
+    assert memory_store.is_local(address) is local
+
+
+def test_generated_key_is_private_and_stable(key_file):
+    key = memory_store._authkey("127.0.0.1:50055")
+    assert len(key) == 64
+    assert stat.S_IMODE(os.stat(key_file).st_mode) == 0o600
+    assert memory_store._authkey("127.0.0.1:50055") == key
+    assert os.listdir(key_file.parent) == [key_file.name]
+
+
+def test_readable_key_file_is_refused(key_file):
+    key_file.write_text("shared")
+    key_file.chmod(0o644)
+    with pytest.raises(RuntimeError, match="0600"):
+        memory_store._authkey("127.0.0.1:50055")
+
+
+def test_remote_address_needs_an_explicit_key(key_file, monkeypatch):
+    with pytest.raises(RuntimeError, match="MEMORY_STORE_AUTHKEY"):
+        memory_store._authkey("10.0.0.5:50055")
+    assert not key_file.exists()
+
+    monkeypatch.setenv("MEMORY_STORE_AUTHKEY", "from-the-deployment")
+    assert memory_store._authkey("10.0.0.5:50055") == b"from-the-deployment"
+
+
+def test_clients_need_the_store_key(key_file, tmp_path, monkeypatch):
+    address = str(tmp_path / "store.sock")
+    manager = memory_store._StoreManager(address=address, authkey=memory_store._authkey(address))
+    manager.start()
+    try:
+        store = memory_store._connect_manager(address, start_timeout=1).get_store()
+        store.insert_one("users", {"id": "u1"})
+        assert store.find_one("users", {"id": "u1"}) == {"id": "u1"}
+
+        monkeypatch.setenv("MEMORY_STORE_AUTHKEY", "campus-memory-store")
+        with pytest.raises(AuthenticationError):
+            memory_store._connect_manager(address, start_timeout=1)
+    finally:
+        manager.shutdown()
+
+
+def test_find_since_returns_the_newest_tail():
+    store = memory_store.MemoryStore()
+    for at in (10.0, 20.0, 30.0, 40.0):
+        store.insert_one("revoked_tokens", {"jti": str(at), "revoked_at": at})
+    assert [d["jti"] for d in store.find_since("revoked_tokens", "revoked_at", 25.0)] == ["30.0", "40.0"]
+    assert store.find_since("revoked_tokens", "revoked_at", 50.0) == []
+    assert len(store.find_since("revoked_tokens", "revoked_at", -60.0)) == 4
+
+
+def test_delete_expired_keeps_the_indexes_in_step():
+    store = memory_store.MemoryStore()
+    store.insert_one("revoked_tokens", {"jti": "dead", "expires_at": 100.0})
+    store.insert_one("revoked_tokens", {"jti": "live", "expires_at": 300.0})
+    store.insert_one("revoked_tokens", {"jti": "no-expiry"})
+
+    assert store.delete_expired("revoked_tokens", "expires_at", 100.0) == 1
+    assert store.delete_expired("revoked_tokens", "expires_at", 100.0) == 0
+    assert store.find_one("revoked_tokens", {"jti": "dead"}) is None
+    assert store.find_one("revoked_tokens", {"jti": "live"})["expires_at"] == 300.0
+    assert store.count("revoked_tokens") == 2
+    assert store.insert_one("revoked_tokens", {"jti": "dead", "expires_at": 400.0}, unique=("jti",))
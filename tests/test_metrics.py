@@ -0,0 +1,88 @@
+import re
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+
+pytestmark = pytest.mark.anyio
+
+
+def sample(text, name, **labels):
+    """Value of one series in a /metrics scrape, 0 if it is absent"""
+    for line in text.splitlines():
+        match = re.fullmatch(r"(\w+)(?:\{(.*)\})? (\S+)", line)
+        if not match or match.group(1) != name:
+            continue
+        found = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(2) or ""))
+        if found == labels:
+            return float(match.group(3))
+    return 0.0
+
+
+async def scrape(client):
+    response = await client.get("http://test/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    return response.text
+
+
+async def test_requests_are_labelled_by_route_template(client, signup, create_course):
+    instructor, _ = await signup("faculty")
+    course_ids = [await create_course(instructor, code=code) for code in ("M1", "M2")]
+    route = "/api/courses/{course_id}/students"
+    before = await scrape(client)
+
+    for course_id in course_ids:
+        assert (await client.get(f"/courses/{course_id}/students", headers=instructor)).status_code == 200
+    assert (await client.get("/no-such-route")).status_code == 404
+    after = await scrape(client)
+
+    def delta(name, **labels):
+        return sample(after, name, **labels) - sample(before, name, **labels)
+
+    assert delta("http_requests_total", method="GET", route=route, status="200") == 2
+    assert delta("http_requests_total", method="GET", route="unmatched", status="404") == 1
+    assert all(course_id not in after for course_id in course_ids)
+    assert delta("http_request_duration_seconds_count", method="GET", route=route) == 2
+    assert delta("http_request_duration_seconds_bucket", method="GET", route=route, le="+Inf") == 2
+    assert sample(after, "http_request_duration_seconds_sum", method="GET", route=route) > 0
+    # One request in flight: the scrape itself
+    assert sample(after, "http_requests_in_flight") == 1
+
+    labels = {"backend": "memory", "collection": "course_enrollments", "operation": "find"}
+    assert delta("db_operation_duration_seconds_count", **labels) == 2
+    assert "# TYPE db_operation_duration_seconds histogram" in after
+
+
+def test_mongo_command_and_pool_timings():
+    before = metrics.render()
+    commands = metrics.CommandTimings()
+    for request_id, failed in ((1, False), (2, True)):
+        started = SimpleNamespace(
+            request_id=request_id, connection_id=("db", 27017), command_name="find", command={"find": "courses"}
+        )
+        finished = SimpleNamespace(request_id=request_id, connection_id=("db", 27017), command_name="find", duration_micros=1500)
+        commands.started(started)
+        (commands.failed if failed else commands.succeeded)(finished)
+
+    pool = metrics.PoolTimings()
+    pool.connection_created(None)
+    pool.connection_check_out_started(None)
+    pool.connection_checked_out(None)
+    pool.connection_checked_in(None)
+    pool.connection_check_out_started(None)
+    pool.connection_check_out_failed(SimpleNamespace(reason="timeout"))
+    after = metrics.render()
+
+    def delta(name, **labels):
+        return sample(after, name, **labels) - sample(before, name, **labels)
+
+    labels = {"backend": "mongo", "collection": "courses", "operation": "find"}
+    assert delta("db_operation_duration_seconds_count", **labels) == 2
+    assert delta("db_operation_duration_seconds_bucket", le="0.0025", **labels) == 2
+    assert delta("db_operation_errors_total", **labels) == 1
+    assert delta("mongo_pool_wait_seconds_count") == 2
+    assert delta("mongo_pool_checkout_failures_total", reason="timeout") == 1
+    assert delta("mongo_pool_connections", state="open") == 1
+    assert delta("mongo_pool_connections", state="in_use") == 0
@@ -0,0 +1,145 @@
+import asyncio
+import math
+
+import pytest
+
+import ratelimit
+from ratelimit import LoadShedMiddleware, RateLimited, RateLimiter, TokenBuckets, parse_rate
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_parse_rate():
+    assert parse_rate("20/minute") == (pytest.approx(1 / 3), 20.0)
+    assert parse_rate("5/second") == (5.0, 5.0)
+    for spec in ("20", "x/minute", "20/day", "-1/second"):
+        with pytest.raises(ValueError):
+            parse_rate(spec)
+
+
+def test_burst_then_refill(clock):
+    buckets = TokenBuckets()
+    assert [buckets.take("k", rate=1.0, burst=3) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("k", rate=1.0, burst=3) == pytest.approx(1.0)
+
+    clock[0] += 0.5
+    assert buckets.take("k", rate=1.0, burst=3) == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert buckets.take("k", rate=1.0, burst=3) == 0
+
+
+def test_refill_is_capped_at_the_burst(clock):
+    buckets = TokenBuckets()
+    buckets.take("k", rate=1.0, burst=2)
+    clock[0] += 3600
+    assert [buckets.take("k", rate=1.0, burst=2) for _ in range(3)][-1] > 0
+
+
+def test_keys_are_independent_and_lru_bounded(clock):
+    buckets = TokenBuckets(max_keys=2)
+    buckets.take("a", rate=0.0, burst=1)
+    buckets.take("b", rate=0.0, burst=1)
+    assert buckets.take("a", rate=0.0, burst=1) == math.inf
+    # "b" is now least recently used and makes way for "c"
+    buckets.take("c", rate=0.0, burst=1)
+    assert buckets.take("b", rate=0.0, burst=1) == 0
+    assert buckets.take("c", rate=0.0, burst=1) == math.inf
+
+
+def test_cost_above_burst_waits_for_the_difference(clock):
+    buckets = TokenBuckets()
+    assert buckets.take("k", rate=2.0, burst=1, cost=3) == pytest.approx(1.0)
+
+
+def test_limiter_raises_with_retry_after(clock):
+    limiter = RateLimiter({"login_ip": "2/minute"})
+    limiter.check("login_ip", "1.2.3.4")
+    limiter.check("login_ip", "1.2.3.4")
+    with pytest.raises(RateLimited) as limited:
+        limiter.check("login_ip", "1.2.3.4")
+    assert (limited.value.scope, limited.value.retry_after) == ("login_ip", pytest.approx(30))
+    limiter.check("login_ip", "5.6.7.8")
+
+
+def test_limiter_admits_when_the_backend_fails():
+    class Broken:
+        def take(self, *args):
+            raise ConnectionError("store down")
+
+    RateLimiter({"login_ip": "1/minute"}, backend=Broken()).check("login_ip", "1.2.3.4")
+
+
+async def call(app, path="/api/x"):
+    """Run one HTTP request through an ASGI app; returns the messages it sent"""
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({"type": "http", "path": path}, receive, send)
+    return sent
+
+
+def status(messages):
+    return messages[0]["status"]
+
+
+@pytest.mark.anyio
+async def test_open_streams_do_not_count_toward_the_limit():
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        if scope["path"] == "/api/stream":
+            await release.wait()
+        await send({"type": "http.response.body", "body": b""})
+
+    shed = LoadShedMiddleware(app, max_in_flight=1)
+    streams = [asyncio.create_task(call(shed, "/api/stream")) for _ in range(3)]
+    await asyncio.sleep(0)
+
+    assert shed.in_flight == 0
+    assert status(await call(shed)) == 200
+    release.set()
+    assert [status(messages) for messages in await asyncio.gather(*streams)] == [200] * 3
+
+
+@pytest.mark.anyio
+async def test_requests_being_handled_are_shed():
+    started, release = asyncio.Event(), asyncio.Event()
+    shed_count = []
+
+    async def app(scope, receive, send):
+        started.set()
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    shed = LoadShedMiddleware(app, max_in_flight=1, on_shed=lambda: shed_count.append(1))
+    slow = asyncio.create_task(call(shed))
+    await started.wait()
+
+    assert status(await call(shed)) == 503
+    assert shed_count == [1]
+    release.set()
+    assert status(await slow) == 200
+    assert shed.in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_slot_is_released_when_the_handler_fails():
+    async def app(scope, receive, send):
+        raise RuntimeError("boom")
+
+    shed = LoadShedMiddleware(app, max_in_flight=1)
+    with pytest.raises(RuntimeError):
+        await call(shed)
+    assert shed.in_flight == 0
@@ -0,0 +1,45 @@
+"""The caller's own memberships must be visible right after they are written,
+even when listing reads go to a secondary that has not caught up."""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def replicate_courses(mongo):
+    """Course documents reach the secondary; membership edges do not"""
+    primary, secondary = mongo
+    await secondary.courses.insert_many(await primary.courses.find({}, {"_id": 0}).to_list(None))
+
+
+async def test_enrolled_flag_reads_the_primary(mongo, mongo_client, mongo_signup, mongo_create_course):
+    faculty, _ = await mongo_signup("faculty")
+    student, _ = await mongo_signup()
+    course_id = await mongo_create_course(faculty, "RW1")
+    await replicate_courses(mongo)
+
+    assert (await mongo_client.post(f"/courses/{course_id}/enroll", headers=student)).status_code == 200
+
+    courses = (await mongo_client.get("/courses", headers=student)).json()
+    assert [c["is_enrolled"] for c in courses if c["id"] == course_id] == [True]
+
+
+async def test_dashboard_counts_read_the_primary(mongo_client, mongo_signup):
+    headers, _ = await mongo_signup()
+    group = await mongo_client.post("/study-groups", headers=headers, json={"name": "g", "description": "d"})
+    assert group.status_code == 200, group.text
+
+    stats = (await mongo_client.get("/dashboard/stats", headers=headers)).json()
+    assert stats["study_groups"] == 1
+
+
+async def test_timetable_check_includes_fresh_enrolments(mongo_client, mongo_signup, mongo_create_course):
+    faculty, _ = await mongo_signup("faculty")
+    other_faculty, _ = await mongo_signup("faculty")
+    student, _ = await mongo_signup()
+    enrolled = await mongo_create_course(faculty, "RW2", [{"day": "Monday", "time": "10:00-12:00", "room": "A1"}])
+    proposed = await mongo_create_course(other_faculty, "RW3", [{"day": "Monday", "time": "11:00-12:00", "room": "B1"}])
+    assert (await mongo_client.post(f"/courses/{enrolled}/enroll", headers=student)).status_code == 200
+
+    response = await mongo_client.post("/timetable/check", headers=student, json={"course_ids": [proposed]})
+    assert response.status_code == 200
+    assert [sorted(clash["course_ids"]) for clash in response.json()["clashes"]] == [sorted([enrolled, proposed])]
@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+import pytest
+
+from realtime import Broker, Hub, InMemoryBroker, load_broker, parse_topics
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_publish_reaches_only_subscribers_of_the_topic():
+    hub = Hub()
+    await hub.start()
+    course = hub.subscribe({"course:c1"})
+    event = hub.subscribe({"event:e1"})
+
+    await hub.publish("course:c1", "attendance.checked_in", {"id": "a1"})
+
+    message = json.loads(await course.get())
+    assert (message["type"], message["topic"], message["data"]) == ("attendance.checked_in", "course:c1", {"id": "a1"})
+    assert event.queue.empty()
+    await hub.stop()
+
+
+async def test_slow_consumer_is_evicted_without_blocking_the_publisher():
+    hub = Hub(max_queue=2)
+    await hub.start()
+    slow = hub.subscribe({"event:e1"})
+
+    for i in range(3):
+        await hub.publish("event:e1", "event.registration", {"n": i})
+
+    assert slow.evicted
+    assert await slow.get() is None
+    assert hub.subscriber_count("event:e1") == 0
+    await hub.stop()
+
+
+async def test_unsubscribe_drops_empty_topics():
+    hub = Hub()
+    subscription = hub.subscribe({"course:c1", "event:e1"})
+    hub.unsubscribe(subscription)
+    assert hub.subscriber_count("course:c1") == hub.subscriber_count("event:e1") == 0
+
+
+def test_brokers_must_implement_the_transport():
+    class PublishOnly(Broker):
+        async def publish(self, topic, payload):
+            pass
+
+    with pytest.raises(TypeError):
+        PublishOnly()
+
+
+def test_load_broker_by_name():
+    assert isinstance(load_broker(""), InMemoryBroker)
+    assert isinstance(load_broker("realtime:InMemoryBroker"), InMemoryBroker)
+    with pytest.raises(ValueError):
+        load_broker("realtime.InMemoryBroker")
+    with pytest.raises(TypeError):
+        load_broker("realtime:Hub")
+
+
+@pytest.mark.parametrize("raw", ["", " , ", "course:", "grades:c1", ",".join(f"event:{i}" for i in range(51))])
+def test_parse_topics_rejects(raw):
+    with pytest.raises(ValueError):
+        parse_topics(raw)
+
+
+def test_parse_topics_strips_and_dedupes():
+    assert parse_topics(" course:c1, course:c1 ,event:e1") == {"course:c1", "event:e1"}
+
+
+async def test_course_topics_are_for_the_instructor_only(client, signup, create_course):
+    import server
+    from fastapi import HTTPException
+
+    _, instructor = await signup("faculty")
+    _, other_faculty = await signup("faculty")
+    student_headers, student = await signup()
+    course_id = await create_course({"Authorization": f"Bearer {instructor['access_token']}"})
+    assert (await client.post(f"/courses/{course_id}/enroll", headers=student_headers)).status_code == 200
+
+    _, topics = await server.open_subscription(instructor["access_token"], f"course:{course_id},event:e1")
+    assert topics == {f"course:{course_id}", "event:e1"}
+    for caller in (other_faculty, student):
+        with pytest.raises(HTTPException) as denied:
+            await server.open_subscription(caller["access_token"], f"course:{course_id}")
+        assert denied.value.status_code == 403
+    with pytest.raises(HTTPException) as unknown:
+        await server.open_subscription(instructor["access_token"], "course:missing")
+    assert unknown.value.status_code == 403
+
+    # Topics without personal data stay open to everyone signed in
+    await server.open_subscription(student["access_token"], "event:e1,study_group:g1")
+
+
+async def test_streams_notice_revoked_tokens(client, signup, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "REALTIME_AUTH_RECHECK_SECONDS", 0.01)
+    _, body = await signup()
+    claims, _ = await server.open_subscription(body["access_token"], "event:e1")
+    lapsed = asyncio.create_task(server.token_lapsed(claims))
+    await asyncio.sleep(0.05)
+    assert not lapsed.done()
+
+    server.revocations.revoke(claims["jti"], claims["exp"])
+    await asyncio.wait_for(lapsed, timeout=1)
+    assert not server.token_usable(claims)
+
+
+async def test_streams_notice_expired_tokens(client, signup):
+    import server
+
+    _, body = await signup()
+    claims, _ = await server.open_subscription(body["access_token"], "event:e1")
+    expired = {**claims, "exp": claims["iat"] - 1}
+    assert not server.token_usable(expired)
+    await asyncio.wait_for(server.token_lapsed(expired), timeout=1)
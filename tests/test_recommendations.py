@@ -0,0 +1,115 @@
+import asyncio
+import math
+
+import numpy as np
+import pytest
+
+from recommendations import GroupIndex, meeting_interval
+from timetable import parse_slot
+
+GROUPS = [
+    {"id": "g1", "course_id": "c1", "max_members": 4, "member_count": 2, "schedule": {"day": "Monday", "time": "10:00"}},
+    {"id": "g2", "course_id": "c2", "max_members": 2, "member_count": 2},
+    {"id": "g3", "max_members": 5, "member_count": 1},
+]
+MEMBERS = [("g1", "u1"), ("g1", "u2"), ("g2", "u3"), ("g2", "u4"), ("g3", "u1"), ("gone", "u1")]
+ENROLLMENTS = [("c1", "u1"), ("c3", "u1"), ("c3", "u2"), ("c2", "u3"), ("c1", "u4")]
+
+
+@pytest.fixture
+def index():
+    return GroupIndex(GROUPS, MEMBERS, ENROLLMENTS)
+
+
+def row(index, group):
+    start, end = index.indptr[group], index.indptr[group + 1]
+    return dict(zip((index.course_ids[c] for c in index.indices[start:end]), index.data[start:end].tolist()))
+
+
+def test_csr_rows(index):
+    assert index.course_ids == ["c1", "c2", "c3"]
+    assert index.indptr.tolist() == [0, 2, 4, 6]
+    half = 1 / math.sqrt(2)
+    # g1: its own course c1 counts fully (not 1 of 2 members), c3 is taken by both
+    assert row(index, 0) == pytest.approx({"c1": half, "c3": half})
+    # g2: own course c2 fully, c1 by one of two members, then L2-normalised
+    assert row(index, 1) == pytest.approx({"c1": 0.5 / math.sqrt(1.25), "c2": 1 / math.sqrt(1.25)})
+    # g3 has no course of its own; its only member takes c1 and c3
+    assert row(index, 2) == pytest.approx({"c1": half, "c3": half})
+
+
+def test_postings_are_the_transpose(index):
+    for course in range(len(index.course_ids)):
+        span = slice(index.posting_ptr[course], index.posting_ptr[course + 1])
+        for group, weight in zip(index.posting_groups[span], index.posting_data[span]):
+            assert row(index, group)[index.course_ids[course]] == pytest.approx(weight)
+    assert index.posting_ptr[-1] == len(index.indices)
+
+
+def test_course_scores_are_cosine_similarities(index):
+    scores = index.course_scores(["c1", "c3", "unknown"])
+    user = np.array([1, 0, 1]) / math.sqrt(2)
+    for group in range(len(index)):
+        profile = np.array([row(index, group).get(c, 0.0) for c in index.course_ids])
+        assert scores[group] == pytest.approx(float(profile @ user), abs=1e-6)
+    assert not index.course_scores(["unknown"]).any()
+
+
+def test_recommend_skips_full_excluded_and_unrelated_groups(index):
+    results = index.recommend(["c1"], [])
+    # g2 shares c1 but is full
+    assert [r["group"]["id"] for r in results] == ["g1", "g3"]
+    assert results[0]["shared_course_ids"] == ["c1"]
+    assert results[0]["free_spots"] == 0.5
+
+    assert [r["group"]["id"] for r in index.recommend(["c1"], [], exclude={"g1", "missing"})] == ["g3"]
+    assert index.recommend(["c2"], []) == []
+
+
+def test_schedule_fit(index):
+    clash = parse_slot({"day": "Monday", "time": "10:30-11:30"})
+    after = parse_slot({"day": "Monday", "time": "11:00-12:00"})
+    # g1 meets Monday 10:00 for an hour; g2 and g3 have no schedule
+    assert index.schedule_fit([clash]).tolist() == [0.0, 0.5, 0.5]
+    assert index.schedule_fit([after]).tolist() == [1.0, 0.5, 0.5]
+
+
+def test_meeting_interval():
+    assert meeting_interval({"day": "Tuesday", "time": "09:15"}) == (1440 + 555, 1440 + 615)
+    assert meeting_interval({"day": "Tuesday", "time": "09:00-10:30"}) == (1440 + 540, 1440 + 630)
+    for schedule in (None, {}, {"day": "Someday", "time": "09:00"}, {"day": "Monday", "time": "25:00"}):
+        assert meeting_interval(schedule) is None
+
+
+def test_empty_index():
+    index = GroupIndex([], [], [])
+    assert len(index) == 0
+    assert index.recommend(["c1"], []) == []
+
+
+@pytest.mark.anyio
+async def test_stale_index_is_served_while_rebuilding(monkeypatch):
+    import server
+
+    release = asyncio.Event()
+    builds = []
+
+    async def slow_build():
+        builds.append(1)
+        await release.wait()
+        monkeypatch.setattr(server, "group_index", "new")
+        monkeypatch.setattr(server, "group_index_built_at", server.time.monotonic())
+
+    monkeypatch.setattr(server, "build_group_index", slow_build)
+    monkeypatch.setattr(server, "group_index", "old")
+    monkeypatch.setattr(server, "group_index_built_at", server.time.monotonic() - server.RECOMMENDATION_TTL - 1)
+    monkeypatch.setattr(server, "group_index_refresh", None)
+
+    assert await server.get_group_index() == "old"
+    assert await server.get_group_index() == "old"
+    await asyncio.sleep(0)
+    assert len(builds) == 1
+
+    release.set()
+    await server.group_index_refresh
+    assert await server.get_group_index() == "new"
@@ -0,0 +1,124 @@
+import pytest
+
+from timetable import IntervalIndex, Slot, Timetable, _sweep_owned, describe, parse_schedule, parse_slot
+
+MONDAY, TUESDAY = 0, 24 * 60
+
+
+def slot(day, time, room="A1"):
+    return {"day": day, "time": time, "room": room}
+
+
+def test_parse_slot():
+    assert parse_slot(slot("Tue", " 9:05 - 10:30 ", " a1 ")) == Slot(TUESDAY + 545, TUESDAY + 630, "A1")
+    assert parse_slot({"day": "sunday", "time": "22:00-24:00"}).end == 7 * 24 * 60
+
+
+@pytest.mark.parametrize("entry", [
+    slot("Funday", "09:00-10:00"),
+    slot("", "09:00-10:00"),
+    slot("Mo", "09:00-10:00"),
+    slot("Monday", "9-10"),
+    slot("Monday", "10:00-09:00"),
+    slot("Monday", "10:00-10:00"),
+    slot("Monday", "09:60-10:00"),
+    slot("Monday", "23:00-24:30"),
+    {"day": "Monday"},
+])
+def test_parse_slot_rejects(entry):
+    with pytest.raises(ValueError):
+        parse_slot(entry)
+
+
+def test_describe_round_trips():
+    parsed = parse_slot(slot("Wednesday", "13:15-14:45"))
+    assert describe(parsed.start, parsed.end) == {"day": "Wednesday", "start": "13:15", "end": "14:45"}
+
+
+def test_interval_index_overlaps_are_half_open():
+    index = IntervalIndex()
+    index.add(600, 660, "a")
+    index.add(540, 600, "b")
+    index.add(660, 720, "c")
+
+    # Back-to-back neighbours share an endpoint but no minute
+    assert index.overlapping(600, 660) == [(600, 660, "a")]
+    assert sorted(owner for _, _, owner in index.overlapping(599, 661)) == ["a", "b", "c"]
+    assert index.overlapping(720, 780) == []
+
+
+def test_interval_index_finds_long_intervals_starting_early():
+    index = IntervalIndex()
+    index.add(0, 1000, "long")
+    for start in range(100, 900, 60):
+        index.add(start, start + 30, f"short{start}")
+    assert (0, 1000, "long") in index.overlapping(950, 960)
+
+
+def test_interval_index_remove_owner():
+    index = IntervalIndex()
+    index.add(600, 660, "a")
+    index.add(900, 960, "a")
+    index.add(620, 680, "b")
+    index.remove_owner("a")
+    assert len(index) == 1
+    assert index.overlapping(0, 2000) == [(620, 680, "b")]
+    index.remove_owner("missing")
+    assert len(index) == 1
+
+
+def test_sweep_owned_reports_each_overlap_once():
+    slots = [
+        (parse_slot(slot("Monday", "09:00-11:00")), "a"),
+        (parse_slot(slot("Monday", "10:00-12:00")), "b"),
+        (parse_slot(slot("Monday", "11:00-12:00")), "c"),
+        (parse_slot(slot("Tuesday", "10:00-11:00")), "d"),
+    ]
+    found = [(first[1], second[1], start, end) for first, second, start, end in _sweep_owned(slots)]
+    # a/c only touch at 11:00; b/c overlap for the whole of c
+    assert found == [("a", "b", 600, 660), ("b", "c", 660, 720)]
+
+
+def test_conflicts_by_room_and_instructor():
+    table = Timetable()
+    table.add_course({"id": "c1", "code": "C1", "instructor_id": "t1", "schedule": [slot("Monday", "09:00-10:00", "R1")]})
+
+    after = parse_schedule([slot("Monday", "10:00-11:00", "R1")])
+    assert table.conflicts(after, "t1") == []
+
+    same_room = table.conflicts(parse_schedule([slot("Monday", "09:30-10:30", "r1")]), "t2")
+    assert [(c["kind"], c["course_id"], c["start"], c["end"]) for c in same_room] == [("room", "c1", "09:30", "10:00")]
+
+    same_teacher = table.conflicts(parse_schedule([slot("Monday", "09:00-09:30", "R2")]), "t1")
+    assert [c["kind"] for c in same_teacher] == ["instructor"]
+
+    own_overlap = table.conflicts(parse_schedule([slot("Friday", "09:00-10:00", "R3"), slot("Friday", "09:30-11:00", "R4")]), "t3")
+    assert [c["kind"] for c in own_overlap] == ["schedule"]
+
+
+def test_remove_course_frees_its_slots():
+    table = Timetable()
+    table.add_course({"id": "c1", "code": "C1", "instructor_id": "t1", "schedule": [slot("Monday", "09:00-10:00", "R1")]})
+    table.remove_course("c1")
+    assert table.conflicts(parse_schedule([slot("Monday", "09:00-10:00", "R1")]), "t1") == []
+    assert table.taught_by("t1") == []
+    table.remove_course("c1")
+
+
+def test_stored_courses_keep_their_valid_slots():
+    table = Timetable()
+    table.add_course({"id": "c1", "code": "C1", "schedule": [slot("Monday", "25:00-26:00"), slot("Monday", "09:00-10:00")]})
+    assert [entry["start"] for entry in table.weekly(["c1"])] == ["09:00"]
+
+
+def test_clashes_between_courses_only():
+    table = Timetable()
+    table.add_course({"id": "c1", "code": "C1", "schedule": [slot("Monday", "09:00-11:00", "R1"), slot("Monday", "10:00-10:30", "R2")]})
+    table.add_course({"id": "c2", "code": "C2", "schedule": [slot("Monday", "10:30-12:00", "R3")]})
+    table.add_course({"id": "c3", "code": "C3", "schedule": [slot("Monday", "11:00-12:00", "R4")]})
+
+    clashes = table.clashes(["c1", "c2", "c3", "c1", "unknown"])
+    assert [(c["course_ids"], c["start"], c["end"]) for c in clashes] == [
+        (["c1", "c2"], "10:30", "11:00"),
+        (["c2", "c3"], "11:00", "12:00"),
+    ]